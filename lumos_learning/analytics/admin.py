@@ -0,0 +1,16 @@
+from django.contrib import admin
+from .models import Rollup, Watermark
+
+
+@admin.register(Rollup)
+class RollupAdmin(admin.ModelAdmin):
+    list_display = ('course', 'period', 'bucket', 'revenue', 'refunds', 'enrollments', 'completions', 'watch_seconds')
+    list_filter = ('period',)
+    list_select_related = ('course',)
+    search_fields = ('course__title', 'instructor__username')
+    date_hierarchy = 'bucket'
+
+
+@admin.register(Watermark)
+class WatermarkAdmin(admin.ModelAdmin):
+    list_display = ('source', 'position')
\ No newline at end of file
@@ -0,0 +1,11 @@
+from django.urls import path, re_path
+from . import views
+
+urlpatterns = [
+    path('instructor/', views.InstructorAnalyticsView.as_view(), name='instructor_analytics'),
+    re_path(
+        r'^exports/(?P<name>payments|roster|progress)\.(?P<fmt>csv|jsonl)(?P<gz>\.gz)?$',
+        views.ExportView.as_view(),
+        name='analytics_export',
+    ),
+]
\ No newline at end of file
@@ -0,0 +1,183 @@
+"""
+Streaming bulk exports: payments for finance, per-course rosters and
+per-material progress.
+
+Each export is a flat values() queryset walked with
+iterator(chunk_size=EXPORT_CHUNK_SIZE), which reads through a server-side
+cursor on PostgreSQL. stream() encodes rows as CSV or JSON Lines, gzipped
+on request, and yields about EXPORT_BUFFER_BYTES at a time, so memory
+stays flat however many rows there are. The same generator feeds
+ExportView, a StreamingHttpResponse, and manage.py export_data.
+"""
+import csv
+import zlib
+from datetime import date, datetime
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import CharField, F, Q, Sum, Value
+from django.db.models.functions import Coalesce, Concat
+
+from courses.models import Enrollment, Progress
+from payments.models import Payment
+
+FORMATS = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+
+def _payments(start, end, instructor_id, course_id):
+    queryset = Payment.objects.all()
+    if start:
+        queryset = queryset.filter(created_at__gte=start)
+    if end:
+        queryset = queryset.filter(created_at__lt=end)
+    if instructor_id:
+        queryset = queryset.filter(
+            Q(course__instructor_id=instructor_id) | Q(material__course__instructor_id=instructor_id)
+        )
+    if course_id:
+        queryset = queryset.filter(Q(course_id=course_id) | Q(material__course_id=course_id))
+    return queryset.order_by('created_at', 'id').values(
+        'id', 'created_at', 'completed_at', 'status', 'payment_method', 'amount', 'currency',
+        'paypal_payment_id',
+        username=F('user__username'),
+        email=F('user__email'),
+        course_title=Coalesce('course__title', 'material__course__title'),
+        material_title=F('material__title'),
+        item_name=Coalesce(
+            'course__title',
+            Concat('material__course__title', Value(' - '), 'material__title', output_field=CharField()),
+        ),
+    )
+
+
+def _enrollment_filters(prefix, start, end, instructor_id, course_id):
+    filters = {}
+    if start:
+        filters[f'{prefix}enrolled_at__gte'] = start
+    if end:
+        filters[f'{prefix}enrolled_at__lt'] = end
+    if instructor_id:
+        filters[f'{prefix}course__instructor_id'] = instructor_id
+    if course_id:
+        filters[f'{prefix}course_id'] = course_id
+    return filters
+
+
+def _roster(start, end, instructor_id, course_id):
+    return (
+        Enrollment.objects.filter(**_enrollment_filters('', start, end, instructor_id, course_id))
+        .order_by('course_id', 'id')
+        .values(
+            'course_id', 'enrolled_at', 'is_active', 'progress_percentage', 'completed_materials',
+            'completed_at',
+            course_title=F('course__title'),
+            username=F('student__username'),
+            email=F('student__email'),
+            first_name=F('student__first_name'),
+            last_name=F('student__last_name'),
+            time_spent_seconds=Coalesce(Sum('progress__time_spent_seconds'), 0),
+        )
+    )
+
+
+def _progress(start, end, instructor_id, course_id):
+    return (
+        Progress.objects.filter(**_enrollment_filters('enrollment__', start, end, instructor_id, course_id))
+        .order_by('enrollment__course_id', 'enrollment_id', 'id')
+        .values(
+            'enrollment_id', 'material_id', 'is_completed', 'completed_at', 'time_spent_seconds',
+            'last_position',
+            course_id=F('enrollment__course_id'),
+            course_title=F('enrollment__course__title'),
+            username=F('enrollment__student__username'),
+            material_title=F('material__title'),
+            material_type=F('material__material_type'),
+        )
+    )
+
+
+# name: (queryset(start, end, instructor_id, course_id), columns)
+EXPORTS = {
+    'payments': (_payments, (
+        'id', 'created_at', 'completed_at', 'username', 'email', 'item_name', 'course_title',
+        'material_title', 'amount', 'currency', 'payment_method', 'status', 'paypal_payment_id',
+    )),
+    'roster': (_roster, (
+        'course_id', 'course_title', 'username', 'email', 'first_name', 'last_name', 'enrolled_at',
+        'is_active', 'progress_percentage', 'completed_materials', 'completed_at', 'time_spent_seconds',
+    )),
+    'progress': (_progress, (
+        'course_id', 'course_title', 'enrollment_id', 'username', 'material_id', 'material_title',
+        'material_type', 'is_completed', 'completed_at', 'time_spent_seconds', 'last_position',
+    )),
+}
+
+
+def filename(name, fmt, compress=False):
+    return f'{name}.{fmt}' + ('.gz' if compress else '')
+
+
+class _Echo:
+    """File-like object for csv.writer that hands back each line"""
+
+    def write(self, value):
+        return value
+
+
+def _csv_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return '' if value is None else value
+
+
+def _lines(fmt, columns, rows):
+    if fmt == 'csv':
+        writer = csv.writer(_Echo())
+        yield writer.writerow(columns)
+        for row in rows:
+            yield writer.writerow([_csv_value(row[column]) for column in columns])
+    else:
+        encoder = DjangoJSONEncoder(separators=(',', ':'))
+        for row in rows:
+            yield encoder.encode({column: row[column] for column in columns}) + '\n'
+
+
+def _buffered(lines):
+    """Encoded chunks of about EXPORT_BUFFER_BYTES"""
+    buffer, size = [], 0
+    for line in lines:
+        buffer.append(line)
+        size += len(line)
+        if size >= settings.EXPORT_BUFFER_BYTES:
+            yield ''.join(buffer).encode()
+            buffer, size = [], 0
+    if buffer:
+        yield ''.join(buffer).encode()
+
+
+def _gzipped(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream(name, fmt='csv', compress=False, start=None, end=None, instructor_id=None, course_id=None):
+    """Bytes of an export, chunk by chunk"""
+    get_queryset, columns = EXPORTS[name]
+    rows = get_queryset(start, end, instructor_id, course_id).iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+    chunks = _buffered(_lines(fmt, columns, rows))
+    return _gzipped(chunks) if compress else chunks
+
+
+async def aiter_chunks(chunks):
+    """
+    Serve a sync generator to an ASGI server chunk by chunk. Django would
+    otherwise read a sync streaming body into memory under ASGI.
+    """
+    next_chunk = sync_to_async(next)
+    while (chunk := await next_chunk(chunks, None)) is not None:
+        yield chunk
\ No newline at end of file
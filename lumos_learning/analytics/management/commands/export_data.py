@@ -0,0 +1,62 @@
+import sys
+import time
+from datetime import datetime, time as dt_time, timezone as dt_timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from analytics import exports
+
+
+def _moment(value):
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f'Expected an ISO date or datetime, got {value!r}')
+        moment = datetime.combine(day, dt_time())
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment, dt_timezone.utc)
+    return moment
+
+
+class Command(BaseCommand):
+    help = 'Stream payments, course rosters or progress to CSV or JSON Lines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', choices=sorted(exports.EXPORTS))
+        parser.add_argument('--format', choices=sorted(exports.FORMATS), default='csv')
+        parser.add_argument('--gzip', action='store_true', help='Compress the output')
+        parser.add_argument('--output', '-o', help='File to write (default: stdout)')
+        parser.add_argument('--start', type=_moment, help='From this date (inclusive)')
+        parser.add_argument('--end', type=_moment, help='Until this date (exclusive)')
+        parser.add_argument('--instructor', type=int, help="Only this instructor's courses")
+        parser.add_argument('--course', type=int, help='Only this course')
+
+    def handle(self, *args, **options):
+        chunks = exports.stream(
+            options['name'],
+            options['format'],
+            options['gzip'],
+            start=options['start'],
+            end=options['end'],
+            instructor_id=options['instructor'],
+            course_id=options['course'],
+        )
+
+        started = time.monotonic()
+        size = 0
+        output = open(options['output'], 'wb') if options['output'] else sys.stdout.buffer
+        try:
+            for chunk in chunks:
+                output.write(chunk)
+                size += len(chunk)
+        finally:
+            if options['output']:
+                output.close()
+
+        if options['output']:
+            self.stdout.write(self.style.SUCCESS(
+                f"Wrote {size} bytes to {options['output']} in {time.monotonic() - started:.1f}s"
+            ))
\ No newline at end of file
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from analytics import rollups
+
+
+class Command(BaseCommand):
+    help = 'Fold new payments, refunds, enrollments and completions into the analytics rollups'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Recount everything from the beginning (watch time is kept)')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            rollups.reset()
+
+        processed = rollups.rollup()
+        for source, groups in processed.items():
+            self.stdout.write(f'{source}: {groups} course-hours')
+        self.stdout.write(self.style.SUCCESS('Analytics rollups are up to date'))
\ No newline at end of file
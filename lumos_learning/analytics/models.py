@@ -0,0 +1,38 @@
+from django.db import models
+from django.conf import settings
+from courses.models import Course
+
+
+class Rollup(models.Model):
+    """Per-course totals for one hour or one day (UTC), see analytics.rollups"""
+    PERIOD_CHOICES = [
+        ('hour', 'Hour'),
+        ('day', 'Day'),
+    ]
+
+    period = models.CharField(max_length=4, choices=PERIOD_CHOICES)
+    bucket = models.DateTimeField(help_text='Start of the hour or day')
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='rollups')
+    # Copied from the course so instructor reports don't need the join
+    instructor = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='rollups')
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    refunds = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    enrollments = models.PositiveIntegerField(default=0)
+    completions = models.PositiveIntegerField(default=0)
+    watch_seconds = models.BigIntegerField(default=0)
+
+    class Meta:
+        unique_together = ['course', 'period', 'bucket']
+        indexes = [models.Index(fields=['instructor', 'period', 'bucket'])]
+
+    def __str__(self):
+        return f"{self.course_id} {self.period} {self.bucket:%Y-%m-%d %H:00}"
+
+
+class Watermark(models.Model):
+    """How far a rollup source has been processed"""
+    source = models.CharField(max_length=50, unique=True)
+    position = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.source} @ {self.position}"
\ No newline at end of file
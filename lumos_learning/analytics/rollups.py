@@ -0,0 +1,268 @@
+"""
+Hourly and daily rollups of revenue, refunds, enrollments, completions and
+watch time per course.
+
+Facts stay in their own tables. rollup() reads each source only past its
+watermark, groups the new rows by course and hour, and adds them to the
+hour and day Rollup rows in the same transaction that advances the
+watermark. Watch time has no fact table, so courses.ingest reports it as
+heartbeats are written (see analytics.signals). Reports sum buckets, so a
+date range reads at most a few hundred rows per course whatever the size
+of the fact tables.
+
+Payments and refunds settled before their completed_at/processed_at were
+recorded get them filled in when a source is first rolled up (or after
+reset()).
+
+Buckets are UTC. Sources are read up to ANALYTICS_ROLLUP_LAG seconds ago
+so rows whose transactions commit shortly after their timestamp are not
+skipped. Rollups count events: a refunded payment stays in revenue for
+the hour it completed and shows up again under refunds.
+"""
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, F, Min, Sum
+from django.db.models.functions import Coalesce, Trunc, TruncHour
+from django.utils import timezone
+
+from core import versions
+from courses.models import Course, Enrollment, Material
+from payments.models import Payment, Refund
+
+from .models import Rollup, Watermark
+
+# Version key bumped whenever rollups change (see core.conditional)
+VERSION_KEY = 'analytics'
+
+METRICS = ('revenue', 'refunds', 'enrollments', 'completions', 'watch_seconds')
+GRANULARITIES = ('hour', 'day', 'week', 'month')
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+UPSERT_CHUNK = 500
+
+
+def _payments():
+    return Payment.objects.annotate(course_key=Coalesce('course_id', 'material__course_id'))
+
+
+def _refunds():
+    return Refund.objects.filter(status='processed').annotate(
+        course_key=Coalesce('payment__course_id', 'payment__material__course_id')
+    )
+
+
+def _enrollments():
+    return Enrollment.objects.annotate(course_key=F('course_id'))
+
+
+# source: (queryset, timestamp field, metric, aggregate)
+SOURCES = {
+    'payments': (_payments, 'completed_at', 'revenue', Sum('amount')),
+    'refunds': (_refunds, 'processed_at', 'refunds', Sum('refund_amount')),
+    'enrollments': (_enrollments, 'enrolled_at', 'enrollments', Count('id')),
+    'completions': (_enrollments, 'completed_at', 'completions', Count('id')),
+}
+
+
+def _backfill_payments():
+    # Payments completed before completed_at was recorded
+    Payment.objects.filter(status__in=('completed', 'refunded'), completed_at__isnull=True).update(
+        completed_at=F('updated_at')
+    )
+
+
+def _backfill_refunds():
+    # Refunds have no updated_at; the request date is the closest there is
+    Refund.objects.filter(status='processed', processed_at__isnull=True).update(processed_at=F('created_at'))
+
+
+# source: fills in timestamps missing on old rows, before the first rollup
+BACKFILLS = {
+    'payments': _backfill_payments,
+    'refunds': _backfill_refunds,
+}
+
+
+def floor_hour(value):
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def _upsert(rows):
+    """
+    Add [(period, bucket, course_id, instructor_id, *METRICS)] to existing
+    rollups, creating missing ones, in one statement.
+    """
+    table = connection.ops.quote_name(Rollup._meta.db_table)
+    columns = ('period', 'bucket', 'course_id', 'instructor_id', *METRICS)
+    placeholders = '(' + ', '.join(['%s'] * len(columns)) + ')'
+    updates = ', '.join(f'{metric} = {table}.{metric} + EXCLUDED.{metric}' for metric in METRICS)
+    sql = f"""
+        INSERT INTO {table} ({', '.join(columns)})
+        VALUES {', '.join([placeholders] * len(rows))}
+        ON CONFLICT (course_id, period, bucket) DO UPDATE SET {updates}
+    """
+    params = []
+    for period, bucket, course_id, instructor_id, revenue, refunds, *counts in rows:
+        params += [
+            period,
+            connection.ops.adapt_datetimefield_value(bucket),
+            course_id,
+            instructor_id,
+            connection.ops.adapt_decimalfield_value(Decimal(revenue), 12, 2),
+            connection.ops.adapt_decimalfield_value(Decimal(refunds), 12, 2),
+            *counts,
+        ]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def add(deltas):
+    """Add {(course_id, hour): {metric: value}} to the hour and day rollups"""
+    if not deltas:
+        return
+    instructors = dict(
+        Course.objects.filter(id__in={course_id for course_id, _ in deltas})
+        .values_list('id', 'instructor_id')
+    )
+    buckets = defaultdict(Counter)
+    for (course_id, hour), values in deltas.items():
+        if course_id not in instructors:
+            # Deleted course, or a payment for nothing
+            continue
+        buckets['hour', hour, course_id].update(values)
+        buckets['day', hour.replace(hour=0), course_id].update(values)
+
+    # In key order, so concurrent writers lock rows in the same order
+    rows = [
+        (period, bucket, course_id, instructors[course_id], *(values.get(metric, 0) for metric in METRICS))
+        for (period, bucket, course_id), values in sorted(buckets.items())
+    ]
+    for start in range(0, len(rows), UPSERT_CHUNK):
+        _upsert(rows[start:start + UPSERT_CHUNK])
+
+
+def _collect(source, low, high):
+    get_queryset, field, metric, aggregate = SOURCES[source]
+    rows = (
+        get_queryset()
+        .filter(**{f'{field}__gt': low, f'{field}__lte': high})
+        .annotate(hour=TruncHour(field))
+        .values_list('hour', 'course_key')
+        .annotate(total=aggregate)
+        .order_by()
+    )
+    return {(course_id, hour): {metric: total} for hour, course_id, total in rows}
+
+
+def rollup(now=None):
+    """
+    Fold rows added to every source since its watermark into the rollups.
+    Returns {source: number of (course, hour) groups added}.
+    """
+    high = (now or timezone.now()) - timedelta(seconds=settings.ANALYTICS_ROLLUP_LAG)
+    processed = {}
+    for source in SOURCES:
+        with transaction.atomic():
+            # The row lock keeps concurrent runs from adding the same rows twice
+            watermark, created = Watermark.objects.select_for_update().get_or_create(
+                source=source, defaults={'position': EPOCH}
+            )
+            if created and source in BACKFILLS:
+                BACKFILLS[source]()
+            if watermark.position >= high:
+                continue
+            deltas = _collect(source, watermark.position, high)
+            add(deltas)
+            watermark.position = high
+            watermark.save(update_fields=['position'])
+        processed[source] = len(deltas)
+    if any(processed.values()):
+        versions.bump(VERSION_KEY)
+    return processed
+
+
+def reset():
+    """Forget every fact-derived total so the next rollup() recounts them"""
+    with transaction.atomic():
+        Watermark.objects.all().delete()
+        # Watch time cannot be recounted, keep it
+        Rollup.objects.update(revenue=0, refunds=0, enrollments=0, completions=0)
+        Rollup.objects.filter(watch_seconds=0).delete()
+        versions.bump(VERSION_KEY)
+
+
+def record_watch_time(rows):
+    """Add [(material_id, seconds)] to the current hour"""
+    seconds = Counter()
+    for material_id, value in rows:
+        seconds[material_id] += value
+    courses = dict(
+        Material.objects.filter(id__in=[material_id for material_id, value in seconds.items() if value])
+        .values_list('id', 'course_id')
+    )
+    hour = floor_hour(timezone.now())
+    deltas = defaultdict(Counter)
+    for material_id, course_id in courses.items():
+        deltas[course_id, hour]['watch_seconds'] += seconds[material_id]
+    if deltas:
+        add(deltas)
+        versions.bump(VERSION_KEY)
+
+
+def _parts(start, end, granularity):
+    """[(period, start, end)] covering start..end with as many day buckets as possible"""
+    if granularity == 'hour':
+        return [('hour', start, end)]
+    first_day = start if start.hour == 0 else start.replace(hour=0) + timedelta(days=1)
+    last_day = end.replace(hour=0)
+    if first_day >= last_day:
+        return [('hour', start, end)]
+    parts = [('day', first_day, last_day)]
+    if start < first_day:
+        parts.append(('hour', start, first_day))
+    if last_day < end:
+        parts.append(('hour', last_day, end))
+    return parts
+
+
+def report(start, end, granularity='day', instructor_id=None, course_ids=None):
+    """
+    Totals and a series at the given granularity for start..end (floored to
+    whole hours, end exclusive), from rollups only.
+    """
+    start, end = floor_hour(start), floor_hour(end)
+    rollups = Rollup.objects.all()
+    if instructor_id is not None:
+        rollups = rollups.filter(instructor_id=instructor_id)
+    if course_ids is not None:
+        rollups = rollups.filter(course_id__in=course_ids)
+
+    series = defaultdict(Counter)
+    for period, low, high in _parts(start, end, granularity):
+        rows = (
+            rollups.filter(period=period, bucket__gte=low, bucket__lt=high)
+            .annotate(key=Trunc('bucket', granularity))
+            .values('key')
+            .annotate(**{metric: Sum(metric) for metric in METRICS})
+            .order_by()
+        )
+        for row in rows:
+            series[row.pop('key')].update(row)
+
+    totals = Counter()
+    for values in series.values():
+        totals.update(values)
+    return {
+        'start': start,
+        'end': end,
+        'granularity': granularity,
+        'through': Watermark.objects.aggregate(position=Min('position'))['position'],
+        'totals': {metric: totals.get(metric, 0) for metric in METRICS},
+        'series': [
+            {'bucket': key, **{metric: values.get(metric, 0) for metric in METRICS}}
+            for key, values in sorted(series.items())
+        ],
+    }
\ No newline at end of file
@@ -0,0 +1,10 @@
+from django.dispatch import receiver
+
+from courses.ingest import watch_time_written
+
+from . import rollups
+
+
+@receiver(watch_time_written)
+def watch_time_recorded(sender, rows, **kwargs):
+    rollups.record_watch_time(rows)
\ No newline at end of file
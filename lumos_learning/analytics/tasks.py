@@ -0,0 +1,9 @@
+from celery import shared_task
+
+from . import rollups
+
+
+@shared_task(ignore_result=True)
+def rollup_analytics():
+    """Fold new payments, refunds, enrollments and completions into the rollups"""
+    return rollups.rollup()
\ No newline at end of file
@@ -0,0 +1,142 @@
+import csv
+import gzip
+import io
+import json
+from datetime import timedelta
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.test import TestCase
+from django.utils import timezone
+
+from core.models import User
+from courses.models import Category, Course, Enrollment, Material
+from payments.models import Payment
+
+from . import rollups
+from .models import Rollup
+
+
+class AnalyticsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = User.objects.create_user('teacher', role='teacher', is_teacher_approved=True)
+        cls.admin = User.objects.create_user('admin', role='admin')
+        cls.student = User.objects.create_user('student', role='student')
+        category = Category.objects.create(name='Programming', slug='programming')
+        cls.course = Course.objects.create(
+            title='Python', slug='python', description='Python', category=category,
+            instructor=cls.teacher, difficulty='beginner', is_published=True, price=10,
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def later(self):
+        # Past the rollup lag
+        return timezone.now() + timedelta(hours=1)
+
+
+class RollupTests(AnalyticsTestCase):
+    def test_rollup_counts_each_row_once(self):
+        Payment.objects.create(
+            user=self.student, course=self.course, amount='10.00', payment_method='paypal', status='completed'
+        )
+        Enrollment.objects.create(student=self.student, course=self.course)
+
+        rollups.rollup(self.later())
+        rollups.rollup(self.later() + timedelta(minutes=5))
+        report = rollups.report(timezone.now() - timedelta(days=1), self.later())
+        self.assertEqual(report['totals']['revenue'], Decimal('10.00'))
+        self.assertEqual(report['totals']['enrollments'], 1)
+
+    def test_payments_without_completed_at_are_backfilled(self):
+        payment = Payment.objects.create(
+            user=self.student, course=self.course, amount='10.00', payment_method='paypal', status='completed'
+        )
+        Payment.objects.filter(pk=payment.pk).update(completed_at=None)
+
+        rollups.rollup(self.later())
+        payment.refresh_from_db()
+        self.assertEqual(payment.completed_at, payment.updated_at)
+        report = rollups.report(timezone.now() - timedelta(days=1), self.later())
+        self.assertEqual(report['totals']['revenue'], Decimal('10.00'))
+
+    def test_watch_time_goes_to_the_current_hour(self):
+        material = Material.objects.create(course=self.course, title='Intro', material_type='video', file='intro.mp4')
+        rollups.record_watch_time([(material.id, 30), (material.id, 15)])
+
+        self.assertEqual(
+            set(Rollup.objects.values_list('period', 'watch_seconds')), {('hour', 45), ('day', 45)}
+        )
+
+
+class InstructorAnalyticsViewTests(AnalyticsTestCase):
+    url = '/api/analytics/instructor/'
+
+    def test_students_are_refused(self):
+        self.client.force_login(self.student)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+    def test_ids_must_be_numeric(self):
+        self.client.force_login(self.admin)
+        self.assertEqual(self.client.get(self.url, {'course': 'abc'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'instructor': 'abc'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'instructor': self.teacher.id}).status_code, 200)
+
+    def test_report_for_a_course(self):
+        self.client.force_login(self.teacher)
+        response = self.client.get(self.url, {'course': self.course.id, 'granularity': 'hour'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['granularity'], 'hour')
+
+
+class ExportViewTests(AnalyticsTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other_teacher = User.objects.create_user('other', role='teacher', is_teacher_approved=True)
+        other_course = Course.objects.create(
+            title='Go', slug='go', description='Go', category=cls.course.category,
+            instructor=cls.other_teacher, difficulty='beginner', is_published=True,
+        )
+        Enrollment.objects.create(student=cls.student, course=cls.course)
+        Enrollment.objects.create(student=cls.student, course=other_course)
+        Payment.objects.create(
+            user=cls.student, course=cls.course, amount='10.00', payment_method='paypal', status='completed'
+        )
+
+    def content(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_roster_covers_own_courses(self):
+        self.client.force_login(self.teacher)
+        response = self.client.get('/api/analytics/exports/roster.csv')
+        self.assertEqual(response.status_code, 200)
+        rows = list(csv.DictReader(io.StringIO(self.content(response).decode())))
+        self.assertEqual([(row['course_title'], row['username']) for row in rows], [('Python', 'student')])
+
+    def test_gzipped_json_lines(self):
+        self.client.force_login(self.admin)
+        response = self.client.get('/api/analytics/exports/payments.jsonl.gz')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        rows = [json.loads(line) for line in gzip.decompress(self.content(response)).splitlines()]
+        self.assertEqual([(row['item_name'], row['amount']) for row in rows], [('Python', '10.00')])
+
+    def test_payments_are_for_admins(self):
+        self.client.force_login(self.teacher)
+        self.assertEqual(self.client.get('/api/analytics/exports/payments.csv').status_code, 403)
+
+    def test_ids_must_be_numeric(self):
+        self.client.force_login(self.admin)
+        self.assertEqual(self.client.get('/api/analytics/exports/roster.csv', {'instructor': 'abc'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/analytics/exports/roster.csv', {'course': 'abc'}).status_code, 400)
+
+    async def test_asgi_streams_asynchronously(self):
+        await sync_to_async(self.client.force_login)(self.teacher)
+        self.async_client.cookies = self.client.cookies
+        response = await self.async_client.get('/api/analytics/exports/roster.csv')
+        self.assertTrue(response.is_async)
+        content = b''.join([chunk async for chunk in response])
+        self.assertIn(b'Python', content)
\ No newline at end of file
@@ -0,0 +1,143 @@
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import PermissionDenied, ValidationError
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from core.conditional import ConditionalMixin
+from courses import catalog
+from courses.models import Course
+
+from . import exports, rollups
+
+DEFAULT_DAYS = 30
+# Longest range served from hourly buckets
+MAX_HOURLY_DAYS = 31
+
+
+def _parse_moment(value, name):
+    """An ISO date (midnight UTC) or datetime"""
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValidationError({name: 'Expected an ISO date or datetime.'})
+        moment = datetime.combine(day, time())
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment, dt_timezone.utc)
+    return moment
+
+
+def _parse_id(value, name):
+    if not value.isdigit():
+        raise ValidationError({name: 'Expected a numeric id.'})
+    return int(value)
+
+
+class InstructorAnalyticsView(ConditionalMixin, APIView):
+    """
+    Revenue, refunds, enrollments, completions and watch time for the
+    signed-in instructor's courses, summed from analytics rollups.
+
+    GET ?start=2024-01-01&end=2024-02-01&granularity=day&course=12
+    Admins may pass instructor=<id>.
+    """
+
+    def get_etag_keys(self, request):
+        user = request.user
+        if user.role != 'teacher' and not user.is_admin:
+            return None
+        return [rollups.VERSION_KEY, catalog.VERSION_KEY]
+
+    def get_etag_parts(self, request):
+        # Default ranges end with the current hour
+        return [rollups.floor_hour(timezone.now()).isoformat()]
+
+    def get(self, request):
+        user = request.user
+        if user.role != 'teacher' and not user.is_admin:
+            raise PermissionDenied('Only instructors have analytics.')
+
+        params = request.query_params
+        instructor_id = user.id
+        if user.is_admin and params.get('instructor'):
+            instructor_id = _parse_id(params['instructor'], 'instructor')
+
+        granularity = params.get('granularity', 'day')
+        if granularity not in rollups.GRANULARITIES:
+            raise ValidationError({'granularity': f'One of {", ".join(rollups.GRANULARITIES)}.'})
+
+        now = timezone.now()
+        end = _parse_moment(params['end'], 'end') if params.get('end') else rollups.floor_hour(now) + timedelta(hours=1)
+        start = _parse_moment(params['start'], 'start') if params.get('start') else end - timedelta(days=DEFAULT_DAYS)
+        if start >= end:
+            raise ValidationError({'start': 'Must be before end.'})
+        if granularity == 'hour' and end - start > timedelta(days=MAX_HOURLY_DAYS):
+            raise ValidationError({'granularity': f'Hourly data covers at most {MAX_HOURLY_DAYS} days.'})
+
+        course_ids = None
+        if params.get('course'):
+            course_id = _parse_id(params['course'], 'course')
+            course = Course.objects.filter(id=course_id, instructor_id=instructor_id).first()
+            if course is None:
+                raise ValidationError({'course': 'Not one of this instructor\'s courses.'})
+            course_ids = [course.id]
+
+        return Response(rollups.report(
+            start, end, granularity, instructor_id=instructor_id, course_ids=course_ids,
+        ))
+
+
+class ExportView(APIView):
+    """
+    Stream an export as CSV or JSON Lines, optionally gzipped, e.g.
+    GET /api/analytics/exports/roster.csv.gz?course=12&start=2024-01-01
+
+    Payments are for admins. Rosters and progress cover the signed-in
+    instructor's courses; admins see every course or pass instructor=<id>.
+    start/end filter payments by creation and rosters and progress by
+    enrollment date.
+    """
+
+    def perform_content_negotiation(self, request, force=False):
+        # The export isn't rendered by REST framework; errors are JSON
+        # whatever the client accepts
+        return super().perform_content_negotiation(request, force=True)
+
+    def get(self, request, name, fmt, gz=None):
+        user = request.user
+        params = request.query_params
+        if name == 'payments' and not user.is_admin:
+            raise PermissionDenied('Only admins can export payments.')
+        if user.is_admin:
+            instructor_id = _parse_id(params['instructor'], 'instructor') if params.get('instructor') else None
+        elif user.role == 'teacher':
+            instructor_id = user.id
+        else:
+            raise PermissionDenied('Only instructors can export rosters.')
+
+        start = _parse_moment(params['start'], 'start') if params.get('start') else None
+        end = _parse_moment(params['end'], 'end') if params.get('end') else None
+        course_id = _parse_id(params['course'], 'course') if params.get('course') else None
+        if course_id:
+            courses = Course.objects.filter(id=course_id)
+            if instructor_id:
+                courses = courses.filter(instructor_id=instructor_id)
+            if not courses.exists():
+                raise ValidationError({'course': 'Not one of this instructor\'s courses.'})
+
+        compress = bool(gz)
+        chunks = exports.stream(
+            name, fmt, compress, start=start, end=end, instructor_id=instructor_id, course_id=course_id,
+        )
+        if isinstance(request._request, ASGIRequest):
+            chunks = exports.aiter_chunks(chunks)
+        response = StreamingHttpResponse(
+            chunks, content_type='application/gzip' if compress else exports.FORMATS[fmt],
+        )
+        response['Content-Disposition'] = f'attachment; filename="{exports.filename(name, fmt, compress)}"'
+        return response
\ No newline at end of file
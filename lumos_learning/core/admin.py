@@ -1,5 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from . import auth
 from .models import User, UserProfile
 
 
@@ -19,12 +20,16 @@ class UserAdmin(BaseUserAdmin):
     actions = ['approve_teachers', 'disapprove_teachers']
     
     def approve_teachers(self, request, queryset):
-        queryset.filter(role='teacher').update(is_teacher_approved=True)
+        teachers = queryset.filter(role='teacher')
+        auth.forget(*teachers.values_list('id', flat=True))
+        teachers.update(is_teacher_approved=True)
         self.message_user(request, f"Approved {queryset.count()} teachers.")
     approve_teachers.short_description = "Approve selected teachers"
     
     def disapprove_teachers(self, request, queryset):
-        queryset.filter(role='teacher').update(is_teacher_approved=False)
+        teachers = queryset.filter(role='teacher')
+        auth.forget(*teachers.values_list('id', flat=True))
+        teachers.update(is_teacher_approved=False)
         self.message_user(request, f"Disapproved {queryset.count()} teachers.")
     disapprove_teachers.short_description = "Disapprove selected teachers"
 
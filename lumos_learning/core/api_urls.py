@@ -1,10 +1,14 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 
+from .api_views import CacheStatsView
+
 router = DefaultRouter()
 
 urlpatterns = [
     path('', include(router.urls)),
     path('courses/', include('courses.api_urls')),
     path('payments/', include('payments.api_urls')),
+    path('analytics/', include('analytics.api_urls')),
+    path('cache/stats/', CacheStatsView.as_view(), name='cache_stats'),
 ]
\ No newline at end of file
@@ -0,0 +1,12 @@
+from django.core.cache import cache
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+
+class CacheStatsView(APIView):
+    """Cache hit, miss and fetch counts for the worker answering and, with Redis, all workers"""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(cache.stats() if hasattr(cache, 'stats') else {'process': None, 'all': None})
\ No newline at end of file
@@ -0,0 +1,61 @@
+"""
+Signed-in user from the cache.
+
+Django loads request.user with a query on every request. The user is kept
+in the cache instead, for USER_CACHE_TTL seconds, and dropped whenever the
+row is saved or deleted (see core.signals) or updated in bulk (call
+forget()). The session is still verified against the cached user's
+password hash, so changing a password signs out other sessions as usual.
+
+USER_CACHE_TTL = 0 turns this off, and is the default without a shared
+cache: forget() can only clear the local process, so other workers would
+go on accepting a stale user until it expired.
+"""
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.crypto import constant_time_compare
+
+CACHE_PREFIX = 'auth-user:'
+
+
+def _cache_key(user_id):
+    return f'{CACHE_PREFIX}{user_id}'
+
+
+def forget(*user_ids):
+    """Drop cached users now and again once the transaction commits"""
+    keys = [_cache_key(user_id) for user_id in user_ids if user_id]
+    if keys:
+        cache.delete_many(keys)
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def get_user(request):
+    """auth.get_user() without the query while the user is cached"""
+    session = request.session
+    try:
+        user_id = session[auth.SESSION_KEY]
+        backend_path = session[auth.BACKEND_SESSION_KEY]
+    except KeyError:
+        return AnonymousUser()
+    if not settings.USER_CACHE_TTL:
+        return auth.get_user(request)
+
+    key = _cache_key(user_id)
+    user = cache.get(key)
+    if (
+        user is not None
+        and backend_path in settings.AUTHENTICATION_BACKENDS
+        and user.is_active
+        and constant_time_compare(session.get(auth.HASH_SESSION_KEY, ''), user.get_session_auth_hash())
+    ):
+        return user
+
+    # Not cached, or the session needs Django's full checks
+    user = auth.get_user(request)
+    if user.is_authenticated:
+        cache.set(key, user, settings.USER_CACHE_TTL)
+    return user
\ No newline at end of file
@@ -0,0 +1,71 @@
+"""
+Admin bulk actions on large selections.
+
+run_or_queue() runs a job on a small selection inside the request. Above
+ADMIN_BACKGROUND_THRESHOLD rows it reads the selected primary keys once
+and queues the job in chunks of ADMIN_BACKGROUND_CHUNK. The chunks go to
+a Celery worker when a broker is configured, otherwise to an in-process
+thread, so "select all" on a multi-million-row changelist returns at once.
+
+A job is the dotted path of a function taking (primary keys, *args), e.g.
+payments.transitions.bulk_transition; each chunk is its own call.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def run(job, pks, args=()):
+    return import_string(job)(pks, *args)
+
+
+def _run_in_background(job, chunks, args):
+    try:
+        for pks in chunks:
+            run(job, pks, args)
+    except Exception:
+        logger.exception('Background admin job %s failed', job)
+    finally:
+        connection.close()
+
+
+def _queue(job, chunks, args):
+    global _executor
+    if getattr(settings, 'CELERY_BROKER_URL', ''):
+        from .tasks import run_admin_job
+        try:
+            for pks in chunks:
+                run_admin_job.delay(job, pks, list(args))
+            return
+        except Exception:
+            # Chunks already queued are idempotent for the jobs we run
+            logger.warning('Could not queue run_admin_job', exc_info=True)
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='admin-jobs')
+    _executor.submit(_run_in_background, job, chunks, args)
+
+
+def run_or_queue(queryset, job, *args):
+    """
+    (selected, result): run job on queryset now if it selects at most
+    ADMIN_BACKGROUND_THRESHOLD rows, otherwise queue it once the request
+    commits and return None as the result.
+    """
+    threshold = settings.ADMIN_BACKGROUND_THRESHOLD
+    pks = list(queryset.values_list('pk', flat=True).order_by()[:threshold + 1])
+    if len(pks) <= threshold:
+        return len(pks), run(job, pks, args)
+
+    pks = [str(pk) for pk in queryset.values_list('pk', flat=True).order_by('pk')]
+    size = settings.ADMIN_BACKGROUND_CHUNK
+    chunks = [pks[start:start + size] for start in range(0, len(pks), size)]
+    transaction.on_commit(lambda: _queue(job, chunks, args))
+    logger.info('Queued %s on %d rows in %d chunks', job, len(pks), len(chunks))
+    return len(pks), None
\ No newline at end of file
@@ -0,0 +1,127 @@
+"""
+Conditional GET from version stamps.
+
+Pages and API responses get a weak ETag hashed from the core.versions
+stamps they are built from. For signed-in users it also covers the user's
+own stamp (user_key), bumped when their enrollments, purchases, progress or
+profile change. Stamps are read from the cache, so a revisit whose
+If-None-Match still matches costs that one lookup and a 304, before any
+queryset or template work. Responses are marked no-cache so browsers
+always revalidate instead of guessing a lifetime.
+"""
+import hashlib
+from functools import wraps
+
+from django.http import HttpResponseNotModified
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
+from django.views.decorators.http import condition
+
+from . import versions
+
+
+def user_key(user_id):
+    return f'user:{user_id}'
+
+
+def touch_users(*user_ids):
+    """Change the ETags of everything shown to these users, once the transaction commits"""
+    versions.bump(*(user_key(user_id) for user_id in user_ids if user_id))
+
+
+def etag(request, keys, *parts):
+    """Weak ETag for content built from version keys, the user and any other parts"""
+    keys = list(keys)
+    user = request.user
+    if user.is_authenticated:
+        keys.append(user_key(user.pk))
+    stamps = versions.get_versions(keys)
+    raw = '|'.join([*(f'{key}={stamps[key]}' for key in keys), f'user={user.pk}', *map(str, parts)])
+    return f'W/"{hashlib.sha1(raw.encode()).hexdigest()}"'
+
+
+def _revalidate(request, response):
+    if request.user.is_authenticated:
+        patch_cache_control(response, no_cache=True, private=True)
+    else:
+        patch_cache_control(response, no_cache=True)
+
+
+def conditional_page(get_keys, get_parts=None):
+    """
+    Answer GETs of a view with 304 while the version keys from
+    get_keys(request, *args, **kwargs) are unchanged; get_keys returns None
+    to skip. get_parts adds values that aren't version stamps.
+    """
+    def etag_func(request, *args, **kwargs):
+        # Flash messages are rendered into the page
+        if request.COOKIES.get('messages'):
+            return None
+        keys = get_keys(request, *args, **kwargs)
+        if keys is None:
+            return None
+        parts = get_parts(request, *args, **kwargs) if get_parts else ()
+        return etag(request, keys, request.get_full_path(), *parts)
+
+    def decorator(view):
+        conditional_view = condition(etag_func=etag_func)(view)
+
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            if response.has_header('ETag'):
+                _revalidate(request, response)
+            return response
+        return wrapped
+    return decorator
+
+
+class NotModified(Exception):
+    pass
+
+
+class ConditionalMixin:
+    """
+    For REST framework views: answer GETs with 304 while the version keys
+    from get_etag_keys() are unchanged. Return None there to skip;
+    get_etag_parts() adds values that aren't version stamps.
+    """
+    etag = None
+
+    def get_etag_keys(self, request):
+        return None
+
+    def get_etag_parts(self, request):
+        return ()
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.etag = None
+        if request.method not in ('GET', 'HEAD'):
+            return
+        keys = self.get_etag_keys(request)
+        if keys is None:
+            return
+        self.etag = etag(
+            request, keys, request.get_full_path(), request.accepted_renderer.format,
+            *self.get_etag_parts(request),
+        )
+        strong = self.etag.removeprefix('W/')
+        for tag in parse_etags(request.headers.get('If-None-Match', '')):
+            if tag == '*' or tag.removeprefix('W/') == strong:
+                raise NotModified
+
+    def handle_exception(self, exc):
+        if isinstance(exc, NotModified):
+            response = HttpResponseNotModified()
+            response['ETag'] = self.etag
+            _revalidate(self.request, response)
+            return response
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if self.etag and response.status_code == 200 and not response.has_header('ETag'):
+            response['ETag'] = self.etag
+            _revalidate(request, response)
+        return response
\ No newline at end of file
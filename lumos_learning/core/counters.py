@@ -0,0 +1,87 @@
+"""
+Sharded counters.
+
+A counter is spread over COUNTER_SHARDS rows and each increment touches one
+random shard, so a burst of writes to the same counter (a viral course
+launch) waits on 1/N of the row locks instead of serialising on one row.
+Reads sum the shards and are cached for COUNTER_CACHE_TTL seconds.
+"""
+import random
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+
+from .models import CounterShard
+
+CACHE_PREFIX = 'counter:'
+
+
+def _cache_key(name):
+    return f'{CACHE_PREFIX}{name}'
+
+
+def _bump_cached(name, delta):
+    # Keep a warm cached value roughly in step without forcing a re-read
+    try:
+        cache.incr(_cache_key(name), delta)
+    except ValueError:
+        pass
+
+
+def increment(name, delta=1):
+    """Add delta to a counter, creating the shard row on first use"""
+    if not delta:
+        return
+    shard = random.randrange(settings.COUNTER_SHARDS)
+    shards = CounterShard.objects.filter(name=name, shard=shard)
+    if not shards.update(value=F('value') + delta):
+        try:
+            with transaction.atomic():
+                CounterShard.objects.create(name=name, shard=shard, value=delta)
+        except IntegrityError:
+            # Another writer created the shard first
+            shards.update(value=F('value') + delta)
+    _bump_cached(name, delta)
+
+
+def increment_on_commit(name, delta=1):
+    """Increment once the surrounding transaction commits"""
+    transaction.on_commit(lambda: increment(name, delta))
+
+
+def get_values(names, use_cache=True):
+    """Current values for several counters, one query for all cache misses"""
+    names = list(names)
+    values = {}
+    if use_cache:
+        keys = {_cache_key(name): name for name in names}
+        cached = cache.get_many(keys.keys())
+        values = {keys[key]: value for key, value in cached.items()}
+
+    missing = [name for name in names if name not in values]
+    if missing:
+        rows = CounterShard.objects.filter(name__in=missing).values('name').annotate(
+            total=Sum('value')
+        ).order_by()
+        fresh = dict.fromkeys(missing, 0)
+        fresh.update((row['name'], row['total']) for row in rows)
+        cache.set_many(
+            {_cache_key(name): value for name, value in fresh.items()},
+            settings.COUNTER_CACHE_TTL,
+        )
+        values.update(fresh)
+    return values
+
+
+def get_value(name):
+    return get_values([name])[name]
+
+
+def set_value(name, value):
+    """Overwrite a counter, folding all shards into shard 0"""
+    with transaction.atomic():
+        CounterShard.objects.filter(name=name).exclude(shard=0).delete()
+        CounterShard.objects.update_or_create(name=name, shard=0, defaults={'value': value})
+    cache.set(_cache_key(name), value, settings.COUNTER_CACHE_TTL)
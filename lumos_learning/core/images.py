@@ -0,0 +1,172 @@
+"""
+Responsive image variants.
+
+Uploaded images (course thumbnails, profile pictures) are resized to
+IMAGE_VARIANT_WIDTHS and encoded as WebP and JPEG. Variants are stored
+under variants/<sha256 of the original>/, so their URLs never change
+meaning and can be cached forever (see nginx.conf). ImageVariants records
+which widths exist for each uploaded file; the {% responsive_image %} tag
+in core.templatetags.responsive_images turns that into srcset attributes.
+
+render() only touches storage and Pillow, which lets the backfill command
+run it in a process pool; record() writes the database row.
+"""
+import hashlib
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import Image, ImageOps
+
+from .models import ImageVariants
+
+logger = logging.getLogger(__name__)
+
+PREFIX = 'variants'
+FORMATS = (
+    ('webp', 'WEBP', {'quality': 80, 'method': 4}),
+    ('jpg', 'JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+)
+CACHE_PREFIX = 'image-variants:'
+MISSING_TTL = 60
+
+
+def variant_name(content_hash, width, extension):
+    return f'{PREFIX}/{content_hash[:2]}/{content_hash}/{width}.{extension}'
+
+
+def variant_url(content_hash, width, extension):
+    return default_storage.url(variant_name(content_hash, width, extension))
+
+
+def _cache_key(source):
+    return CACHE_PREFIX + hashlib.sha1(source.encode()).hexdigest()
+
+
+def _encode(image, width, fmt, options):
+    if image.width > width:
+        height = round(image.height * width / image.width)
+        image = image.resize((width, height), Image.LANCZOS)
+    if fmt == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    output = io.BytesIO()
+    image.save(output, fmt, **options)
+    return output.getvalue()
+
+
+def render(source):
+    """
+    Write every missing variant of the stored image source. Returns
+    {'source', 'content_hash', 'width', 'height', 'widths'} or None if the
+    file is missing or not an image.
+    """
+    try:
+        with default_storage.open(source, 'rb') as file:
+            data = file.read()
+    except (FileNotFoundError, OSError):
+        return None
+    content_hash = hashlib.sha256(data).hexdigest()
+
+    try:
+        image = ImageOps.exif_transpose(Image.open(io.BytesIO(data)))
+        image.load()
+    except (OSError, SyntaxError, Image.DecompressionBombError):
+        logger.warning('Cannot build variants of %s', source, exc_info=True)
+        return None
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+
+    widths = sorted({min(width, image.width) for width in settings.IMAGE_VARIANT_WIDTHS})
+    for width in widths:
+        for extension, fmt, options in FORMATS:
+            name = variant_name(content_hash, width, extension)
+            if not default_storage.exists(name):
+                default_storage.save(name, ContentFile(_encode(image, width, fmt, options)))
+
+    return {
+        'source': source,
+        'content_hash': content_hash,
+        'width': image.width,
+        'height': image.height,
+        'widths': widths,
+    }
+
+
+def record(info):
+    """Save what render() produced"""
+    ImageVariants.objects.update_or_create(
+        source=info['source'],
+        defaults={key: info[key] for key in ('content_hash', 'width', 'height', 'widths')},
+    )
+    cache.set(_cache_key(info['source']), (info['content_hash'], info['widths']), None)
+
+
+def build(source):
+    info = render(source)
+    if info:
+        record(info)
+    return info
+
+
+_executor = None
+
+
+def _build_in_background(source):
+    try:
+        build(source)
+    except Exception:
+        logger.exception('Building variants of %s failed', source)
+    finally:
+        connection.close()
+
+
+def schedule(source):
+    """
+    Build variants once the upload commits: on a Celery worker when a
+    broker is configured, otherwise on a small in-process thread pool
+    (Pillow releases the GIL while resizing and encoding).
+    """
+    if not source:
+        return
+
+    def run():
+        global _executor
+        if getattr(settings, 'CELERY_BROKER_URL', ''):
+            from .tasks import build_image_variants
+            try:
+                build_image_variants.delay(source)
+                return
+            except Exception:
+                logger.warning('Could not queue build_image_variants', exc_info=True)
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='image-variants')
+        _executor.submit(_build_in_background, source)
+
+    transaction.on_commit(run)
+
+
+def field_changed(instance, field_name):
+    """In pre_save: whether an image field now holds a different file"""
+    name = getattr(instance, field_name).name or ''
+    if instance._state.adding or not instance.pk:
+        return bool(name)
+    previous = type(instance)._default_manager.filter(pk=instance.pk).values_list(field_name, flat=True).first()
+    return name != (previous or '') and bool(name)
+
+
+def variants_for(source):
+    """(content_hash, widths) for an uploaded image, or None if not built yet"""
+    if not source:
+        return None
+    key = _cache_key(source)
+    found = cache.get(key)
+    if found is None:
+        row = ImageVariants.objects.filter(source=source).values_list('content_hash', 'widths').first()
+        found = row or ()
+        cache.set(key, found, None if row else MISSING_TTL)
+    return tuple(found) or None
\ No newline at end of file
@@ -0,0 +1,78 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+
+DEFAULT_MIDDLEWARE = 'django.contrib.auth.middleware.AuthenticationMiddleware'
+CACHED_MIDDLEWARE = 'core.middleware.CachedAuthenticationMiddleware'
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare queries per signed-in request with Django\'s database sessions and '
+        'user lookup against the configured sessions and cached users. Nothing is kept.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='/dashboard/', help='Page to request (default /dashboard/)')
+        parser.add_argument('--requests', type=int, default=20, help='Requests per setup (default 20)')
+        parser.add_argument('--username', help='Sign in as this user instead of a temporary student')
+
+    def handle(self, *args, **options):
+        setups = [
+            ('before', {
+                'SESSION_ENGINE': 'django.contrib.sessions.backends.db',
+                'MIDDLEWARE': [DEFAULT_MIDDLEWARE if name == CACHED_MIDDLEWARE else name for name in settings.MIDDLEWARE],
+            }),
+            ('after', {}),
+        ]
+        results = []
+        try:
+            with transaction.atomic():
+                user = self.get_user(options['username'])
+                for label, overrides in setups:
+                    with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'], **overrides):
+                        results.append((label, self.measure(user, options['path'], options['requests'])))
+                raise Rollback
+        except Rollback:
+            pass
+
+        auth_tables = (Session._meta.db_table, get_user_model()._meta.db_table)
+        self.stdout.write(f'{options["requests"]} requests to {options["path"]}')
+        for label, (status, queries, seconds) in results:
+            per_request = len(queries) / options['requests']
+            auth = sum(1 for sql in queries if any(f'"{table}"' in sql for table in auth_tables))
+            self.stdout.write(
+                f'{label}: HTTP {status}, {per_request:.1f} queries/request '
+                f'({auth / options["requests"]:.1f} session/user), '
+                f'{seconds / options["requests"] * 1000:.1f} ms/request'
+            )
+
+    def get_user(self, username):
+        User = get_user_model()
+        if username:
+            try:
+                return User.objects.get(username=username)
+            except User.DoesNotExist:
+                raise CommandError(f'No user named {username}')
+        return User.objects.create_user('benchmark-auth', 'benchmark-auth@example.com', role='student')
+
+    def measure(self, user, path, requests):
+        client = Client()
+        client.force_login(user)
+        # Warm caches and lazily loaded code
+        status = client.get(path).status_code
+        started = time.perf_counter()
+        with CaptureQueriesContext(connection) as captured:
+            for _ in range(requests):
+                client.get(path)
+        return status, [query['sql'] for query in captured.captured_queries], time.perf_counter() - started
\ No newline at end of file
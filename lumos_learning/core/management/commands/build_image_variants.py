@@ -0,0 +1,45 @@
+from concurrent.futures import ProcessPoolExecutor
+import os
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from core import images
+from core.models import ImageVariants, User
+from courses.models import Course
+
+
+class Command(BaseCommand):
+    help = 'Build responsive variants for existing course thumbnails and profile pictures'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Number of worker processes')
+        parser.add_argument('--force', action='store_true',
+                            help='Also re-check images that already have variants')
+
+    def handle(self, *args, **options):
+        sources = set(Course.objects.exclude(thumbnail='').values_list('thumbnail', flat=True))
+        sources |= set(
+            User.objects.exclude(profile_picture='').exclude(profile_picture=None)
+            .values_list('profile_picture', flat=True)
+        )
+        if not options['force']:
+            sources -= set(ImageVariants.objects.values_list('source', flat=True))
+
+        if not sources:
+            self.stdout.write(self.style.SUCCESS('All images have variants'))
+            return
+
+        # Workers only use storage and Pillow; rows are written here
+        connections.close_all()
+        built = failed = 0
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            for source, info in zip(sorted(sources), pool.map(images.render, sorted(sources), chunksize=4)):
+                if info:
+                    images.record(info)
+                    built += 1
+                else:
+                    self.stdout.write(self.style.WARNING(f'Skipped {source}'))
+                    failed += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Built variants for {built} images, skipped {failed}'))
\ No newline at end of file
@@ -0,0 +1,18 @@
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Show cache hit, miss and fetch counts summed across workers'
+
+    def handle(self, *args, **options):
+        totals = cache.stats()['all'] if hasattr(cache, 'stats') else None
+        if totals is None:
+            raise CommandError('Without REDIS_URL each process counts its own; see /api/cache/stats/')
+
+        hits = totals.get('local_hits', 0) + totals.get('shared_hits', 0)
+        lookups = hits + totals.get('misses', 0)
+        for name, count in sorted(totals.items()):
+            self.stdout.write(f'{name}: {count}')
+        if lookups:
+            self.stdout.write(self.style.SUCCESS(f'Hit rate {hits / lookups:.1%} over {lookups} lookups'))
\ No newline at end of file
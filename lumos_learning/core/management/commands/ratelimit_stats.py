@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+from core import ratelimit
+
+
+class Command(BaseCommand):
+    help = 'Show how many requests each rate limit has refused'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true',
+                            help='Clear the counts after showing them')
+
+    def handle(self, *args, **options):
+        if not isinstance(ratelimit.get_buckets(), ratelimit.RedisBuckets):
+            raise CommandError('Without REDIS_URL each process counts its own refusals')
+
+        limited = ratelimit.stats()
+        if options['reset']:
+            ratelimit.reset_stats()
+        for policy in ratelimit.get_policies():
+            self.stdout.write(f'{policy.name}: {limited.get(policy.name, 0)} refused')
\ No newline at end of file
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from core import stats
+
+
+class Command(BaseCommand):
+    help = 'Recompute platform and instructor statistics from the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Only report drifted statistics, do not write')
+
+    def handle(self, *args, **options):
+        drift = stats.rebuild(dry_run=options['check'])
+
+        if not drift:
+            self.stdout.write(self.style.SUCCESS('Statistics are in sync'))
+            return
+
+        for name, (stored, actual) in sorted(drift.items()):
+            self.stdout.write(f'{name}: stored {stored}, actual {actual}')
+        verb = 'drifted' if options['check'] else 'rebuilt'
+        self.stdout.write(self.style.WARNING(f'{len(drift)} statistics {verb}'))
\ No newline at end of file
@@ -0,0 +1,177 @@
+"""
+Serving access-controlled files.
+
+Views decide who may see a file and then call serve_file(). With
+MEDIA_ACCEL_REDIRECT set (see nginx.conf) the response only carries an
+X-Accel-Redirect header and nginx sends the bytes. Otherwise the file is
+streamed, honouring Range, If-Range and conditional requests. Under WSGI
+that is a FileResponse, whose byte range the server can sendfile(). Under
+ASGI (uvicorn) the file is read in blocks by an async iterator, since
+Django reads a synchronous streaming body into memory there.
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# Each block read under ASGI is a hop to a worker thread, so blocks are
+# much larger than FileResponse's 4 KB
+STREAM_BLOCK_SIZE = 512 * 1024
+
+
+class RangeFile:
+    """
+    A file positioned at start that reads at most length bytes. It exposes
+    fileno() so the WSGI server can sendfile() the range directly.
+    """
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.remaining = length
+        file.seek(start)
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+async def aiter_file(file, block_size=STREAM_BLOCK_SIZE):
+    """Read a file block by block off the event loop, closing it at the end"""
+    read = sync_to_async(file.read, thread_sensitive=False)
+    try:
+        while block := await read(block_size):
+            yield block
+    finally:
+        await sync_to_async(file.close, thread_sensitive=False)()
+
+
+def file_response(request, file, content_type, status=200, length=None):
+    """FileResponse, or an async stream of the file when serving ASGI"""
+    if not isinstance(request, ASGIRequest):
+        return FileResponse(file, status=status, content_type=content_type)
+    response = StreamingHttpResponse(aiter_file(file), status=status, content_type=content_type)
+    length = length if length is not None else getattr(file, 'size', None)
+    if length is not None:
+        response['Content-Length'] = str(length)
+    return response
+
+
+def parse_range(header, size):
+    """
+    (start, end) inclusive for a single-range Range header, None to serve
+    the whole file, or False if the range cannot be satisfied.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match or match.groups() == ('', ''):
+        # Absent, malformed or multi-range: send the whole file
+        return None
+    first, last = match.groups()
+    if not first:
+        length = int(last)
+        if not length:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def _etag(stat):
+    return quote_etag(f'{stat.st_size:x}-{stat.st_mtime_ns:x}')
+
+
+def _range_allowed(request, etag, last_modified):
+    """If-Range: only honour Range when the client's copy is still current"""
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == int(last_modified)
+
+
+def _disposition(filename, attachment):
+    kind = 'attachment' if attachment else 'inline'
+    return f"{kind}; filename*=UTF-8''{quote(filename)}"
+
+
+def accel_redirect(name, content_type, filename, attachment=False):
+    response = HttpResponse(content_type=content_type)
+    response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_REDIRECT.rstrip('/') + '/' + quote(name)
+    response['Content-Disposition'] = _disposition(filename, attachment)
+    response['Cache-Control'] = 'private, max-age=3600'
+    return response
+
+
+def serve_file(request, field_file, filename=None, attachment=False):
+    """Response delivering field_file (a FieldFile) to an authorized user"""
+    return serve_stored(request, field_file.storage, field_file.name, filename, attachment)
+
+
+def serve_stored(request, storage, name, filename=None, attachment=False):
+    """Response delivering the file stored as name in storage"""
+    filename = filename or os.path.basename(name)
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+    if settings.MEDIA_ACCEL_REDIRECT:
+        return accel_redirect(name, content_type, filename, attachment)
+
+    try:
+        path = storage.path(name)
+    except NotImplementedError:
+        # Remote storage: no stat or sendfile, stream the whole object
+        response = file_response(request, storage.open(name, 'rb'), content_type)
+        response['Content-Disposition'] = _disposition(filename, attachment)
+        return response
+
+    stat = os.stat(path)
+    etag = _etag(stat)
+    if request.headers.get('If-None-Match') == etag:
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+
+    size = stat.st_size
+    byte_range = None
+    if _range_allowed(request, etag, stat.st_mtime):
+        byte_range = parse_range(request.headers.get('Range'), size)
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    file = open(path, 'rb')
+    if byte_range is None:
+        response = file_response(request, file, content_type, length=size)
+    else:
+        start, end = byte_range
+        response = file_response(request, RangeFile(file, start, end - start + 1), content_type, status=206)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(end - start + 1)
+
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Content-Disposition'] = _disposition(filename, attachment)
+    response['Cache-Control'] = 'private, max-age=3600'
+    return response
\ No newline at end of file
@@ -1,16 +1,67 @@
-from django.http import HttpResponseTooManyRequests
-from django_ratelimit.decorators import ratelimit
-from django.utils.decorators import method_decorator
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.http import HttpResponse, JsonResponse
+from django.utils.functional import SimpleLazyObject
+
+from . import auth, ratelimit
+
+MESSAGE = 'Rate limit exceeded. Please try again later.'
+
+
+def too_many_requests(request, wait):
+    if request.path.startswith('/api/'):
+        response = JsonResponse({'detail': MESSAGE}, status=429)
+    else:
+        response = HttpResponse(MESSAGE, status=429, content_type='text/plain')
+    response['Retry-After'] = ratelimit.retry_after(wait)
+    return response
 
 
 class RateLimitMiddleware:
+    """
+    Apply settings.RATE_LIMITS (see core.ratelimit) once the view is known.
+    Runs natively in both modes, so under ASGI it adds no thread hop of its
+    own for requests no policy covers.
+    """
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+            # The handler adapts view middleware to its mode by type
+            self.process_view = self.aprocess_view
 
     def __call__(self, request):
-        response = self.get_response(request)
-        return response
+        if self.async_mode:
+            return self.__acall__(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        return await self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        wait = ratelimit.check(request, request.resolver_match.view_name)
+        if wait:
+            return too_many_requests(request, wait)
+        return None
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        wait = await ratelimit.acheck(request, request.resolver_match.view_name)
+        if wait:
+            return too_many_requests(request, wait)
+        return None
 
     def process_exception(self, request, exception):
         if hasattr(exception, 'status_code') and exception.status_code == 429:
-            return HttpResponseTooManyRequests("Rate limit exceeded. Please try again later.")
\ No newline at end of file
+            return too_many_requests(request, getattr(exception, 'wait', None) or 1)
+
+
+class CachedAuthenticationMiddleware(AuthenticationMiddleware):
+    """AuthenticationMiddleware that resolves request.user from the cache (see core.auth)"""
+
+    def process_request(self, request):
+        super().process_request(request)
+        request.user = SimpleLazyObject(lambda: auth.get_user(request))
\ No newline at end of file
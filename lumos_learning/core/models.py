@@ -40,4 +40,44 @@ class UserProfile(models.Model):
     email_notifications = models.BooleanField(default=True)
     
     def __str__(self):
-        return f"{self.user.username}'s Profile"
\ No newline at end of file
+        return f"{self.user.username}'s Profile"
+
+
+class CounterShard(models.Model):
+    """One slice of a sharded counter, see core.counters"""
+    name = models.CharField(max_length=100)
+    shard = models.PositiveSmallIntegerField()
+    value = models.BigIntegerField(default=0)
+
+    class Meta:
+        unique_together = ['name', 'shard']
+
+    def __str__(self):
+        return f"{self.name}[{self.shard}] = {self.value}"
+
+
+class ContentVersion(models.Model):
+    """Monotonic version stamp for a piece of cached content, see core.versions"""
+    key = models.CharField(max_length=100, unique=True)
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.key} v{self.version}"
+
+
+class ImageVariants(models.Model):
+    """Resized copies of an uploaded image, see core.images"""
+    source = models.CharField(max_length=255, unique=True)
+    content_hash = models.CharField(max_length=64)
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    widths = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "Image variants"
+
+    def __str__(self):
+        return f"{self.source} ({len(self.widths)} widths)"
@@ -0,0 +1,81 @@
+"""
+Full-page cache for anonymous visitors.
+
+A cached page is stored under the current versions (core.versions) of the
+content keys it was rendered from, e.g. "catalog" or "course:12". Bumping
+one of those keys makes every page built from it unreachable; pages built
+from other keys stay cached. Pages are rendered through
+core.tiered_cache.fetch(), so after a bump one request per page renders
+it while the others wait for the result.
+"""
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+
+from . import tiered_cache, versions
+
+CACHE_PREFIX = 'page:'
+
+
+def versioned_key(prefix, keys, *parts):
+    """Cache key for content built from version keys and any other parts"""
+    stamps = versions.get_versions(keys)
+    raw = '|'.join([*(f'{key}={stamps[key]}' for key in keys), *map(str, parts)])
+    return prefix + hashlib.sha1(raw.encode()).hexdigest()
+
+
+def _cacheable_request(request):
+    return (
+        request.method in ('GET', 'HEAD')
+        and not request.user.is_authenticated
+        # Flash messages are rendered into the page
+        and 'messages' not in request.COOKIES
+    )
+
+
+def _cacheable_response(response):
+    return (
+        response.status_code == 200
+        and not response.streaming
+        and not response.cookies
+        and not response.has_header('Cache-Control')
+    )
+
+
+def cache_anonymous_page(get_keys, timeout=None):
+    """
+    Cache a view's response for anonymous users. get_keys(request, *args,
+    **kwargs) returns the version keys the page depends on, or None to
+    skip caching for that request.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            keys = get_keys(request, *args, **kwargs) if _cacheable_request(request) else None
+            if keys is None:
+                return view(request, *args, **kwargs)
+
+            key = versioned_key(CACHE_PREFIX, keys, request.get_host(), request.get_full_path())
+            rendered = []
+
+            def render():
+                response = view(request, *args, **kwargs)
+                if hasattr(response, 'render') and callable(response.render):
+                    response.render()
+                rendered.append(response)
+                if _cacheable_response(response):
+                    return (response.content, response['Content-Type'])
+                return None
+
+            cached = tiered_cache.fetch(key, render, settings.PAGE_CACHE_TTL if timeout is None else timeout)
+            if rendered:
+                return rendered[0]
+            content, content_type = cached
+            response = HttpResponse(content, content_type=content_type)
+            patch_vary_headers(response, ('Cookie',))
+            return response
+        return wrapped
+    return decorator
\ No newline at end of file
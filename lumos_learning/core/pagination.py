@@ -0,0 +1,249 @@
+"""
+Keyset (cursor) pagination.
+
+Pages are addressed by an opaque cursor holding the ordering values of the
+row at the page edge, so fetching page 500 costs the same indexed range
+scan as page 1 and no COUNT(*) is needed. Totals, when wanted, come from
+the query planner's estimate or a count capped at COUNT_CAP rows.
+EstimatedCountPaginator brings planner estimates to the admin's numbered
+pages.
+"""
+import base64
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+COUNT_CAP = 1000
+
+
+def encode_cursor(values, direction='next'):
+    payload = json.dumps({'v': values, 'd': direction[0]}, separators=(',', ':'), default=str)
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(values, direction) for a cursor string, or (None, 'next') if invalid"""
+    if not cursor:
+        return None, 'next'
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        direction = 'previous' if payload['d'] == 'p' else 'next'
+        return payload['v'], direction
+    except (ValueError, KeyError, TypeError):
+        return None, 'next'
+
+
+def planner_estimate(queryset):
+    """The PostgreSQL planner's row estimate for queryset, or None elsewhere"""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def estimate_count(queryset, cap=COUNT_CAP):
+    """
+    (total, is_estimate) for queryset. On PostgreSQL large results use the
+    planner's row estimate; otherwise rows are counted up to cap.
+    """
+    estimate = planner_estimate(queryset)
+    if estimate is not None and estimate > cap:
+        return estimate, True
+
+    total = queryset.order_by()[:cap + 1].count()
+    if total > cap:
+        return cap, True
+    return total, False
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Page-number paginator for admin changelists on large tables. Above
+    ADMIN_COUNT_ESTIMATE_THRESHOLD rows the count is the planner's estimate
+    instead of an exact COUNT(*); set show_full_result_count = False on the
+    ModelAdmin too so the unfiltered total isn't counted either.
+    """
+
+    @cached_property
+    def count(self):
+        estimate = planner_estimate(self.object_list)
+        if estimate is not None and estimate > settings.ADMIN_COUNT_ESTIMATE_THRESHOLD:
+            return estimate
+        return self.object_list.count()
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None,
+                 total=None, total_is_estimate=False):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.total = total
+        self.total_is_estimate = total_is_estimate
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    @property
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+
+class KeysetPaginator:
+    """
+    Paginate a queryset on a unique ordering, by default newest first on
+    (created_at, id). count is None, 'approximate' or 'exact'.
+    """
+
+    def __init__(self, queryset, per_page, ordering=('-created_at', '-id'), count=None):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = list(ordering)
+        self.count = count
+        self.fields = [
+            queryset.model._meta.get_field(name.lstrip('-')) for name in self.ordering
+        ]
+
+    def _values(self, obj):
+        return [field.value_from_object(obj) for field in self.fields]
+
+    def _filter(self, values, forward):
+        """Rows strictly after (forward) or before the row with values"""
+        condition = Q()
+        equal = Q()
+        for name, field, value in zip(self.ordering, self.fields, values):
+            descending = name.startswith('-')
+            lookup = 'lt' if descending == forward else 'gt'
+            condition |= equal & Q(**{f'{field.attname}__{lookup}': value})
+            equal &= Q(**{field.attname: value})
+        return self.queryset.filter(condition)
+
+    def _decode(self, values):
+        return [field.to_python(value) for field, value in zip(self.fields, values)]
+
+    def page(self, cursor=None):
+        values, direction = decode_cursor(cursor)
+        if values is not None:
+            try:
+                if len(values) != len(self.fields):
+                    raise ValidationError('Cursor does not match the ordering')
+                values = self._decode(values)
+            except (ValidationError, TypeError):
+                values, direction = None, 'next'
+
+        if values is None:
+            rows = list(self.queryset.order_by(*self.ordering)[:self.per_page + 1])
+            more = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+            has_previous = False
+            has_next = more
+        elif direction == 'next':
+            rows = list(self._filter(values, forward=True).order_by(*self.ordering)[:self.per_page + 1])
+            more = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+            has_previous = True
+            has_next = more
+        else:
+            reverse = [name[1:] if name.startswith('-') else f'-{name}' for name in self.ordering]
+            rows = list(self._filter(values, forward=False).order_by(*reverse)[:self.per_page + 1])
+            more = len(rows) > self.per_page
+            rows = rows[:self.per_page][::-1]
+            has_previous = more
+            has_next = True
+
+        next_cursor = encode_cursor(self._values(rows[-1])) if rows and has_next else None
+        previous_cursor = (
+            encode_cursor(self._values(rows[0]), 'previous') if rows and has_previous else None
+        )
+
+        total, is_estimate = None, False
+        if self.count == 'exact':
+            total = self.queryset.count()
+        elif self.count == 'approximate':
+            total, is_estimate = estimate_count(self.queryset)
+
+        return KeysetPage(rows, next_cursor, previous_cursor, total, is_estimate)
+
+
+def cursor_query(params, cursor):
+    """Query string for the current filters with cursor replaced"""
+    query = params.copy()
+    query.pop('cursor', None)
+    query.pop('page', None)
+    if cursor:
+        query['cursor'] = cursor
+    return query.urlencode()
+
+
+class KeysetPagination(BasePagination):
+    """
+    REST framework pagination on (created_at, id). Views can override the
+    ordering with a keyset_ordering attribute.
+    """
+    page_size = None
+    ordering = ('-created_at', '-id')
+    cursor_query_param = 'cursor'
+    count = 'approximate'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page_size = self.page_size or settings.REST_FRAMEWORK.get('PAGE_SIZE') or 20
+        ordering = getattr(view, 'keyset_ordering', self.ordering)
+        paginator = KeysetPaginator(queryset, page_size, ordering=ordering, count=self.count)
+        self.request = request
+        self.page = paginator.page(request.query_params.get(self.cursor_query_param))
+        return list(self.page)
+
+    def _link(self, cursor):
+        if cursor is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self._link(self.page.next_cursor),
+            'previous': self._link(self.page.previous_cursor),
+            'count': self.page.total,
+            'count_is_estimate': self.page.total_is_estimate,
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'previous': {'type': 'string', 'nullable': True},
+                'count': {'type': 'integer', 'nullable': True},
+                'count_is_estimate': {'type': 'boolean'},
+                'results': schema,
+            },
+        }
\ No newline at end of file
@@ -0,0 +1,238 @@
+"""
+Token-bucket rate limiting.
+
+Policies come from settings.RATE_LIMITS. Each names the URLs it covers (URL
+names, or path prefixes), optionally the methods, a rate such as "10/m"
+and what a bucket belongs to: the client IP, the signed-in user (the IP
+for anonymous visitors) or one bucket for the whole route. Every matching
+policy takes a token from its own bucket and a request is refused when
+any bucket is empty, with Retry-After saying when it will have one again.
+
+Buckets live in this process, or in Redis when REDIS_URL is set so every
+worker shares them. The Redis check for all of a request's buckets is one
+Lua script, so it is atomic and costs one round trip. If Redis is
+unreachable requests are let through. Refusals are counted per policy,
+see stats().
+"""
+import logging
+import math
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+KEYS = ('ip', 'user', 'route')
+
+
+class Policy:
+    def __init__(self, name, rate, key='ip', urls=(), paths=(), methods=None, burst=None):
+        if key not in KEYS:
+            raise ValueError(f'Rate limit {name}: key must be one of {", ".join(KEYS)}')
+        count, _, period = rate.partition('/')
+        self.name = name
+        self.key = key
+        self.urls = frozenset(urls)
+        self.paths = tuple(paths)
+        self.methods = frozenset(method.upper() for method in methods) if methods else None
+        # Tokens added per second, and how many can be saved up
+        self.refill = int(count) / PERIODS[period[-1:] or 's'] / int(period[:-1] or 1)
+        self.capacity = burst or int(count)
+
+    def matches(self, request, view_name):
+        if self.methods is not None and request.method not in self.methods:
+            return False
+        return view_name in self.urls or bool(self.paths) and request.path.startswith(self.paths)
+
+    def bucket(self, request):
+        if self.key == 'route':
+            return self.name
+        user = getattr(request, 'user', None)
+        if self.key == 'user' and user is not None and user.is_authenticated:
+            return f'{self.name}:user:{user.pk}'
+        return f'{self.name}:ip:{client_ip(request)}'
+
+
+def client_ip(request):
+    """The client's address, looking past RATE_LIMIT_PROXY_COUNT trusted proxies"""
+    proxies = settings.RATE_LIMIT_PROXY_COUNT
+    if proxies:
+        forwarded = [ip.strip() for ip in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if ip.strip()]
+        if len(forwarded) >= proxies:
+            return forwarded[-proxies]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+class LocalBuckets:
+    """Buckets in this process; the least recently used are forgotten past RATE_LIMIT_LOCAL_KEYS"""
+
+    def __init__(self):
+        self._buckets = OrderedDict()
+        self._limited = Counter()
+        self._lock = threading.Lock()
+
+    def take(self, checks):
+        """
+        Take a token from every (policy, bucket) if all have one. Returns
+        0, or the seconds until they would.
+        """
+        now = time.monotonic()
+        with self._lock:
+            levels = []
+            wait = 0
+            for policy, bucket in checks:
+                tokens, updated = self._buckets.get(bucket, (policy.capacity, now))
+                tokens = min(policy.capacity, tokens + (now - updated) * policy.refill)
+                levels.append(tokens)
+                if tokens < 1:
+                    wait = max(wait, (1 - tokens) / policy.refill)
+            for (policy, bucket), tokens in zip(checks, levels):
+                if wait:
+                    if tokens < 1:
+                        self._limited[policy.name] += 1
+                else:
+                    tokens -= 1
+                self._buckets[bucket] = (tokens, now)
+                self._buckets.move_to_end(bucket)
+            while len(self._buckets) > settings.RATE_LIMIT_LOCAL_KEYS:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def stats(self):
+        with self._lock:
+            return dict(self._limited)
+
+    def reset_stats(self):
+        with self._lock:
+            self._limited.clear()
+
+
+class RedisBuckets:
+    """One hash per bucket, checked and updated for a whole request in one script"""
+    PREFIX = 'ratelimit:'
+    STATS = 'ratelimit-stats'
+
+    # KEYS: the buckets, then the stats hash. ARGV: now, then capacity,
+    # refill per second and policy name for each bucket
+    TAKE_SCRIPT = """
+        local now = tonumber(ARGV[1])
+        local stats = KEYS[#KEYS]
+        local levels = {}
+        local wait = 0
+        for i = 1, #KEYS - 1 do
+            local capacity = tonumber(ARGV[i * 3 - 1])
+            local refill = tonumber(ARGV[i * 3])
+            local state = redis.call('HMGET', KEYS[i], 'tokens', 'updated')
+            local tokens = tonumber(state[1]) or capacity
+            local updated = tonumber(state[2]) or now
+            tokens = math.min(capacity, tokens + math.max(0, now - updated) * refill)
+            levels[i] = tokens
+            if tokens < 1 then
+                wait = math.max(wait, (1 - tokens) / refill)
+            end
+        end
+        for i = 1, #KEYS - 1 do
+            local capacity = tonumber(ARGV[i * 3 - 1])
+            local refill = tonumber(ARGV[i * 3])
+            local tokens = levels[i]
+            if wait > 0 then
+                if tokens < 1 then
+                    redis.call('HINCRBY', stats, ARGV[i * 3 + 1], 1)
+                end
+            else
+                tokens = tokens - 1
+            end
+            redis.call('HSET', KEYS[i], 'tokens', tokens, 'updated', now)
+            -- A bucket that has refilled is the same as no bucket
+            redis.call('PEXPIRE', KEYS[i], math.ceil((capacity - tokens) / refill * 1000) + 1000)
+        end
+        return math.ceil(wait * 1000)
+    """
+
+    def __init__(self, url):
+        import redis
+
+        timeout = settings.RATE_LIMIT_REDIS_TIMEOUT
+        self.client = redis.Redis.from_url(url, socket_timeout=timeout, socket_connect_timeout=timeout)
+        self._take = self.client.register_script(self.TAKE_SCRIPT)
+        self._error = redis.RedisError
+
+    def take(self, checks):
+        args = [time.time()]
+        for policy, _ in checks:
+            args += [policy.capacity, policy.refill, policy.name]
+        try:
+            wait_ms = self._take(keys=[self.PREFIX + bucket for _, bucket in checks] + [self.STATS], args=args)
+        except self._error:
+            logger.warning('Rate limiting is off: Redis is unavailable', exc_info=True)
+            return 0
+        return wait_ms / 1000
+
+    def stats(self):
+        return {name.decode(): int(count) for name, count in self.client.hgetall(self.STATS).items()}
+
+    def reset_stats(self):
+        self.client.delete(self.STATS)
+
+
+_policies = None
+_buckets = None
+_lock = threading.Lock()
+
+
+def get_policies():
+    global _policies
+    if _policies is None:
+        _policies = [Policy(**options) for options in settings.RATE_LIMITS]
+    return _policies
+
+
+def get_buckets():
+    global _buckets
+    with _lock:
+        if _buckets is None:
+            url = getattr(settings, 'REDIS_URL', '')
+            _buckets = RedisBuckets(url) if url else LocalBuckets()
+        return _buckets
+
+
+def check(request, view_name):
+    """
+    Take a token for every policy covering the request. Returns 0 if it may
+    go ahead, else the seconds until it could.
+    """
+    checks = [
+        (policy, policy.bucket(request)) for policy in get_policies() if policy.matches(request, view_name)
+    ]
+    if not checks:
+        return 0
+    return get_buckets().take(checks)
+
+
+async def acheck(request, view_name):
+    """
+    check() for async middleware. Requests no policy covers are answered
+    on the event loop; the rest may need the user or Redis, so they are
+    checked in a thread.
+    """
+    if not any(policy.matches(request, view_name) for policy in get_policies()):
+        return 0
+    return await sync_to_async(check)(request, view_name)
+
+
+def retry_after(wait):
+    """Retry-After value: whole seconds, at least one"""
+    return str(max(1, math.ceil(wait)))
+
+
+def stats():
+    """{policy name: requests refused}, shared across workers only with Redis"""
+    return get_buckets().stats()
+
+
+def reset_stats():
+    get_buckets().reset_stats()
\ No newline at end of file
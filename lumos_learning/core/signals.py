@@ -0,0 +1,31 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import auth, images
+from .conditional import touch_users
+from .models import User
+
+
+@receiver(pre_save, sender=User)
+def user_saving(sender, instance, raw=False, update_fields=None, **kwargs):
+    # Logins save last_login only, skip the lookup for those
+    if raw or (update_fields is not None and 'profile_picture' not in update_fields):
+        return
+    instance._profile_picture_changed = images.field_changed(instance, 'profile_picture')
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, raw=False, **kwargs):
+    auth.forget(instance.pk)
+    if raw:
+        return
+    # Names, pictures and logins show up on every page the user sees
+    touch_users(instance.pk)
+    if getattr(instance, '_profile_picture_changed', False):
+        instance._profile_picture_changed = False
+        images.schedule(instance.profile_picture.name)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    auth.forget(instance.pk)
\ No newline at end of file
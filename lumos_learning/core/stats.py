@@ -0,0 +1,245 @@
+"""
+Materialized platform statistics.
+
+Global and per-instructor totals (published courses, distinct students,
+enrollments, completed revenue) are kept in core.counters and adjusted by
+the course, enrollment and payment signals, so the home page and the
+teacher dashboard read a few counter rows instead of aggregating tables.
+rebuild() recomputes everything from the tables (manage.py rebuild_stats).
+It also runs by itself on the first read after deployment: one request
+rebuilds while concurrent ones read the counters as they are, zeros at
+first, rather than all recomputing at once.
+"""
+from collections import Counter
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db.models import Count, Sum
+
+from . import counters
+
+PUBLISHED_COURSES = 'stats:courses:published'
+ENROLLMENTS = 'stats:enrollments'
+REVENUE = 'stats:revenue:cents'
+# Shared with courses.enrollment_counts
+DISTINCT_STUDENTS = 'students:distinct'
+# 1 once rebuild() has filled the counters in
+BUILT = 'stats:built'
+REBUILD_LOCK = 'stats:rebuilding'
+REBUILD_LOCK_TIMEOUT = 300
+
+INSTRUCTOR_PREFIX = 'stats:instructor:'
+INSTRUCTOR_STATS = ('courses', 'students', 'enrollments', 'revenue')
+
+
+def instructor_counter(instructor_id, name):
+    return f'{INSTRUCTOR_PREFIX}{instructor_id}:{name}'
+
+
+def _cents(amount):
+    return int((Decimal(amount) * 100).to_integral_value())
+
+
+def _apply(deltas):
+    for name, delta in deltas.items():
+        if delta:
+            counters.increment_on_commit(name, delta)
+
+
+def course_changed(before, after):
+    """
+    Adjust published course totals. before and after are
+    (is_published, instructor_id), or None for a course that did not or no
+    longer exists.
+    """
+    deltas = Counter()
+    for state, sign in ((before, -1), (after, 1)):
+        if state and state[0]:
+            deltas[PUBLISHED_COURSES] += sign
+            deltas[instructor_counter(state[1], 'courses')] += sign
+    _apply(deltas)
+
+
+def courses_published(queryset, published):
+    """Call before queryset.update(is_published=published)"""
+    changed = (
+        queryset.exclude(is_published=published)
+        .values_list('instructor_id')
+        .annotate(total=Count('id'))
+        .order_by()
+    )
+    sign = 1 if published else -1
+    deltas = Counter()
+    for instructor_id, total in changed:
+        deltas[PUBLISHED_COURSES] += sign * total
+        deltas[instructor_counter(instructor_id, 'courses')] += sign * total
+    _apply(deltas)
+
+
+def _has_enrollment(enrollment, **filters):
+    from courses.models import Enrollment
+
+    return Enrollment.objects.filter(
+        student_id=enrollment.student_id, **filters
+    ).exclude(pk=enrollment.pk).exists()
+
+
+def enrollment_created(enrollment):
+    instructor_id = enrollment.course.instructor_id
+    deltas = Counter({ENROLLMENTS: 1, instructor_counter(instructor_id, 'enrollments'): 1})
+    if not _has_enrollment(enrollment, course__instructor_id=instructor_id):
+        deltas[instructor_counter(instructor_id, 'students')] += 1
+        if not _has_enrollment(enrollment):
+            deltas[DISTINCT_STUDENTS] += 1
+    _apply(deltas)
+
+
+def enrollment_deleted(enrollment):
+    instructor_id = enrollment.course.instructor_id
+    deltas = Counter({ENROLLMENTS: -1, instructor_counter(instructor_id, 'enrollments'): -1})
+    if not _has_enrollment(enrollment, course__instructor_id=instructor_id):
+        deltas[instructor_counter(instructor_id, 'students')] -= 1
+        if not _has_enrollment(enrollment):
+            deltas[DISTINCT_STUDENTS] -= 1
+    _apply(deltas)
+
+
+def _add_revenue(deltas, status, amount, instructor_id, sign):
+    if status != 'completed':
+        return
+    cents = sign * _cents(amount)
+    deltas[REVENUE] += cents
+    # Instructor revenue covers whole-course purchases, as the dashboard
+    # always has
+    if instructor_id:
+        deltas[instructor_counter(instructor_id, 'revenue')] += cents
+
+
+def payment_changed(before, after):
+    """
+    Adjust revenue totals. before and after are (status, amount,
+    instructor_id), or None for a payment that did not or no longer exists.
+    """
+    deltas = Counter()
+    for state, sign in ((before, -1), (after, 1)):
+        if state:
+            _add_revenue(deltas, *state, sign)
+    _apply(deltas)
+
+
+def payments_status_changed(queryset, status):
+    """Call before queryset.update(status=status)"""
+    payments_moved(
+        queryset.exclude(status=status).values_list('status', 'amount', 'course__instructor_id'), status
+    )
+
+
+def payments_moved(rows, status):
+    """Adjust revenue for [(old status, amount, instructor_id)] moving to status"""
+    deltas = Counter()
+    for old_status, amount, instructor_id in rows:
+        _add_revenue(deltas, old_status, amount, instructor_id, -1)
+        _add_revenue(deltas, status, amount, instructor_id, 1)
+    _apply(deltas)
+
+
+def _read(names):
+    values = counters.get_values([*names, BUILT])
+    if not values[BUILT] and cache.add(REBUILD_LOCK, 1, REBUILD_LOCK_TIMEOUT):
+        try:
+            rebuild()
+        finally:
+            cache.delete(REBUILD_LOCK)
+        values = counters.get_values(names)
+    return values
+
+
+def platform():
+    """Global totals, read in one query on a cold cache"""
+    values = _read([PUBLISHED_COURSES, DISTINCT_STUDENTS, ENROLLMENTS, REVENUE])
+    return {
+        'published_courses': values[PUBLISHED_COURSES],
+        'students': values[DISTINCT_STUDENTS],
+        'enrollments': values[ENROLLMENTS],
+        'revenue': Decimal(values[REVENUE]) / 100,
+    }
+
+
+def for_instructor(instructor_id):
+    """Totals across one instructor's courses"""
+    names = {name: instructor_counter(instructor_id, name) for name in INSTRUCTOR_STATS}
+    values = _read(names.values())
+    totals = {name: values[counter] for name, counter in names.items()}
+    totals['revenue'] = Decimal(totals['revenue']) / 100
+    return totals
+
+
+def _actual():
+    from courses.models import Course, Enrollment
+    from payments.models import Payment
+
+    actual = {
+        BUILT: 1,
+        PUBLISHED_COURSES: Course.objects.filter(is_published=True).count(),
+        ENROLLMENTS: Enrollment.objects.count(),
+        DISTINCT_STUDENTS: Enrollment.objects.values('student').distinct().count(),
+        REVENUE: _cents(
+            Payment.objects.filter(status='completed').aggregate(total=Sum('amount'))['total'] or 0
+        ),
+    }
+
+    published = (
+        Course.objects.filter(is_published=True)
+        .values_list('instructor_id')
+        .annotate(total=Count('id'))
+        .order_by()
+    )
+    for instructor_id, total in published:
+        actual[instructor_counter(instructor_id, 'courses')] = total
+
+    enrollments = (
+        Enrollment.objects.values_list('course__instructor_id')
+        .annotate(total=Count('id'), students=Count('student', distinct=True))
+        .order_by()
+    )
+    for instructor_id, total, students in enrollments:
+        actual[instructor_counter(instructor_id, 'enrollments')] = total
+        actual[instructor_counter(instructor_id, 'students')] = students
+
+    revenue = (
+        Payment.objects.filter(status='completed', course__isnull=False)
+        .values_list('course__instructor_id')
+        .annotate(total=Sum('amount'))
+        .order_by()
+    )
+    for instructor_id, total in revenue:
+        actual[instructor_counter(instructor_id, 'revenue')] = _cents(total)
+    return actual
+
+
+def rebuild(dry_run=False, batch_size=1000):
+    """
+    Recompute every statistic from the tables and overwrite counters that
+    have drifted. Returns {counter name: (stored, actual)} for the drift found.
+    """
+    from .models import CounterShard
+
+    actual = _actual()
+    # Instructors whose courses, students or sales have all gone still
+    # have counters that should now read zero
+    stale = CounterShard.objects.filter(name__startswith=INSTRUCTOR_PREFIX).values_list('name', flat=True).distinct()
+    names = sorted(set(actual) | set(stale))
+
+    drift = {}
+    for start in range(0, len(names), batch_size):
+        batch = names[start:start + batch_size]
+        stored = counters.get_values(batch, use_cache=False)
+        for name in batch:
+            expected = actual.get(name, 0)
+            if stored[name] != expected:
+                drift[name] = (stored[name], expected)
+
+    if not dry_run:
+        for name, (_, expected) in drift.items():
+            counters.set_value(name, expected)
+    return drift
\ No newline at end of file
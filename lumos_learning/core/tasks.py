@@ -0,0 +1,15 @@
+from celery import shared_task
+
+from . import bulk_actions, images
+
+
+@shared_task(ignore_result=True)
+def build_image_variants(source):
+    """Resize an uploaded image into its responsive variants"""
+    images.build(source)
+
+
+@shared_task(ignore_result=True)
+def run_admin_job(job, pks, args):
+    """Run a chunk of a queued admin bulk action (see core.bulk_actions)"""
+    bulk_actions.run(job, pks, args)
\ No newline at end of file
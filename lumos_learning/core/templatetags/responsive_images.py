@@ -0,0 +1,38 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from core import images
+
+register = template.Library()
+
+DEFAULT_SIZES = '(min-width: 992px) 33vw, (min-width: 768px) 50vw, 100vw'
+
+
+def _srcset(content_hash, widths, extension):
+    return ', '.join(f'{images.variant_url(content_hash, width, extension)} {width}w' for width in widths)
+
+
+@register.simple_tag
+def responsive_image(image, alt='', sizes=DEFAULT_SIZES, fallback_width=640, **attrs):
+    """
+    <picture> with WebP and JPEG srcsets for an ImageField value, or a
+    plain <img> of the original while its variants are still being built.
+    Extra keyword arguments become attributes of the <img>.
+    """
+    if not image:
+        return ''
+    attributes = format_html_join('', ' {}="{}"', ((name.replace('_', '-'), value) for name, value in attrs.items()))
+
+    variants = images.variants_for(image.name)
+    if not variants:
+        return format_html('<img src="{}" alt="{}" loading="lazy"{}>', image.url, alt, attributes)
+
+    content_hash, widths = variants
+    fallback = min(widths, key=lambda width: abs(width - fallback_width))
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}" loading="lazy"{}></picture>',
+        _srcset(content_hash, widths, 'webp'), sizes,
+        images.variant_url(content_hash, fallback, 'jpg'), _srcset(content_hash, widths, 'jpg'), sizes,
+        alt, attributes,
+    )
\ No newline at end of file
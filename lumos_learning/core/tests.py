@@ -0,0 +1,458 @@
+import io
+import tempfile
+import threading
+import time
+from decimal import Decimal
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.db import connection
+from django.http import FileResponse
+from django.template import Context, Template
+from django.test import AsyncRequestFactory, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+
+from courses import enrollment_counts
+from courses.models import Category, Course, Enrollment
+from payments.models import Payment
+
+from . import auth, counters, images, media, ratelimit, stats, tiered_cache
+from .models import CounterShard, User
+
+
+class CoreTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = User.objects.create_user('teacher', role='teacher')
+        cls.student = User.objects.create_user('student', password='secret', role='student')
+        cls.category = Category.objects.create(name='Programming', slug='programming')
+
+    def setUp(self):
+        cache.clear()
+
+    def create_course(self, title, **kwargs):
+        kwargs.setdefault('is_published', True)
+        return Course.objects.create(
+            title=title, slug=title.lower().replace(' ', '-'), description=title,
+            category=self.category, instructor=self.teacher, difficulty='beginner', **kwargs
+        )
+
+
+class StatsTests(CoreTestCase):
+    def test_counters_are_built_on_first_read(self):
+        course = self.create_course('Python', price=10)
+        Enrollment.objects.create(student=self.student, course=course)
+        Payment.objects.create(
+            user=self.student, course=course, amount='10.00', payment_method='paypal', status='completed'
+        )
+        # As after deploying to a database that already has rows
+        CounterShard.objects.all().delete()
+        cache.clear()
+
+        self.assertEqual(stats.platform(), {
+            'published_courses': 1, 'students': 1, 'enrollments': 1, 'revenue': Decimal('10'),
+        })
+        self.assertEqual(
+            stats.for_instructor(self.teacher.id),
+            {'courses': 1, 'students': 1, 'enrollments': 1, 'revenue': Decimal('10')},
+        )
+        self.assertEqual(stats.rebuild(dry_run=True), {})
+
+    def test_deleting_enrollments_uncounts_them(self):
+        stats.rebuild()
+        with self.captureOnCommitCallbacks(execute=True):
+            course = self.create_course('Python')
+        self.client.force_login(self.student)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/courses/{course.slug}/enroll/')
+        with self.captureOnCommitCallbacks(execute=True):
+            Enrollment.objects.all().delete()
+
+        self.assertEqual(stats.rebuild(dry_run=True), {})
+        self.assertEqual(enrollment_counts.reconcile(dry_run=True), {})
+        self.assertEqual(counters.get_values([stats.ENROLLMENTS], use_cache=False)[stats.ENROLLMENTS], 0)
+
+    def test_enrollments_made_outside_the_view_are_counted(self):
+        stats.rebuild()
+        with self.captureOnCommitCallbacks(execute=True):
+            python = self.create_course('Python')
+            django = self.create_course('Django')
+        for course in (python, django):
+            with self.captureOnCommitCallbacks(execute=True):
+                Enrollment.objects.create(student=self.student, course=course)
+        self.assertEqual(stats.platform()['students'], 1)
+        self.assertEqual(enrollment_counts.active_enrollments([python.id], use_cache=False), {python.id: 1})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Enrollment.objects.filter(course=python).delete()
+        self.assertEqual(stats.rebuild(dry_run=True), {})
+        self.assertEqual(enrollment_counts.reconcile(dry_run=True), {})
+
+    def test_one_request_rebuilds_at_a_time(self):
+        self.create_course('Python')
+        CounterShard.objects.all().delete()
+        cache.clear()
+        cache.add(stats.REBUILD_LOCK, 1)
+        with mock.patch.object(stats, 'rebuild') as rebuild:
+            self.assertEqual(stats.platform()['published_courses'], 0)
+        rebuild.assert_not_called()
+
+        cache.delete(stats.REBUILD_LOCK)
+        self.assertEqual(stats.platform()['published_courses'], 1)
+        self.assertIsNone(cache.get(stats.REBUILD_LOCK))
+
+
+@override_settings(MEDIA_ACCEL_REDIRECT='')
+class MediaTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.storage = FileSystemStorage(location=directory.name)
+        self.content = bytes(range(256)) * 1000
+        self.name = self.storage.save('notes.pdf', ContentFile(self.content))
+
+    async def read(self, response):
+        return b''.join([chunk async for chunk in response])
+
+    def test_wsgi_uses_file_response(self):
+        response = media.serve_stored(RequestFactory().get('/'), self.storage, self.name)
+        self.assertIsInstance(response, FileResponse)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        response.close()
+
+    async def test_asgi_streams_whole_file(self):
+        response = media.serve_stored(AsyncRequestFactory().get('/'), self.storage, self.name)
+        self.assertTrue(response.is_async)
+        self.assertEqual(response['Content-Length'], str(len(self.content)))
+        blocks = [block async for block in response]
+        self.assertEqual(b''.join(blocks), self.content)
+        # One thread hop per block, so not FileResponse's 4 KB blocks
+        self.assertEqual(len(blocks), 1)
+
+    async def test_asgi_streams_a_range(self):
+        request = AsyncRequestFactory().get('/', headers={'Range': 'bytes=1000-1999'})
+        response = media.serve_stored(request, self.storage, self.name)
+        self.assertEqual(response.status_code, 206)
+        self.assertTrue(response.is_async)
+        self.assertEqual(response['Content-Range'], f'bytes 1000-1999/{len(self.content)}')
+        self.assertEqual(await self.read(response), self.content[1000:2000])
+
+    def test_unsatisfiable_range(self):
+        request = RequestFactory().get('/', headers={'Range': f'bytes={len(self.content)}-'})
+        self.assertEqual(media.serve_stored(request, self.storage, self.name).status_code, 416)
+
+    def test_parse_range(self):
+        self.assertEqual(media.parse_range('bytes=0-99', 1000), (0, 99))
+        self.assertEqual(media.parse_range('bytes=900-', 1000), (900, 999))
+        self.assertEqual(media.parse_range('bytes=-100', 1000), (900, 999))
+        self.assertEqual(media.parse_range('bytes=500-5000', 1000), (500, 999))
+        self.assertIsNone(media.parse_range('bytes=0-1,5-6', 1000))
+        self.assertIsNone(media.parse_range('', 1000))
+        self.assertFalse(media.parse_range('bytes=-0', 1000))
+        self.assertFalse(media.parse_range('bytes=9-3', 1000))
+
+    def test_conditional_requests(self):
+        first = media.serve_stored(RequestFactory().get('/'), self.storage, self.name)
+        first.close()
+        request = RequestFactory().get('/', headers={'If-None-Match': first['ETag']})
+        self.assertEqual(media.serve_stored(request, self.storage, self.name).status_code, 304)
+
+        # A Range for an outdated copy gets the whole file
+        request = RequestFactory().get('/', headers={'Range': 'bytes=0-9', 'If-Range': '"stale"'})
+        response = media.serve_stored(request, self.storage, self.name)
+        self.assertEqual(response.status_code, 200)
+        response.close()
+
+    @override_settings(MEDIA_ACCEL_REDIRECT='/protected/')
+    def test_accel_redirect_leaves_the_bytes_to_nginx(self):
+        response = media.serve_stored(RequestFactory().get('/'), self.storage, 'course materials/notes.pdf', attachment=True)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected/course%20materials/notes.pdf')
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertEqual(response['Content-Disposition'], "attachment; filename*=UTF-8''notes.pdf")
+        self.assertEqual(response.content, b'')
+
+
+class RateLimitMiddlewareTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        ratelimit._buckets = None
+
+    async def test_async_requests_are_limited(self):
+        for _ in range(10):
+            response = await self.async_client.post('/accounts/login/', {'login': 'x', 'password': 'y'})
+            self.assertNotEqual(response.status_code, 429)
+        response = await self.async_client.post('/accounts/login/', {'login': 'x', 'password': 'y'})
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+        # Pages no policy covers are not counted
+        self.assertNotEqual((await self.async_client.get('/accounts/login/')).status_code, 429)
+
+
+# The pages use static files the manifest only lists after collectstatic
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class ConditionalTests(CoreTestCase):
+    def get(self, url, etag=None):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=etag) if etag else self.client.get(url)
+
+    def test_home_page_changes_with_platform_totals(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            course = self.create_course('Python')
+        etag = self.get('/')['ETag']
+        self.assertEqual(self.get('/', etag).status_code, 304)
+
+        self.client.force_login(self.student)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/courses/{course.slug}/enroll/')
+        self.client.logout()
+        self.assertEqual(self.get('/', etag).status_code, 200)
+
+    def test_api_answers_304_until_the_catalog_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            course = self.create_course('Python')
+        self.client.force_login(self.student)
+        response = self.get('/api/courses/courses/')
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertEqual(self.get('/api/courses/courses/', etag).status_code, 304)
+
+        course.title = 'Python 3'
+        with self.captureOnCommitCallbacks(execute=True):
+            course.save()
+        response = self.get('/api/courses/courses/', etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_etags_are_per_user(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_course('Python')
+        self.client.force_login(self.student)
+        etag = self.get('/api/courses/courses/')['ETag']
+        self.client.force_login(self.teacher)
+        self.assertEqual(self.get('/api/courses/courses/', etag).status_code, 200)
+
+
+class TokenBucketTests(TestCase):
+    def setUp(self):
+        self.buckets = ratelimit.LocalBuckets()
+        self.policy = ratelimit.Policy('login', '3/m', urls=['account_login'], methods=['POST'])
+
+    def test_rate_and_burst(self):
+        self.assertEqual(self.policy.capacity, 3)
+        self.assertAlmostEqual(self.policy.refill, 3 / 60)
+        policy = ratelimit.Policy('progress', '120/m', burst=30)
+        self.assertEqual((policy.capacity, policy.refill), (30, 2))
+        with self.assertRaises(ValueError):
+            ratelimit.Policy('bad', '1/s', key='session')
+
+    def test_bucket_empties_and_refills(self):
+        checks = [(self.policy, 'login:ip:1.2.3.4')]
+        with mock.patch('time.monotonic', return_value=1000):
+            self.assertEqual([self.buckets.take(checks) for _ in range(3)], [0, 0, 0])
+            self.assertAlmostEqual(self.buckets.take(checks), 20)
+        with mock.patch('time.monotonic', return_value=1020):
+            self.assertEqual(self.buckets.take(checks), 0)
+        self.assertEqual(self.buckets.stats(), {'login': 1})
+
+    def test_refused_requests_take_no_tokens(self):
+        roomy = ratelimit.Policy('api', '100/m')
+        checks = [(self.policy, 'login:ip:a'), (roomy, 'api:ip:a')]
+        with mock.patch('time.monotonic', return_value=1000):
+            for _ in range(3):
+                self.buckets.take(checks)
+            for _ in range(5):
+                self.assertTrue(self.buckets.take(checks))
+            self.assertFalse(self.buckets.take([(roomy, 'api:ip:a')]))
+        self.assertEqual(self.buckets.stats(), {'login': 5})
+
+    def test_client_ip_behind_proxies(self):
+        request = RequestFactory().get('/', REMOTE_ADDR='10.0.0.1', HTTP_X_FORWARDED_FOR='6.6.6.6, 1.2.3.4')
+        with override_settings(RATE_LIMIT_PROXY_COUNT=0):
+            self.assertEqual(ratelimit.client_ip(request), '10.0.0.1')
+        with override_settings(RATE_LIMIT_PROXY_COUNT=1):
+            # The client can write the first entries; the proxy's is last
+            self.assertEqual(ratelimit.client_ip(request), '1.2.3.4')
+
+    def test_policies_match_views_methods_and_paths(self):
+        post = RequestFactory().post('/accounts/login/')
+        self.assertTrue(self.policy.matches(post, 'account_login'))
+        self.assertFalse(self.policy.matches(RequestFactory().get('/accounts/login/'), 'account_login'))
+        api = ratelimit.Policy('api', '300/m', paths=['/api/'])
+        self.assertTrue(api.matches(RequestFactory().get('/api/courses/'), None))
+
+    def test_webhook_buckets_are_per_sender(self):
+        policy = next(policy for policy in ratelimit.get_policies() if policy.name == 'webhooks')
+        first = RequestFactory().post('/payments/webhook/paypal/', REMOTE_ADDR='1.1.1.1')
+        second = RequestFactory().post('/payments/webhook/paypal/', REMOTE_ADDR='2.2.2.2')
+        self.assertNotEqual(policy.bucket(first), policy.bucket(second))
+
+
+@override_settings(USER_CACHE_TTL=60)
+class CachedUserTests(CoreTestCase):
+    def request(self):
+        request = RequestFactory().get('/')
+        request.session = self.client.session
+        return request
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.student)
+
+    def test_cached_user_skips_the_query(self):
+        self.assertEqual(auth.get_user(self.request()), self.student)
+        request = self.request()
+        request.session.keys()
+        with CaptureQueriesContext(connection) as captured:
+            self.assertEqual(auth.get_user(request), self.student)
+        self.assertEqual(len(captured), 0)
+
+    def test_password_change_signs_out_the_session(self):
+        auth.get_user(self.request())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.student.set_password('changed')
+            self.student.save()
+        self.assertFalse(auth.get_user(self.request()).is_authenticated)
+
+    def test_bulk_updates_need_forget(self):
+        auth.get_user(self.request())
+        User.objects.filter(pk=self.student.pk).update(is_active=False)
+        self.assertTrue(auth.get_user(self.request()).is_authenticated)
+
+        auth.forget(self.student.pk)
+        self.assertFalse(auth.get_user(self.request()).is_authenticated)
+
+    @override_settings(USER_CACHE_TTL=0)
+    def test_no_caching_without_a_ttl(self):
+        self.assertEqual(auth.get_user(self.request()), self.student)
+        self.assertIsNone(cache.get(auth._cache_key(self.student.pk)))
+
+
+class LocalTierTests(TestCase):
+    def test_least_recently_used_is_evicted(self):
+        local = tiered_cache.LocalTier(max_entries=2, max_bytes=2 ** 20)
+        local.set('a', 1, None)
+        local.set('b', 2, None)
+        local.get('a')
+        local.set('c', 3, None)
+        self.assertEqual([local.get(key) for key in 'abc'], [1, tiered_cache.MISSING, 3])
+
+    def test_bytes_are_bounded(self):
+        local = tiered_cache.LocalTier(max_entries=100, max_bytes=200)
+        local.set('big', 'x' * 500, None)
+        local.set('a', 'x' * 120, None)
+        local.set('b', 'x' * 120, None)
+        self.assertIs(local.get('big'), tiered_cache.MISSING)
+        self.assertIs(local.get('a'), tiered_cache.MISSING)
+        self.assertEqual(local.get('b'), 'x' * 120)
+        self.assertLessEqual(local.size, 200)
+
+    def test_values_are_copies(self):
+        local = tiered_cache.LocalTier(max_entries=10, max_bytes=2 ** 20)
+        value = [1]
+        local.set('key', value, None)
+        local.get('key').append(2)
+        self.assertEqual(local.get('key'), [1])
+
+    def test_stale_fill_is_dropped(self):
+        local = tiered_cache.LocalTier(max_entries=10, max_bytes=2 ** 20)
+        generation = local.generation
+        local.delete(['key'])
+        local.fill('key', 'old', None, generation)
+        self.assertIs(local.get('key'), tiered_cache.MISSING)
+
+
+class FetchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+
+    def compute(self, value='fresh', wait=0):
+        def compute():
+            self.calls += 1
+            time.sleep(wait)
+            return value
+        return compute
+
+    def test_missing_value_is_computed_once(self):
+        results = []
+        compute = self.compute(wait=0.2)
+        threads = [threading.Thread(target=lambda: results.append(tiered_cache.fetch('key', compute, 60))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ['fresh'] * 5)
+        self.assertEqual(self.calls, 1)
+
+    def test_none_is_not_cached(self):
+        self.assertIsNone(tiered_cache.fetch('key', self.compute(None), 60))
+        self.assertIsNone(tiered_cache.fetch('key', self.compute(None), 60))
+        self.assertEqual(self.calls, 2)
+
+    def test_refreshes_early_near_expiry(self):
+        # Took 10 seconds to compute and expires in one
+        cache.set('key', ('old', 10, time.time() + 1), 60)
+        with mock.patch.object(tiered_cache.random, 'random', return_value=0.0):
+            self.assertEqual(tiered_cache.fetch('key', self.compute(), 60), 'old')
+        with mock.patch.object(tiered_cache.random, 'random', return_value=0.9):
+            self.assertEqual(tiered_cache.fetch('key', self.compute(), 60), 'fresh')
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(cache.get('key')[0], 'fresh')
+
+    def test_old_value_is_served_while_another_process_refreshes(self):
+        cache.set('key', ('old', 10, time.time() + 1), 60)
+        cache.add(tiered_cache.LOCK_PREFIX + 'key', 1, 60)
+        with mock.patch.object(tiered_cache.random, 'random', return_value=0.9):
+            self.assertEqual(tiered_cache.fetch('key', self.compute(), 60), 'old')
+        self.assertEqual(self.calls, 0)
+
+
+@override_settings(IMAGE_VARIANT_WIDTHS=[160, 320, 640])
+class ImageVariantTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        media_root = override_settings(MEDIA_ROOT=directory.name)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+        output = io.BytesIO()
+        Image.new('RGBA', (400, 200), (255, 0, 0, 128)).save(output, 'PNG')
+        self.source = default_storage.save('course_thumbnails/red.png', ContentFile(output.getvalue()))
+
+    def render_tag(self):
+        field = Course._meta.get_field('thumbnail')
+        image = field.attr_class(None, field, self.source)
+        return Template('{% load responsive_images %}{% responsive_image image alt="Red" %}').render(Context({'image': image}))
+
+    def test_variants_are_capped_at_the_original_width(self):
+        info = images.build(self.source)
+        self.assertEqual(info['widths'], [160, 320, 400])
+        with default_storage.open(images.variant_name(info['content_hash'], 160, 'jpg')) as file:
+            self.assertEqual(Image.open(file).size, (160, 80))
+        self.assertTrue(default_storage.exists(images.variant_name(info['content_hash'], 400, 'webp')))
+        self.assertEqual(images.variants_for(self.source), (info['content_hash'], [160, 320, 400]))
+
+    def test_tag_falls_back_until_variants_exist(self):
+        self.assertNotIn('<picture>', self.render_tag())
+        images.build(self.source)
+        html = self.render_tag()
+        self.assertIn('<picture><source type="image/webp"', html)
+        self.assertIn('/400.jpg 400w', html)
+
+    def test_unreadable_image_is_skipped(self):
+        broken = default_storage.save('course_thumbnails/broken.png', ContentFile(b'not an image'))
+        with self.assertLogs('core.images', 'WARNING'):
+            self.assertIsNone(images.build(broken))
+        self.assertIsNone(images.build('course_thumbnails/missing.png'))
+        self.assertIsNone(images.variants_for(broken))
+
+    def test_built_after_commit(self):
+        with mock.patch.object(images, '_executor') as executor:
+            with self.captureOnCommitCallbacks(execute=True):
+                images.schedule(self.source)
+                executor.submit.assert_not_called()
+        executor.submit.assert_called_once_with(images._build_in_background, self.source)
\ No newline at end of file
@@ -0,0 +1,495 @@
+"""
+Two-tier cache backend and stampede-safe fetch().
+
+TieredCache keeps a per-process LRU, bounded by entries and bytes, in front
+of Redis. Reads try the LRU, then Redis, and copy Redis hits into the LRU
+for at most LOCAL_TIMEOUT seconds. Writes go to Redis and are announced on
+a pub/sub channel so every worker drops its local copy; while a worker is
+not subscribed it reads Redis only, and it empties its LRU when it
+resubscribes. Without a LOCATION the LRU is the whole cache, as on the
+free tier.
+
+fetch() computes a missing value once: other threads wait for it, other
+processes wait on a lock key, and callers serve the old value while one
+of them refreshes it. Values are also refreshed a little before they
+expire, more eagerly the longer they take to compute (probabilistic early
+expiration, "XFetch"), so a hot key doesn't expire under load.
+
+Hit and miss counts are kept per process and, with Redis, summed across
+workers; see stats().
+"""
+import logging
+import math
+import os
+import pickle
+import random
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache as default_cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.redis import RedisCache
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'cache:invalidate'
+STATS_KEY = 'cache:stats'
+LOCK_PREFIX = 'fetch-lock:'
+MISSING = object()
+
+
+class Metrics:
+    def __init__(self):
+        self._counts = Counter()
+        self._unflushed = Counter()
+        self._lock = threading.Lock()
+
+    def add(self, name, count=1):
+        with self._lock:
+            self._counts[name] += count
+            self._unflushed[name] += count
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._counts)
+
+    def take_unflushed(self):
+        with self._lock:
+            unflushed, self._unflushed = self._unflushed, Counter()
+        return unflushed
+
+    def restore(self, unflushed):
+        with self._lock:
+            self._unflushed.update(unflushed)
+
+
+metrics = Metrics()
+
+
+class LocalTier:
+    """LRU of pickled values, so callers never share a mutable object"""
+
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        # Bumped by every write and invalidation; a value read from Redis is
+        # only kept if nothing changed while it was being read
+        self.generation = 0
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+
+    def _live(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] is not None and entry[0] <= time.monotonic():
+            self._remove(key)
+            return None
+        return entry
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[1])
+        return entry is not None
+
+    def _store(self, key, value, timeout, expires=MISSING):
+        if timeout is not None and timeout <= 0:
+            self._remove(key)
+            return
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        if len(data) > self.max_bytes:
+            self._remove(key)
+            return
+        if expires is MISSING:
+            expires = None if timeout is None else time.monotonic() + timeout
+        self._remove(key)
+        self._entries[key] = (expires, data)
+        self.size += len(data)
+        while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+
+    def get(self, key):
+        with self._lock:
+            entry = self._live(key)
+            if entry is None:
+                return MISSING
+            self._entries.move_to_end(key)
+        return pickle.loads(entry[1])
+
+    def set(self, key, value, timeout):
+        with self._lock:
+            self.generation += 1
+            self._store(key, value, timeout)
+
+    def fill(self, key, value, timeout, generation):
+        """Keep a value read from Redis unless the cache changed meanwhile"""
+        with self._lock:
+            if generation == self.generation:
+                self._store(key, value, timeout)
+
+    def add(self, key, value, timeout):
+        with self._lock:
+            if self._live(key) is not None:
+                return False
+            self.set(key, value, timeout)
+            return True
+
+    def incr(self, key, delta):
+        with self._lock:
+            entry = self._live(key)
+            if entry is None:
+                raise ValueError(f"Key '{key}' not found")
+            value = pickle.loads(entry[1]) + delta
+            self.generation += 1
+            self._store(key, value, None, expires=entry[0])
+            return value
+
+    def delete(self, keys):
+        with self._lock:
+            self.generation += 1
+            return [self._remove(key) for key in keys]
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self.size = 0
+
+
+class InvalidationBus:
+    """Announces changed keys to other processes and applies theirs to the local tier"""
+
+    def __init__(self, url, local):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.local = local
+        self.sender = uuid.uuid4().hex
+        self.subscribed = threading.Event()
+        self._error = redis.RedisError
+        threading.Thread(target=self._listen, name='cache-invalidation', daemon=True).start()
+
+    def publish(self, keys):
+        """Tell other processes to drop keys; None drops everything"""
+        message = '\n'.join([self.sender, *(keys if keys is not None else ['*'])])
+        try:
+            self.client.publish(CHANNEL, message)
+        except self._error:
+            logger.warning('Could not publish cache invalidation', exc_info=True)
+
+    def _apply(self, data):
+        sender, *keys = data.decode().split('\n')
+        if sender == self.sender:
+            return
+        if keys == ['*']:
+            self.local.clear()
+        else:
+            self.local.delete(keys)
+        metrics.add('invalidations_received', len(keys))
+
+    def _flush_metrics(self):
+        unflushed = metrics.take_unflushed()
+        if not unflushed:
+            return
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for name, count in unflushed.items():
+                pipe.hincrby(STATS_KEY, name, count)
+            pipe.execute()
+        except self._error:
+            metrics.restore(unflushed)
+
+    def _listen(self):
+        delay = 1
+        while True:
+            pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.subscribe(CHANNEL)
+                # Anything announced while we weren't listening was missed
+                self.local.clear()
+                self.subscribed.set()
+                delay = 1
+                flushed = time.monotonic()
+                while True:
+                    message = pubsub.get_message(timeout=1.0)
+                    if message is not None and message['type'] == 'message':
+                        self._apply(message['data'])
+                    if time.monotonic() - flushed >= settings.CACHE_METRICS_FLUSH_INTERVAL:
+                        self._flush_metrics()
+                        flushed = time.monotonic()
+            except Exception:
+                self.subscribed.clear()
+                logger.warning('Cache invalidation channel lost, retrying in %ss', delay, exc_info=True)
+                time.sleep(delay)
+                delay = min(delay * 2, 30)
+            finally:
+                pubsub.close()
+
+
+# One local tier and bus per location in each process; Django builds a
+# cache backend per thread
+_tiers = {}
+_tiers_lock = threading.Lock()
+
+
+def _raw_key(key, key_prefix, version):
+    # TieredCache has already made the key
+    return key
+
+
+class TieredCache(BaseCache):
+    """
+    CACHES backend. LOCATION is a Redis URL, or empty for the local tier
+    only. OPTIONS: LOCAL_MAX_ENTRIES, LOCAL_MAX_BYTES, LOCAL_TIMEOUT (the
+    longest a Redis value is kept locally) and REDIS_OPTIONS for Django's
+    RedisCache.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._location = location
+        self._local_timeout = options.get('LOCAL_TIMEOUT', 30)
+        self._shared = None
+        if location:
+            self._shared = RedisCache(location, {
+                'TIMEOUT': params.get('TIMEOUT', 300),
+                'KEY_FUNCTION': _raw_key,
+                'OPTIONS': options.get('REDIS_OPTIONS', {}),
+            })
+        with _tiers_lock:
+            tier = _tiers.get((os.getpid(), location))
+            if tier is None:
+                local = LocalTier(options.get('LOCAL_MAX_ENTRIES', 10000), options.get('LOCAL_MAX_BYTES', 64 * 2 ** 20))
+                bus = InvalidationBus(location, local) if location else None
+                tier = _tiers[os.getpid(), location] = (local, bus)
+        self._local, self._bus = tier
+
+    def _seconds(self, timeout):
+        """Timeout in seconds, None for forever, 0 or less to expire now"""
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        return timeout
+
+    def _local_seconds(self, timeout):
+        timeout = self._seconds(timeout)
+        if self._shared is None:
+            return timeout
+        return self._local_timeout if timeout is None else min(timeout, self._local_timeout)
+
+    def _use_local(self):
+        return self._bus is None or self._bus.subscribed.is_set()
+
+    def _changed(self, keys):
+        self._local.delete(keys)
+        if self._bus is not None:
+            self._bus.publish(keys)
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        if self._use_local():
+            value = self._local.get(key)
+            if value is not MISSING:
+                metrics.add('local_hits')
+                return value
+        if self._shared is None:
+            metrics.add('misses')
+            return default
+        generation = self._local.generation
+        value = self._shared.get(key, MISSING)
+        if value is MISSING:
+            metrics.add('misses')
+            return default
+        metrics.add('shared_hits')
+        if self._use_local():
+            self._local.fill(key, value, self._local_timeout, generation)
+        return value
+
+    def get_many(self, keys, version=None):
+        made = {self.make_and_validate_key(key, version=version): key for key in keys}
+        found = {}
+        if self._use_local():
+            for key, original in made.items():
+                value = self._local.get(key)
+                if value is not MISSING:
+                    found[original] = value
+            metrics.add('local_hits', len(found))
+        missing = [key for key, original in made.items() if original not in found]
+        if missing and self._shared is not None:
+            generation = self._local.generation
+            fetched = self._shared.get_many(missing)
+            metrics.add('shared_hits', len(fetched))
+            for key, value in fetched.items():
+                found[made[key]] = value
+                if self._use_local():
+                    self._local.fill(key, value, self._local_timeout, generation)
+            missing = [key for key in missing if key not in fetched]
+        metrics.add('misses', len(missing))
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        if self._shared is not None:
+            self._shared.set(key, value, timeout)
+            self._bus.publish([key])
+        self._local.set(key, value, self._local_seconds(timeout))
+        metrics.add('sets')
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        made = {self.make_and_validate_key(key, version=version): value for key, value in data.items()}
+        if self._shared is not None:
+            self._shared.set_many(made, timeout)
+            self._bus.publish(list(made))
+        for key, value in made.items():
+            self._local.set(key, value, self._local_seconds(timeout))
+        metrics.add('sets', len(made))
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        if self._shared is None:
+            return self._local.add(key, value, self._seconds(timeout))
+        added = self._shared.add(key, value, timeout)
+        if added:
+            self._changed([key])
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        if self._shared is None:
+            value = self._local.get(key)
+            if value is MISSING:
+                return False
+            self._local.set(key, value, self._seconds(timeout))
+            return True
+        touched = self._shared.touch(key, timeout)
+        self._changed([key])
+        return touched
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        if self._shared is None:
+            return self._local.incr(key, delta)
+        value = self._shared.incr(key, delta)
+        self._changed([key])
+        return value
+
+    def has_key(self, key, version=None):
+        return self.get(key, MISSING, version=version) is not MISSING
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        deleted = self._local.delete([key])[0]
+        if self._shared is not None:
+            deleted = self._shared.delete(key)
+            self._bus.publish([key])
+        metrics.add('deletes')
+        return deleted
+
+    def delete_many(self, keys, version=None):
+        made = [self.make_and_validate_key(key, version=version) for key in keys]
+        if not made:
+            return
+        self._local.delete(made)
+        if self._shared is not None:
+            self._shared.delete_many(made)
+            self._bus.publish(made)
+        metrics.add('deletes', len(made))
+
+    def clear(self):
+        self._local.clear()
+        if self._shared is not None:
+            self._shared.clear()
+            self._bus.publish(None)
+
+    def stats(self):
+        """This process's counts, plus every worker's when Redis is shared"""
+        local = {'entries': len(self._local._entries), 'bytes': self._local.size}
+        result = {'process': {**metrics.snapshot(), **local}, 'all': None}
+        if self._bus is not None:
+            self._bus._flush_metrics()
+            totals = self._bus.client.hgetall(STATS_KEY)
+            result['all'] = {name.decode(): int(count) for name, count in totals.items()}
+        return result
+
+
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def _compute(cache, key, compute, timeout):
+    started = time.monotonic()
+    value = compute()
+    if value is not None:
+        delta = time.monotonic() - started
+        cache.set(key, (value, delta, time.time() + timeout), timeout)
+    metrics.add('fetch_computes')
+    return value
+
+
+def fetch(key, compute, timeout=None, beta=1.0, cache=None):
+    """
+    The value cached under key, from compute() when missing or due for a
+    refresh. compute() runs at most once at a time per key; returning None
+    leaves nothing cached. beta > 1 refreshes earlier.
+    """
+    cache = cache or default_cache
+    timeout = cache.default_timeout if timeout is None else timeout
+    entry = cache.get(key)
+    if entry is not None:
+        value, delta, expires = entry
+        # XFetch: refresh with a probability that rises towards expiry
+        if time.time() - delta * beta * math.log(1 - random.random()) < expires:
+            return value
+
+    with _inflight_lock:
+        done = _inflight.get(key)
+        leader = done is None
+        if leader:
+            done = _inflight[key] = threading.Event()
+    if not leader:
+        # Another thread here is computing it
+        if entry is not None:
+            metrics.add('fetch_stale')
+            return entry[0]
+        done.wait(settings.CACHE_FETCH_LOCK_TIMEOUT)
+        entry = cache.get(key)
+        if entry is not None:
+            metrics.add('fetch_coalesced')
+            return entry[0]
+        return _compute(cache, key, compute, timeout)
+
+    lock_key = LOCK_PREFIX + key
+    try:
+        if cache.add(lock_key, 1, settings.CACHE_FETCH_LOCK_TIMEOUT):
+            try:
+                if entry is not None:
+                    metrics.add('fetch_early_refreshes')
+                return _compute(cache, key, compute, timeout)
+            finally:
+                cache.delete(lock_key)
+
+        # Another process is computing it
+        if entry is not None:
+            metrics.add('fetch_stale')
+            return entry[0]
+        deadline = time.monotonic() + settings.CACHE_FETCH_LOCK_TIMEOUT
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            entry = cache.get(key)
+            if entry is not None:
+                metrics.add('fetch_coalesced')
+                return entry[0]
+            if cache.get(lock_key) is None:
+                # It finished without caching anything
+                break
+        return _compute(cache, key, compute, timeout)
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+        done.set()
\ No newline at end of file
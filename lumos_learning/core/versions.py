@@ -0,0 +1,66 @@
+"""
+Version stamps for cached content.
+
+Each key (for example "catalog" or "course:12") maps to a counter in
+ContentVersion that is bumped whenever the content behind it changes.
+Readers embed the current versions in their cache keys, so a bump makes
+stale entries unreachable instead of having to find and delete them.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import ContentVersion
+
+CACHE_PREFIX = 'version:'
+
+
+def _cache_key(key):
+    return f'{CACHE_PREFIX}{key}'
+
+
+def get_versions(keys):
+    """{key: version} for several keys, one query for all cache misses"""
+    keys = list(keys)
+    cache_keys = {_cache_key(key): key for key in keys}
+    cached = cache.get_many(cache_keys.keys())
+    versions = {cache_keys[cache_key]: value for cache_key, value in cached.items()}
+
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        fresh = dict.fromkeys(missing, 0)
+        fresh.update(ContentVersion.objects.filter(key__in=missing).values_list('key', 'version'))
+        cache.set_many(
+            {_cache_key(key): version for key, version in fresh.items()},
+            settings.CONTENT_VERSION_CACHE_TTL,
+        )
+        versions.update(fresh)
+    return versions
+
+
+def get_version(key):
+    return get_versions([key])[key]
+
+
+def _bump_now(keys):
+    # One upsert however many keys are bumped
+    table = connection.ops.quote_name(ContentVersion._meta.db_table)
+    key = connection.ops.quote_name('key')
+    rows = ', '.join(['(%s, 1, %s)'] * len(keys))
+    sql = f"""
+        INSERT INTO {table} ({key}, version, updated_at) VALUES {rows}
+        ON CONFLICT ({key}) DO UPDATE
+            SET version = {table}.version + 1, updated_at = EXCLUDED.updated_at
+    """
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [value for name in keys for value in (name, now)])
+    cache.delete_many([_cache_key(key) for key in keys])
+
+
+def bump(*keys):
+    """Invalidate everything cached under keys once the transaction commits"""
+    keys = list(dict.fromkeys(key for key in keys if key))
+    if keys:
+        transaction.on_commit(lambda: _bump_now(keys))
\ No newline at end of file
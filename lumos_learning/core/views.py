@@ -3,22 +3,56 @@ from django.views.generic import TemplateView
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db import models
+from django.conf import settings
+from django.utils.decorators import method_decorator
 from courses.models import Course, Enrollment
+from courses import catalog, enrollment_counts, pages
 from payments.models import Payment
+from . import stats, versions
+from .conditional import conditional_page
+from .page_cache import cache_anonymous_page
+from .pagination import KeysetPaginator
 
 
+def home_parts(request, *args, **kwargs):
+    """The platform totals shown on the page"""
+    platform = stats.platform()
+    return [platform['published_courses'], platform['students']]
+
+
+@method_decorator(conditional_page(pages.listing_keys, home_parts), name='dispatch')
+@method_decorator(cache_anonymous_page(pages.listing_keys), name='dispatch')
 class HomeView(TemplateView):
     template_name = 'home.html'
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
+        context['catalog_version'] = versions.get_version(catalog.VERSION_KEY)
+        context['fragment_ttl'] = settings.PAGE_CACHE_TTL
         context['featured_courses'] = Course.objects.filter(is_published=True)[:6]
-        context['total_courses'] = Course.objects.filter(is_published=True).count()
-        context['total_students'] = Enrollment.objects.values('student').distinct().count()
+        platform = stats.platform()
+        context['total_courses'] = platform['published_courses']
+        context['total_students'] = platform['students']
         return context
 
 
+def dashboard_keys(request, *args, **kwargs):
+    # Students' enrollments, payments and progress bump their own stamp,
+    # which every signed-in ETag includes
+    return [catalog.VERSION_KEY] if request.user.is_authenticated else None
+
+
+def dashboard_parts(request, *args, **kwargs):
+    """Teachers see counters other users' enrollments and payments move"""
+    user = request.user
+    if user.role != 'teacher':
+        return ()
+    course_ids = list(Course.objects.filter(instructor=user).values_list('id', flat=True))
+    counts = enrollment_counts.active_enrollments(course_ids)
+    return [sorted(stats.for_instructor(user.id).items()), sorted(counts.items())]
+
+
+@method_decorator(conditional_page(dashboard_keys, dashboard_parts), name='dispatch')
 class DashboardView(LoginRequiredMixin, TemplateView):
     template_name = 'dashboard.html'
     
@@ -30,18 +64,18 @@ class DashboardView(LoginRequiredMixin, TemplateView):
             context['enrolled_courses'] = Enrollment.objects.filter(
                 student=user, is_active=True
             ).select_related('course')
-            context['recent_payments'] = Payment.objects.filter(
-                user=user
-            ).order_by('-created_at')[:5]
+            context['recent_payments'] = KeysetPaginator(
+                Payment.objects.filter(user=user).select_related('course', 'material__course'),
+                per_page=5, count='approximate',
+            ).page()
             
         elif user.role == 'teacher':
-            context['my_courses'] = Course.objects.filter(instructor=user)
-            context['total_students'] = Enrollment.objects.filter(
-                course__instructor=user
-            ).count()
-            context['total_revenue'] = Payment.objects.filter(
-                course__instructor=user, status='completed'
-            ).aggregate(total=models.Sum('amount'))['total'] or 0
+            context['my_courses'] = list(Course.objects.filter(instructor=user))
+            # Warm the counter cache for every course row in one query
+            enrollment_counts.active_enrollments(course.id for course in context['my_courses'])
+            totals = stats.for_instructor(user.id)
+            context['total_students'] = totals['enrollments']
+            context['total_revenue'] = totals['revenue']
             
         return context
 
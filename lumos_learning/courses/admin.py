@@ -1,5 +1,9 @@
 from django.contrib import admin
+from django.utils import timezone
+from core import stats
+from core.pagination import EstimatedCountPaginator
 from .models import Category, Course, Material, Enrollment, Progress, Review, Certificate
+from . import catalog, enrollment_counts, pages, ratings
 
 
 @admin.register(Category)
@@ -21,17 +25,24 @@ class CourseAdmin(admin.ModelAdmin):
     list_filter = ('category', 'difficulty', 'is_published', 'is_featured')
     search_fields = ('title', 'instructor__username')
     prepopulated_fields = {'slug': ('title',)}
+    readonly_fields = ('rating_average', 'rating_count')
     inlines = [MaterialInline]
     
     actions = ['publish_courses', 'unpublish_courses']
     
     def publish_courses(self, request, queryset):
-        queryset.update(is_published=True)
+        stats.courses_published(queryset, True)
+        queryset.update(is_published=True, updated_at=timezone.now())
+        catalog.invalidate()
+        pages.invalidate_courses(queryset.values_list('id', flat=True))
         self.message_user(request, f"Published {queryset.count()} courses.")
     publish_courses.short_description = "Publish selected courses"
     
     def unpublish_courses(self, request, queryset):
-        queryset.update(is_published=False)
+        stats.courses_published(queryset, False)
+        queryset.update(is_published=False, updated_at=timezone.now())
+        catalog.invalidate()
+        pages.invalidate_courses(queryset.values_list('id', flat=True))
         self.message_user(request, f"Unpublished {queryset.count()} courses.")
     unpublish_courses.short_description = "Unpublish selected courses"
 
@@ -40,6 +51,7 @@ class CourseAdmin(admin.ModelAdmin):
 class MaterialAdmin(admin.ModelAdmin):
     list_display = ('title', 'course', 'material_type', 'is_free', 'price', 'order')
     list_filter = ('material_type', 'is_free')
+    list_select_related = ('course',)
     search_fields = ('title', 'course__title')
 
 
@@ -47,31 +59,73 @@ class MaterialAdmin(admin.ModelAdmin):
 class EnrollmentAdmin(admin.ModelAdmin):
     list_display = ('student', 'course', 'enrolled_at', 'progress_percentage', 'is_active')
     list_filter = ('is_active', 'enrolled_at')
+    list_select_related = ('student', 'course')
     search_fields = ('student__username', 'course__title')
+    raw_id_fields = ('student', 'course')
+    ordering = ('-enrolled_at',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if change and 'is_active' in form.changed_data:
+            enrollment_counts.enrollment_activity_changed(obj)
 
 
 @admin.register(Progress)
 class ProgressAdmin(admin.ModelAdmin):
     list_display = ('enrollment', 'material', 'is_completed', 'completed_at')
     list_filter = ('is_completed',)
+    list_select_related = ('enrollment__student', 'enrollment__course', 'material__course')
     search_fields = ('enrollment__student__username', 'material__title')
+    raw_id_fields = ('enrollment', 'material')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 @admin.register(Review)
 class ReviewAdmin(admin.ModelAdmin):
     list_display = ('course', 'student', 'rating', 'is_approved', 'created_at')
     list_filter = ('rating', 'is_approved')
+    list_select_related = ('course', 'student')
     search_fields = ('course__title', 'student__username')
     
     actions = ['approve_reviews', 'disapprove_reviews']
     
+    def save_model(self, request, obj, form, change):
+        previous = None
+        if change:
+            previous = Review.objects.filter(pk=obj.pk).values_list('is_approved', 'rating', 'course_id').first()
+        super().save_model(request, obj, form, change)
+        
+        old_rating = previous[1] if previous and previous[0] else None
+        new_rating = obj.rating if obj.is_approved else None
+        if previous and previous[2] != obj.course_id:
+            # A review moved to another course leaves one aggregate and joins the other
+            if old_rating is not None:
+                ratings.review_changed(previous[2], old_rating=old_rating)
+            if new_rating is not None:
+                ratings.review_changed(obj.course_id, new_rating=new_rating)
+        elif old_rating != new_rating:
+            ratings.review_changed(obj.course_id, old_rating=old_rating, new_rating=new_rating)
+    
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        if obj.is_approved:
+            ratings.review_changed(obj.course_id, old_rating=obj.rating)
+    
+    def delete_queryset(self, request, queryset):
+        # Disapproving first takes the ratings out of the course aggregates
+        ratings.set_approval(queryset, approved=False)
+        super().delete_queryset(request, queryset)
+    
     def approve_reviews(self, request, queryset):
-        queryset.update(is_approved=True)
+        ratings.set_approval(queryset, approved=True)
         self.message_user(request, f"Approved {queryset.count()} reviews.")
     approve_reviews.short_description = "Approve selected reviews"
     
     def disapprove_reviews(self, request, queryset):
-        queryset.update(is_approved=False)
+        ratings.set_approval(queryset, approved=False)
         self.message_user(request, f"Disapproved {queryset.count()} reviews.")
     disapprove_reviews.short_description = "Disapprove selected reviews"
 
@@ -80,4 +134,5 @@ class ReviewAdmin(admin.ModelAdmin):
 class CertificateAdmin(admin.ModelAdmin):
     list_display = ('enrollment', 'certificate_id', 'issued_at', 'is_valid')
     list_filter = ('is_valid', 'issued_at')
+    list_select_related = ('enrollment__student', 'enrollment__course')
     search_fields = ('enrollment__student__username', 'certificate_id')
\ No newline at end of file
@@ -1,8 +1,13 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
+from . import api_views
 
 router = DefaultRouter()
+router.register('categories', api_views.CategoryViewSet, basename='api-category')
+router.register('courses', api_views.CourseViewSet, basename='api-course')
+router.register('enrollments', api_views.EnrollmentViewSet, basename='api-enrollment')
 
 urlpatterns = [
+    path('changes/', api_views.ChangesView.as_view(), name='api_changes'),
     path('', include(router.urls)),
 ]
\ No newline at end of file
@@ -0,0 +1,100 @@
+import time
+
+from django.conf import settings
+from django.db.models import Prefetch
+from rest_framework import status, viewsets
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from core.conditional import ConditionalMixin
+
+from . import catalog, pages, sync
+from .models import Category, Enrollment, Progress
+from .serializers import CategorySerializer, CourseSerializer, EnrollmentSerializer
+
+
+class CategoryViewSet(ConditionalMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = Category.objects.order_by('name')
+    serializer_class = CategorySerializer
+    permission_classes = [AllowAny]
+    pagination_class = None
+
+    def get_etag_keys(self, request):
+        return [catalog.VERSION_KEY]
+
+
+class CourseViewSet(ConditionalMixin, viewsets.ReadOnlyModelViewSet):
+    """Published courses with their material outlines, newest first; filter with ?category=<id>"""
+    serializer_class = CourseSerializer
+    permission_classes = [AllowAny]
+
+    def get_etag_keys(self, request):
+        pk = self.kwargs.get('pk')
+        if pk is None:
+            return [catalog.VERSION_KEY]
+        return [pages.course_key(pk)] if str(pk).isdigit() else None
+
+    def get_queryset(self):
+        courses = sync.courses().filter(is_published=True)
+        category = self.request.query_params.get('category')
+        if category and category.isdigit():
+            courses = courses.filter(category_id=category)
+        return courses
+
+
+class EnrollmentViewSet(ConditionalMixin, viewsets.ReadOnlyModelViewSet):
+    """The caller's enrollments with per-material progress"""
+    serializer_class = EnrollmentSerializer
+    keyset_ordering = ('-enrolled_at', '-id')
+
+    def get_etag_keys(self, request):
+        # The caller's own stamp is always part of the ETag
+        return [catalog.VERSION_KEY]
+
+    def get_queryset(self):
+        return (
+            Enrollment.objects.filter(student=self.request.user)
+            .select_related('course')
+            .only(
+                'id', 'course_id', 'course__slug', 'course__title', 'enrolled_at', 'is_active',
+                'progress_percentage', 'completed_materials', 'completed_at',
+            )
+            .prefetch_related(Prefetch('progress', queryset=Progress.objects.only(
+                'id', 'enrollment_id', 'material_id', 'is_completed', 'completed_at',
+                'time_spent_seconds', 'last_position',
+            )))
+        )
+
+
+class ChangesView(ConditionalMixin, APIView):
+    """
+    Catalog delta feed (see courses.sync). Start with no cursor, then pass
+    the returned cursor as ?since= until has_more is false; keep the last
+    cursor for the next sync. 400 means the cursor is not one the feed
+    issued; 410 means it is too old: sync from scratch.
+    """
+    permission_classes = [AllowAny]
+
+    def get_etag_keys(self, request):
+        return [catalog.VERSION_KEY]
+
+    def get_etag_parts(self, request):
+        # The feed's window moves with time even when nothing changes
+        return [int(time.time() // max(settings.CATALOG_SYNC_LAG, 1))]
+
+    def get(self, request):
+        try:
+            changes = sync.changes(request.query_params.get('since'))
+        except sync.InvalidCursor as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except sync.CursorExpired as e:
+            return Response({'detail': str(e)}, status=status.HTTP_410_GONE)
+        context = {'request': request}
+        return Response({
+            'categories': CategorySerializer(changes['categories'], many=True, context=context).data,
+            'courses': CourseSerializer(changes['courses'], many=True, context=context).data,
+            'deleted': changes['deleted'],
+            'cursor': changes['cursor'],
+            'has_more': changes['has_more'],
+        })
\ No newline at end of file
@@ -3,4 +3,7 @@ from django.apps import AppConfig
 
 class CoursesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'courses'
\ No newline at end of file
+    name = 'courses'
+
+    def ready(self):
+        from . import signals  # noqa: F401
\ No newline at end of file
@@ -0,0 +1,401 @@
+"""
+Process-local snapshot of the published catalog.
+
+Published courses are held as compact entries sorted newest first, with a
+bitset per category, difficulty, featured flag and price band (bit i set
+means entry i has that value). Filtering is a handful of integer ANDs,
+facet counts are popcounts, and pages are read straight off the result
+bitmap, so CourseListView answers without touching the database.
+
+The snapshot is tagged with the "catalog" version from core.versions.
+When another process bumps it, the next request refetches only courses
+updated since the last refresh plus the list of published ids (to notice
+unpublished and deleted courses) and rebuilds the bitsets in memory.
+"""
+import threading
+from array import array
+from datetime import timedelta
+
+from django.urls import reverse
+from django.utils import timezone
+
+from core import versions
+from core.pagination import KeysetPage, decode_cursor, encode_cursor
+
+from .models import Category, Course
+
+VERSION_KEY = 'catalog'
+
+# Rows committed slightly out of order with their updated_at are caught by
+# re-reading a short overlap on every incremental refresh
+REFRESH_OVERLAP = timedelta(seconds=60)
+
+PRICE_BANDS = (
+    ('free', 'Free'),
+    ('under-20', 'Under $20'),
+    ('20-50', '$20 - $50'),
+    ('over-50', 'Over $50'),
+)
+
+SORTS = (
+    ('newest', 'Newest'),
+    ('rating', 'Highest rated'),
+    ('price-low', 'Price: low to high'),
+    ('price-high', 'Price: high to low'),
+)
+
+DESCRIPTION_WORDS = 40
+
+_POPCOUNT = bytes(bin(byte).count('1') for byte in range(256))
+
+
+def price_band(price):
+    if price <= 0:
+        return 'free'
+    if price < 20:
+        return 'under-20'
+    if price <= 50:
+        return '20-50'
+    return 'over-50'
+
+
+class CatalogEntry:
+    """The slice of a Course a catalog card needs"""
+    __slots__ = (
+        'id', 'slug', 'title', 'description', 'category_id', 'difficulty', 'is_featured',
+        'price', 'duration_hours', 'rating_average', 'rating_count', 'thumbnail',
+        'created_at', 'updated_at',
+    )
+
+    difficulty_labels = dict(Course.DIFFICULTY_CHOICES)
+    thumbnail_field = Course._meta.get_field('thumbnail')
+
+    def __init__(self, course):
+        self.id = course.id
+        self.slug = course.slug
+        self.title = course.title
+        self.description = ' '.join(course.description.split()[:DESCRIPTION_WORDS])
+        self.category_id = course.category_id
+        self.difficulty = course.difficulty
+        self.is_featured = course.is_featured
+        self.price = course.price
+        self.duration_hours = course.duration_hours
+        self.rating_average = course.rating_average
+        self.rating_count = course.rating_count
+        self.thumbnail = self.thumbnail_field.attr_class(None, self.thumbnail_field, course.thumbnail.name)
+        self.created_at = course.created_at
+        self.updated_at = course.updated_at
+
+    def __repr__(self):
+        return f'<CatalogEntry {self.id} {self.slug}>'
+
+    @property
+    def average_rating(self):
+        return self.rating_average
+
+    def get_difficulty_display(self):
+        return self.difficulty_labels.get(self.difficulty, self.difficulty)
+
+    def get_absolute_url(self):
+        return reverse('course_detail', kwargs={'slug': self.slug})
+
+
+class CatalogSnapshot:
+    def __init__(self, entries, categories, version, refreshed_at):
+        self.version = version
+        self.refreshed_at = refreshed_at
+        self.categories = categories
+        self.categories_by_slug = {category.slug: category for category in categories}
+
+        self.entries = sorted(entries, key=lambda entry: (entry.created_at, entry.id), reverse=True)
+        self.size = len(self.entries)
+        self.ids = array('q', (entry.id for entry in self.entries))
+        self.positions = {entry.id: position for position, entry in enumerate(self.entries)}
+        self.slugs = {entry.slug: entry.id for entry in self.entries}
+        self.all = (1 << self.size) - 1
+
+        flags = {}
+        for position, entry in enumerate(self.entries):
+            for key in (
+                ('category', entry.category_id),
+                ('difficulty', entry.difficulty),
+                ('featured', entry.is_featured),
+                ('price', price_band(entry.price)),
+            ):
+                bitmap = flags.get(key)
+                if bitmap is None:
+                    bitmap = flags[key] = bytearray((self.size + 7) // 8)
+                bitmap[position >> 3] |= 1 << (position & 7)
+        self.bits = {key: int.from_bytes(bitmap, 'little') for key, bitmap in flags.items()}
+
+        # Alternative orders as permutations of positions, with their inverses
+        self.orders = {
+            'rating': self._order(lambda entry: (-entry.rating_average, -entry.rating_count)),
+            'price-low': self._order(lambda entry: entry.price),
+            'price-high': self._order(lambda entry: -entry.price),
+        }
+        self.ranks = {}
+        for name, order in self.orders.items():
+            ranks = array('l', bytes(order.itemsize * self.size))
+            for rank, position in enumerate(order):
+                ranks[position] = rank
+            self.ranks[name] = ranks
+
+    def _order(self, key):
+        return array('l', sorted(range(self.size), key=lambda position: key(self.entries[position])))
+
+    def entry(self, course_id):
+        position = self.positions.get(course_id)
+        return None if position is None else self.entries[position]
+
+    def _mask(self, filters, skip=None):
+        mask = self.all
+        for name, value in filters.items():
+            if name != skip and value is not None:
+                mask &= self.bits.get((name, value), 0)
+        return mask
+
+    def query(self, category=None, difficulty=None, price=None, featured=None,
+              ranked_ids=None, sort='newest'):
+        """
+        Filter the catalog. category is a slug; ranked_ids (search results)
+        restricts and orders the result. Returns a CatalogResult.
+        """
+        filters = {'difficulty': difficulty or None, 'price': price or None, 'featured': featured}
+        if category:
+            category_obj = self.categories_by_slug.get(category)
+            filters['category'] = category_obj.id if category_obj else -1
+        mask = self._mask(filters)
+
+        order = ranks = None
+        if ranked_ids is not None:
+            order = array('l', (self.positions[course_id] for course_id in ranked_ids
+                                if course_id in self.positions))
+            ranks = {position: rank for rank, position in enumerate(order)}
+        elif sort in self.orders:
+            order = self.orders[sort]
+            ranks = self.ranks[sort]
+
+        return CatalogResult(self, mask, order, filters, ranks)
+
+    def facets(self, result):
+        """
+        Counts per category, difficulty and price band for a result, each
+        ignoring its own filter so the counts show what selecting it gives.
+        """
+        base = result.search_mask
+        counts = {}
+        for name in ('category', 'difficulty', 'price'):
+            mask = self._mask(result.filters, skip=name) & base
+            counts[name] = {
+                value: (mask & bits).bit_count()
+                for (bit_name, value), bits in self.bits.items() if bit_name == name
+            }
+        return counts
+
+
+class CatalogResult:
+    """A lazily sliced, sized sequence of CatalogEntry for Paginator"""
+
+    def __init__(self, snapshot, mask, order, filters, ranks=None):
+        self.snapshot = snapshot
+        self.filters = filters
+        self.order = order
+        self.ranks = ranks
+        if order is not None and len(order) != snapshot.size:
+            # Search results: only the matched positions take part
+            search_mask = bytearray((snapshot.size + 7) // 8)
+            for position in order:
+                search_mask[position >> 3] |= 1 << (position & 7)
+            self.search_mask = int.from_bytes(search_mask, 'little')
+        else:
+            self.search_mask = snapshot.all
+        self.mask = mask & self.search_mask
+        self._count = self.mask.bit_count()
+        self._bitmap = None
+
+    def __len__(self):
+        return self._count
+
+    def count(self):
+        return self._count
+
+    def _positions(self, start, stop):
+        if self.order is None:
+            yield from self._scan(start, stop)
+            return
+        if self._bitmap is None:
+            self._bitmap = self.mask.to_bytes((self.snapshot.size + 7) // 8, 'little')
+        bitmap = self._bitmap
+        seen = 0
+        for position in self.order:
+            if bitmap[position >> 3] >> (position & 7) & 1:
+                if seen >= stop:
+                    return
+                if seen >= start:
+                    yield position
+                seen += 1
+
+    def _scan(self, start, stop):
+        """Positions of the start-th to stop-th set bits in ascending order"""
+        bitmap = self.mask.to_bytes((self.snapshot.size + 7) // 8, 'little')
+        seen = 0
+        for index, byte in enumerate(bitmap):
+            if not byte:
+                continue
+            ones = _POPCOUNT[byte]
+            if seen + ones <= start:
+                seen += ones
+                continue
+            for bit in range(8):
+                if byte >> bit & 1:
+                    if seen >= stop:
+                        return
+                    if seen >= start:
+                        yield index * 8 + bit
+                    seen += 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._count)
+            entries = [self.snapshot.entries[position] for position in self._positions(start, stop)]
+            return entries[::step] if step != 1 else entries
+        if index < 0:
+            index += self._count
+        for position in self._positions(index, index + 1):
+            return self.snapshot.entries[position]
+        raise IndexError(index)
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def _rank(self, position):
+        if self.order is None:
+            return position
+        if isinstance(self.ranks, dict):
+            return self.ranks.get(position)
+        return self.ranks[position]
+
+    def _walk(self, rank, step):
+        """Matching positions from rank onwards (step 1) or backwards (step -1)"""
+        if self._bitmap is None:
+            self._bitmap = self.mask.to_bytes((self.snapshot.size + 7) // 8, 'little')
+        bitmap = self._bitmap
+        sequence = self.order
+        length = self.snapshot.size if sequence is None else len(sequence)
+        while 0 <= rank < length:
+            position = rank if sequence is None else sequence[rank]
+            if bitmap[position >> 3] >> (position & 7) & 1:
+                yield position
+            rank += step
+
+    def _take(self, positions, limit):
+        taken = []
+        for position in positions:
+            taken.append(position)
+            if len(taken) == limit:
+                break
+        return taken
+
+    def keyset_page(self, cursor, per_page):
+        """
+        A KeysetPage of entries after (or before) the entry the cursor was
+        issued for. Cursors carry the entry id and its rank so a page still
+        resolves if that course has since left the catalog.
+        """
+        values, direction = decode_cursor(cursor)
+        anchor = None
+        if isinstance(values, list) and len(values) == 2:
+            course_id, rank = values
+            position = self.snapshot.positions.get(course_id)
+            anchor = self._rank(position) if position is not None else None
+            if anchor is None and isinstance(rank, int):
+                anchor = rank - 1 if direction == 'next' else rank
+
+        if anchor is None:
+            positions = self._take(self._walk(0, 1), per_page + 1)
+            has_previous, has_next = False, len(positions) > per_page
+            positions = positions[:per_page]
+        elif direction == 'next':
+            positions = self._take(self._walk(anchor + 1, 1), per_page + 1)
+            has_previous, has_next = True, len(positions) > per_page
+            positions = positions[:per_page]
+        else:
+            positions = self._take(self._walk(anchor - 1, -1), per_page + 1)
+            has_previous, has_next = len(positions) > per_page, True
+            positions = positions[:per_page][::-1]
+
+        entries = [self.snapshot.entries[position] for position in positions]
+
+        def cursor_for(position, direction):
+            return encode_cursor([self.snapshot.ids[position], self._rank(position)], direction)
+
+        return KeysetPage(
+            entries,
+            next_cursor=cursor_for(positions[-1], 'next') if positions and has_next else None,
+            previous_cursor=cursor_for(positions[0], 'previous') if positions and has_previous else None,
+            total=self._count,
+        )
+
+
+_snapshot = None
+_lock = threading.Lock()
+
+
+def _published():
+    return Course.objects.filter(is_published=True).only(
+        'id', 'slug', 'title', 'description', 'category_id', 'difficulty', 'is_featured', 'price',
+        'duration_hours', 'rating_average', 'rating_count', 'thumbnail', 'created_at', 'updated_at',
+    ).order_by()
+
+
+def _build(version):
+    refreshed_at = timezone.now()
+    entries = [CatalogEntry(course) for course in _published().iterator(chunk_size=2000)]
+    return CatalogSnapshot(entries, list(Category.objects.order_by('name')), version, refreshed_at)
+
+
+def _refresh(snapshot, version):
+    """Bring snapshot up to date by fetching only what changed"""
+    refreshed_at = timezone.now()
+    published_ids = set(Course.objects.filter(is_published=True).values_list('id', flat=True))
+
+    entries = {entry.id: entry for entry in snapshot.entries if entry.id in published_ids}
+    changed = _published().filter(updated_at__gte=snapshot.refreshed_at - REFRESH_OVERLAP)
+    missing = published_ids - entries.keys()
+    for course in changed:
+        entries[course.id] = CatalogEntry(course)
+        missing.discard(course.id)
+    if missing:
+        # Published by a bulk update that did not touch updated_at
+        for course in _published().filter(id__in=missing):
+            entries[course.id] = CatalogEntry(course)
+
+    categories = list(Category.objects.order_by('name'))
+    return CatalogSnapshot(entries.values(), categories, version, refreshed_at)
+
+
+def get_snapshot():
+    """The current catalog snapshot, refreshed if the catalog version moved"""
+    global _snapshot
+    version = versions.get_version(VERSION_KEY)
+    snapshot = _snapshot
+    if snapshot is not None and snapshot.version == version:
+        return snapshot
+
+    # One thread refreshes; the others keep serving the previous snapshot
+    if not _lock.acquire(blocking=snapshot is None):
+        return snapshot
+    try:
+        if _snapshot is None:
+            _snapshot = _build(version)
+        elif _snapshot.version != version:
+            _snapshot = _refresh(_snapshot, version)
+        return _snapshot
+    finally:
+        _lock.release()
+
+
+def invalidate():
+    """Mark the catalog as changed for every process"""
+    versions.bump(VERSION_KEY)
\ No newline at end of file
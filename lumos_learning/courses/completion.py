@@ -0,0 +1,119 @@
+"""
+Material completion and course progress.
+
+Marking a material done is a single upsert into Progress that only returns
+a row when it actually flips to completed. Only then is the enrollment's
+stored completed_materials bumped, again in one statement that also sets
+progress_percentage and, on the last material, completed_at. Totals come
+from Course.material_count, which is kept in step when materials are
+added or removed; courses whose count was never filled in are recounted
+on their first completion.
+"""
+import uuid
+
+from django.db import connection, transaction
+from django.db.models import Case, Count, F, IntegerField, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from core.conditional import touch_users
+
+from .models import Certificate, Course, Enrollment, Material, Progress
+
+
+def _upsert_completed(enrollment_id, material_id, now):
+    """Mark one Progress row completed; True if it was not completed before"""
+    table = connection.ops.quote_name(Progress._meta.db_table)
+    sql = f"""
+        INSERT INTO {table}
+            (enrollment_id, material_id, is_completed, completed_at,
+             time_spent_minutes, time_spent_seconds, last_position)
+        VALUES (%s, %s, %s, %s, 0, 0, 0)
+        ON CONFLICT (enrollment_id, material_id) DO UPDATE
+            SET is_completed = EXCLUDED.is_completed, completed_at = EXCLUDED.completed_at
+            WHERE NOT {table}.is_completed
+        RETURNING id
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [enrollment_id, material_id, True, now])
+        return cursor.fetchone() is not None
+
+
+def _count_completion(enrollment_id, total, now):
+    """Add one completed material; returns (progress_percentage, completed_materials, student_id)"""
+    table = connection.ops.quote_name(Enrollment._meta.db_table)
+    sql = f"""
+        UPDATE {table} SET
+            completed_materials = completed_materials + 1,
+            progress_percentage = CASE
+                WHEN completed_materials + 1 >= %(total)s THEN 100
+                ELSE (completed_materials + 1) * 100 / %(total)s
+            END,
+            completed_at = CASE
+                WHEN completed_at IS NULL AND completed_materials + 1 >= %(total)s THEN %(now)s
+                ELSE completed_at
+            END
+        WHERE id = %(id)s
+        RETURNING progress_percentage, completed_materials, student_id
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, {'total': max(total, 1), 'now': now, 'id': enrollment_id})
+        return cursor.fetchone()
+
+
+def issue_certificate(enrollment_id):
+    Certificate.objects.bulk_create(
+        [Certificate(enrollment_id=enrollment_id, certificate_id=f'LUMOS-{uuid.uuid4().hex[:12].upper()}')],
+        ignore_conflicts=True,
+    )
+
+
+def course_completed(enrollment_id):
+    """Downstream work for an enrollment that just reached 100%"""
+    issue_certificate(enrollment_id)
+
+
+def mark_completed(enrollment_id, material_id, total):
+    """
+    Record material_id as completed for the enrollment, where total is the
+    course's material_count. Returns the new progress percentage, or None
+    if the material had already been completed.
+    """
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    with transaction.atomic():
+        if not total:
+            # The course has at least this material, so its counts predate
+            # material_count being kept: backfill them before counting
+            course_id = Material.objects.filter(pk=material_id).values_list('course_id', flat=True).first()
+            total = recount(course_id)
+        if not _upsert_completed(enrollment_id, material_id, now):
+            return None
+        percentage, completed, student_id = _count_completion(enrollment_id, total, now)
+        touch_users(student_id)
+        # Completions are serialized on the enrollment row, so exactly one
+        # request sees the count reach the total
+        if completed == total:
+            course_completed(enrollment_id)
+    return percentage
+
+
+def recount(course_id):
+    """
+    Recompute a course's material_count and its enrollments' completed
+    counts and percentages, for when materials are added or removed.
+    """
+    total = Material.objects.filter(course_id=course_id).count()
+    Course.objects.filter(pk=course_id).update(material_count=total)
+
+    completed = Progress.objects.filter(
+        enrollment=OuterRef('pk'), is_completed=True
+    ).values('enrollment').annotate(n=Count('id')).values('n')
+    enrollments = Enrollment.objects.filter(course_id=course_id)
+    enrollments.update(completed_materials=Coalesce(Subquery(completed), 0))
+    enrollments.update(progress_percentage=Case(
+        When(completed_materials__gte=max(total, 1), then=Value(100)),
+        default=F('completed_materials') * 100 / max(total, 1),
+        output_field=IntegerField(),
+    ))
+    touch_users(*enrollments.values_list('student_id', flat=True).distinct())
+    return total
\ No newline at end of file
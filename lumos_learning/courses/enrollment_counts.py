@@ -0,0 +1,82 @@
+"""
+Active enrollment counts per course and distinct enrolled students,
+kept in core.counters so enroll_course never locks the Course row. The
+Enrollment signals keep the course counts; core.stats keeps the distinct
+student count.
+"""
+from django.db.models import Count
+
+from core import counters
+
+DISTINCT_STUDENTS = 'students:distinct'
+
+
+def course_counter(course_id):
+    return f'course:{course_id}:enrollments'
+
+
+def enrollment_created(enrollment):
+    """Count a new enrollment once its transaction commits"""
+    if enrollment.is_active:
+        counters.increment_on_commit(course_counter(enrollment.course_id))
+
+
+def enrollment_deleted(enrollment):
+    """Uncount a deleted enrollment once its transaction commits"""
+    if enrollment.is_active:
+        counters.increment_on_commit(course_counter(enrollment.course_id), -1)
+
+
+def enrollment_activity_changed(enrollment):
+    """Adjust the course counter after is_active was toggled"""
+    counters.increment_on_commit(
+        course_counter(enrollment.course_id), 1 if enrollment.is_active else -1
+    )
+
+
+def active_enrollments(course_ids, use_cache=True):
+    """{course_id: active enrollments} for several courses at once"""
+    course_ids = list(course_ids)
+    values = counters.get_values(
+        (course_counter(course_id) for course_id in course_ids), use_cache=use_cache
+    )
+    return {course_id: values[course_counter(course_id)] for course_id in course_ids}
+
+
+def distinct_students(use_cache=True):
+    return counters.get_values([DISTINCT_STUDENTS], use_cache=use_cache)[DISTINCT_STUDENTS]
+
+
+def reconcile(dry_run=False, batch_size=1000):
+    """
+    Recount everything from the Enrollment table and overwrite counters that
+    have drifted. Returns {counter name: (stored, actual)} for the drift found.
+    """
+    from .models import Course, Enrollment
+
+    drift = {}
+
+    actual = dict(
+        Enrollment.objects.filter(is_active=True)
+        .values_list('course_id')
+        .annotate(total=Count('id'))
+        .order_by()
+    )
+    course_ids = list(Course.objects.order_by('id').values_list('id', flat=True))
+    for start in range(0, len(course_ids), batch_size):
+        batch = course_ids[start:start + batch_size]
+        stored = active_enrollments(batch, use_cache=False)
+        for course_id in batch:
+            expected = actual.get(course_id, 0)
+            if stored[course_id] != expected:
+                drift[course_counter(course_id)] = (stored[course_id], expected)
+
+    students = Enrollment.objects.values('student').distinct().count()
+    stored_students = distinct_students(use_cache=False)
+    if stored_students != students:
+        drift[DISTINCT_STUDENTS] = (stored_students, students)
+
+    if not dry_run:
+        for name, (_, expected) in drift.items():
+            counters.set_value(name, expected)
+    return drift
@@ -0,0 +1,105 @@
+"""
+What each user may open.
+
+A user's enrollments and completed course and material purchases are
+loaded in one pass and cached under a per-user version stamp (see
+core.versions). Payment and enrollment changes bump the stamp, so viewers
+never re-query them on every click.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+
+from core import conditional, versions
+from payments.models import Payment
+
+from .models import Enrollment
+
+
+def version_key(user_id):
+    return f'entitlements:{user_id}'
+
+
+def invalidate(*user_ids):
+    """Drop cached entitlements for users once the transaction commits"""
+    user_ids = [user_id for user_id in user_ids if user_id]
+    versions.bump(
+        *(version_key(user_id) for user_id in user_ids),
+        *(conditional.user_key(user_id) for user_id in user_ids),
+    )
+
+
+class Entitlements:
+    def __init__(self, enrollments=None, courses=(), materials=()):
+        # {course id: enrollment id}
+        self.enrollments = enrollments or {}
+        self.purchased_courses = frozenset(courses)
+        self.purchased_materials = frozenset(materials)
+
+    @classmethod
+    def load(cls, user_id):
+        enrollments = dict(
+            Enrollment.objects.filter(student_id=user_id).values_list('course_id', 'id')
+        )
+        courses = set()
+        materials = set()
+        purchases = Payment.objects.filter(user_id=user_id, status='completed').filter(
+            Q(course__isnull=False) | Q(material__isnull=False)
+        ).values_list('course_id', 'material_id')
+        for course_id, material_id in purchases:
+            if course_id:
+                courses.add(course_id)
+            if material_id:
+                materials.add(material_id)
+        return cls(enrollments, courses, materials)
+
+    def to_cache(self):
+        return (self.enrollments, list(self.purchased_courses), list(self.purchased_materials))
+
+    def is_enrolled(self, course_id):
+        return course_id in self.enrollments
+
+    def enrollment_id(self, course_id):
+        return self.enrollments.get(course_id)
+
+    def is_first_episode(self, material):
+        """For videos, the first episode is always free"""
+        return material.material_type == 'video' and material.order == 1
+
+    def can_access(self, material):
+        """Whether an enrolled student may open material in full"""
+        return (
+            material.is_free
+            or self.is_first_episode(material)
+            or material.id in self.purchased_materials
+            or material.course_id in self.purchased_courses
+        )
+
+    def accessible(self, materials):
+        """Ids of materials that may be opened in full"""
+        return {
+            material.id for material in materials
+            if self.is_enrolled(material.course_id) and self.can_access(material)
+        }
+
+
+ANONYMOUS = Entitlements()
+
+
+def for_user(user):
+    """Entitlements for user, memoized on the user object for the request"""
+    if not user.is_authenticated:
+        return ANONYMOUS
+    cached = getattr(user, '_entitlements', None)
+    if cached is not None:
+        return cached
+
+    key = f'{version_key(user.pk)}:{versions.get_version(version_key(user.pk))}'
+    data = cache.get(key)
+    if data is not None:
+        entitlements = Entitlements(*data)
+    else:
+        entitlements = Entitlements.load(user.pk)
+        cache.set(key, entitlements.to_cache(), settings.ENTITLEMENT_CACHE_TTL)
+    user._entitlements = entitlements
+    return entitlements
\ No newline at end of file
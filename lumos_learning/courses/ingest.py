@@ -0,0 +1,307 @@
+"""
+Write-behind buffer for player heartbeats.
+
+Events are coalesced per (enrollment, material) as they arrive: watched
+seconds add up, the latest position wins and completion sticks. The
+buffer lives in this process, or in Redis when REDIS_URL is set so every
+worker shares it, and is flushed in chunks by the flush_progress Celery
+task, queued when a flush is due and run by beat every
+PROGRESS_FLUSH_INTERVAL seconds. Without a broker the flush runs
+synchronously once it is due; if it fails the events stay buffered.
+Events the database refuses (e.g. for a deleted enrollment) are dropped
+instead, so they can't hold back everything queued after them.
+"""
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import DataError, IntegrityError, connection, transaction
+from django.dispatch import Signal
+
+from core.conditional import touch_users
+
+from . import completion
+from .models import Enrollment, Material, Progress
+
+logger = logging.getLogger(__name__)
+
+# Longest a single heartbeat may claim, in seconds
+MAX_EVENT_SECONDS = 300
+
+# Sent with rows=[(material_id, seconds)] inside the transaction that
+# wrote them
+watch_time_written = Signal()
+
+
+def coalesce(buffer, key, seconds, position, completed):
+    """Merge one event into a {key: [seconds, position, completed]} dict"""
+    entry = buffer.get(key)
+    if entry is None:
+        buffer[key] = [seconds, position, completed]
+    else:
+        entry[0] += seconds
+        if position is not None:
+            entry[1] = position
+        entry[2] = entry[2] or completed
+
+
+class LocalBuffer:
+    def __init__(self):
+        self._events = {}
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+    def add(self, events):
+        with self._lock:
+            for key, seconds, position, completed in events:
+                coalesce(self._events, key, seconds, position, completed)
+            return len(self._events)
+
+    def drain(self):
+        with self._lock:
+            events, self._events = self._events, {}
+            self._last_flush = time.monotonic()
+        return events
+
+    def flush_due(self, size):
+        interval = settings.PROGRESS_FLUSH_INTERVAL
+        return size >= settings.PROGRESS_BUFFER_MAX or time.monotonic() - self._last_flush >= interval
+
+
+class RedisBuffer:
+    """Three hashes keyed "enrollment:material", drained atomically"""
+    SECONDS = 'progress:buffer:seconds'
+    POSITION = 'progress:buffer:position'
+    COMPLETED = 'progress:buffer:completed'
+    SCHEDULED = 'progress:buffer:scheduled'
+
+    DRAIN_SCRIPT = """
+        local drained = {}
+        for i, key in ipairs(KEYS) do
+            drained[i] = redis.call('HGETALL', key)
+            redis.call('DEL', key)
+        end
+        return drained
+    """
+
+    def __init__(self, url):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self._drain = self.client.register_script(self.DRAIN_SCRIPT)
+
+    def add(self, events):
+        pipe = self.client.pipeline(transaction=False)
+        for (enrollment_id, material_id), seconds, position, completed in events:
+            field = f'{enrollment_id}:{material_id}'
+            if seconds:
+                pipe.hincrby(self.SECONDS, field, seconds)
+            if position is not None:
+                pipe.hset(self.POSITION, field, position)
+            if completed:
+                pipe.hset(self.COMPLETED, field, 1)
+        pipe.hlen(self.SECONDS)
+        return pipe.execute()[-1]
+
+    def drain(self):
+        seconds, positions, completed = self._drain(keys=[self.SECONDS, self.POSITION, self.COMPLETED])
+        events = {}
+
+        def parse(flat):
+            for i in range(0, len(flat), 2):
+                enrollment_id, material_id = flat[i].decode().split(':')
+                yield (int(enrollment_id), int(material_id)), int(flat[i + 1])
+
+        for key, value in parse(seconds):
+            coalesce(events, key, value, None, False)
+        for key, value in parse(positions):
+            coalesce(events, key, 0, value, False)
+        for key, _ in parse(completed):
+            coalesce(events, key, 0, None, True)
+        return events
+
+    def flush_due(self, size):
+        # Only the first writer in each interval schedules a flush
+        if size >= settings.PROGRESS_BUFFER_MAX:
+            return True
+        return bool(self.client.set(self.SCHEDULED, 1, nx=True, ex=settings.PROGRESS_FLUSH_INTERVAL))
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer():
+    global _buffer
+    with _buffer_lock:
+        if _buffer is None:
+            url = getattr(settings, 'REDIS_URL', '')
+            _buffer = RedisBuffer(url) if url else LocalBuffer()
+        return _buffer
+
+
+def record(events):
+    """
+    Buffer [((enrollment_id, material_id), seconds, position, completed)]
+    and schedule a flush when one is due.
+    """
+    events = [
+        (key, max(0, min(int(seconds or 0), MAX_EVENT_SECONDS)),
+         None if position is None else max(0, int(position)), bool(completed))
+        for key, seconds, position, completed in events
+    ]
+    if not events:
+        return 0
+    buffer = get_buffer()
+    size = buffer.add(events)
+    if buffer.flush_due(size):
+        try:
+            schedule_flush()
+        except Exception:
+            # The events are buffered already; the next flush retries them
+            logger.exception('Flushing buffered progress failed')
+    return len(events)
+
+
+def schedule_flush():
+    """Flush on a Celery worker when the buffer is shared, else right here"""
+    if isinstance(get_buffer(), RedisBuffer) and getattr(settings, 'CELERY_BROKER_URL', ''):
+        from .tasks import flush_progress
+        try:
+            flush_progress.delay()
+            return
+        except Exception:
+            logger.warning('Could not queue flush_progress, flushing synchronously', exc_info=True)
+    flush()
+
+
+def _upsert(rows):
+    """
+    Add watched seconds and set positions for [(enrollment_id, material_id,
+    seconds, position)] in one statement.
+    """
+    table = connection.ops.quote_name(Progress._meta.db_table)
+    values = ', '.join(['(%s, %s, %s, %s, %s, %s)'] * len(rows))
+    params = []
+    for enrollment_id, material_id, seconds, position in rows:
+        params += [enrollment_id, material_id, False, seconds, seconds // 60, position or 0]
+    sql = f"""
+        INSERT INTO {table}
+            (enrollment_id, material_id, is_completed, time_spent_seconds, time_spent_minutes, last_position)
+        VALUES {values}
+        ON CONFLICT (enrollment_id, material_id) DO UPDATE SET
+            time_spent_seconds = {table}.time_spent_seconds + EXCLUDED.time_spent_seconds,
+            time_spent_minutes = ({table}.time_spent_seconds + EXCLUDED.time_spent_seconds) / 60,
+            -- Events without a position are sent as 0
+            last_position = CASE
+                WHEN EXCLUDED.last_position > 0 THEN EXCLUDED.last_position
+                ELSE {table}.last_position
+            END
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def write(chunk):
+    """Write [((enrollment_id, material_id), (seconds, position, completed))]"""
+    with transaction.atomic():
+        _upsert([
+            (enrollment_id, material_id, seconds, position)
+            for (enrollment_id, material_id), (seconds, position, _) in chunk
+        ])
+        watch_time_written.send(
+            sender=Progress,
+            rows=[(material_id, seconds) for (_, material_id), (seconds, _, _) in chunk],
+        )
+        touch_users(*(
+            Enrollment.objects.filter(id__in={enrollment_id for (enrollment_id, _), _ in chunk})
+            .values_list('student_id', flat=True).distinct()
+        ))
+
+        # In the same transaction, so a chunk put back after a failure
+        # doesn't add its seconds twice
+        finished = [key for key, (_, _, completed) in chunk if completed]
+        if finished:
+            totals = dict(
+                Material.objects.filter(id__in={material_id for _, material_id in finished})
+                .values_list('id', 'course__material_count')
+            )
+            for enrollment_id, material_id in finished:
+                if material_id in totals:
+                    completion.mark_completed(enrollment_id, material_id, totals[material_id])
+
+
+def _live(items):
+    """items without those whose enrollment or material has been deleted"""
+    enrollment_ids = set(Enrollment.objects.filter(
+        id__in={enrollment_id for (enrollment_id, _), _ in items}
+    ).values_list('id', flat=True))
+    material_ids = set(Material.objects.filter(
+        id__in={material_id for (_, material_id), _ in items}
+    ).values_list('id', flat=True))
+    live = [
+        item for item in items
+        if item[0][0] in enrollment_ids and item[0][1] in material_ids
+    ]
+    if len(live) < len(items):
+        logger.info('Dropped progress for %d deleted enrollments or materials', len(items) - len(live))
+    return live
+
+
+def _write_rows(buffer, chunk, rest):
+    """Write a refused chunk row by row, dropping the rows that fail"""
+    written = 0
+    for index, item in enumerate(chunk):
+        try:
+            write([item])
+        except (IntegrityError, DataError):
+            logger.warning('Dropped unwritable progress for %s', item[0], exc_info=True)
+        except Exception:
+            buffer.add([(key, *values) for key, values in chunk[index:] + rest])
+            raise
+        else:
+            written += 1
+    return written
+
+
+def flush():
+    """
+    Drain the buffer into Progress in PROGRESS_FLUSH_CHUNK sized chunks and
+    return how many rows were written. When the database is unavailable,
+    the unwritten events are put back for the next flush.
+    """
+    buffer = get_buffer()
+    items = list(buffer.drain().items())
+    if not items:
+        return 0
+    try:
+        items = _live(items)
+    except Exception:
+        buffer.add([(key, *values) for key, values in items])
+        raise
+    chunk_size = settings.PROGRESS_FLUSH_CHUNK
+    written = 0
+    for start in range(0, len(items), chunk_size):
+        chunk = items[start:start + chunk_size]
+        try:
+            write(chunk)
+        except (IntegrityError, DataError):
+            written += _write_rows(buffer, chunk, items[start + chunk_size:])
+        except Exception:
+            buffer.add([(key, *values) for key, values in items[start:]])
+            raise
+        else:
+            written += len(chunk)
+    return written
+
+
+@atexit.register
+def _flush_on_exit():
+    # Don't lose an in-process buffer when a worker shuts down
+    if isinstance(_buffer, LocalBuffer):
+        try:
+            flush()
+        except Exception:
+            logger.exception('Could not flush buffered progress on exit')
\ No newline at end of file
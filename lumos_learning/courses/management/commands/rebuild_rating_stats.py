@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from courses import ratings
+
+
+class Command(BaseCommand):
+    help = 'Rebuild course rating aggregates from approved reviews and report drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Only report drifted courses, do not write')
+        parser.add_argument('--course', type=int, action='append', dest='course_ids',
+                            help='Limit to the given course id (repeatable)')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        drifted = ratings.rebuild(
+            course_ids=options['course_ids'],
+            batch_size=options['batch_size'],
+            dry_run=options['check'],
+        )
+
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS('Rating aggregates are in sync'))
+            return
+
+        ids = ', '.join(str(course_id) for course_id in drifted[:20])
+        if len(drifted) > 20:
+            ids += ', ...'
+        if options['check']:
+            self.stdout.write(self.style.WARNING(f'{len(drifted)} courses have drifted: {ids}'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Rebuilt rating aggregates for {len(drifted)} courses: {ids}'))
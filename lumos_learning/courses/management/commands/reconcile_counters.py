@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from courses import enrollment_counts
+
+
+class Command(BaseCommand):
+    help = 'Recount enrollment counters from the Enrollment table and fix drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Only report drifted counters, do not write')
+
+    def handle(self, *args, **options):
+        drift = enrollment_counts.reconcile(dry_run=options['check'])
+
+        if not drift:
+            self.stdout.write(self.style.SUCCESS('Enrollment counters are in sync'))
+            return
+
+        for name, (stored, actual) in sorted(drift.items()):
+            self.stdout.write(f'{name}: stored {stored}, actual {actual}')
+        verb = 'drifted' if options['check'] else 'reconciled'
+        self.stdout.write(self.style.WARNING(f'{len(drift)} counters {verb}'))
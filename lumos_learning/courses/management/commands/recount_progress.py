@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from courses import completion
+from courses.models import Course
+
+
+class Command(BaseCommand):
+    help = 'Recompute stored material counts and enrollment progress from Progress rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--course', type=int, action='append', dest='courses',
+                            help='Only recount this course id (repeatable)')
+
+    def handle(self, *args, **options):
+        course_ids = options['courses'] or Course.objects.values_list('id', flat=True)
+        recounted = 0
+        for course_id in course_ids:
+            completion.recount(course_id)
+            recounted += 1
+        self.stdout.write(self.style.SUCCESS(f'Recounted progress for {recounted} courses'))
\ No newline at end of file
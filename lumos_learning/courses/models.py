@@ -1,3 +1,5 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from django.conf import settings
 from django.urls import reverse
@@ -9,9 +11,12 @@ class Category(models.Model):
     description = models.TextField(blank=True)
     slug = models.SlugField(unique=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         verbose_name_plural = "Categories"
+        # Delta sync feed (courses.sync)
+        indexes = [models.Index(fields=['updated_at', 'id'])]
 
     def __str__(self):
         return self.name
@@ -38,8 +43,30 @@ class Course(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Approved review aggregates, maintained incrementally by courses.ratings
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_1_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_2_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_3_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_4_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_5_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_average = models.DecimalField(max_digits=3, decimal_places=2, default=0, editable=False)
+
+    # Maintained by courses.completion when materials are added or removed
+    material_count = models.PositiveIntegerField(default=0, editable=False)
+
+    # Weighted tsvector kept by PostgresSearchBackend; unused elsewhere
+    search_vector = SearchVectorField(null=True, editable=False)
+
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['updated_at', 'id']),
+            GinIndex(fields=['search_vector'], name='course_search_vector'),
+            # Needs pg_trgm, installed before migrating (see courses.signals)
+            GinIndex(fields=['title'], name='course_title_trgm', opclasses=['gin_trgm_ops']),
+        ]
 
     def __str__(self):
         return self.title
@@ -49,14 +76,17 @@ class Course(models.Model):
 
     @property
     def average_rating(self):
-        reviews = self.reviews.all()
-        if reviews:
-            return sum([review.rating for review in reviews]) / len(reviews)
-        return 0
+        return self.rating_average
+
+    @property
+    def rating_histogram(self):
+        """(stars, count) pairs from 5 stars down to 1"""
+        return [(stars, getattr(self, f'rating_{stars}_count')) for stars in range(5, 0, -1)]
 
     @property
     def total_enrollments(self):
-        return self.enrollments.filter(is_active=True).count()
+        from .enrollment_counts import active_enrollments
+        return active_enrollments([self.id])[self.id]
 
 
 class Material(models.Model):
@@ -76,6 +106,11 @@ class Material(models.Model):
     price = models.DecimalField(max_digits=8, decimal_places=2, default=0.00)
     duration_minutes = models.PositiveIntegerField(default=0, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    # PDF derivatives are keyed by the file's content hash, see courses.previews
+    file_hash = models.CharField(max_length=64, blank=True, editable=False)
+    page_count = models.PositiveIntegerField(blank=True, null=True, editable=False)
 
     class Meta:
         ordering = ['order']
@@ -90,10 +125,16 @@ class Enrollment(models.Model):
     enrolled_at = models.DateTimeField(auto_now_add=True)
     is_active = models.BooleanField(default=True)
     progress_percentage = models.PositiveIntegerField(default=0)
+    completed_materials = models.PositiveIntegerField(default=0, editable=False)
     completed_at = models.DateTimeField(blank=True, null=True)
 
     class Meta:
         unique_together = ['student', 'course']
+        # Admin changelist filters and ordering
+        indexes = [
+            models.Index(fields=['enrolled_at']),
+            models.Index(fields=['is_active', 'enrolled_at']),
+        ]
 
     def __str__(self):
         return f"{self.student.username} - {self.course.title}"
@@ -105,9 +146,13 @@ class Progress(models.Model):
     is_completed = models.BooleanField(default=False)
     completed_at = models.DateTimeField(blank=True, null=True)
     time_spent_minutes = models.PositiveIntegerField(default=0)
+    # Written in batches from player heartbeats by courses.ingest
+    time_spent_seconds = models.PositiveIntegerField(default=0)
+    last_position = models.PositiveIntegerField(default=0, help_text='Playback position in seconds')
 
     class Meta:
         unique_together = ['enrollment', 'material']
+        indexes = [models.Index(fields=['is_completed', 'id'])]
 
     def __str__(self):
         return f"{self.enrollment.student.username} - {self.material.title}"
@@ -135,4 +180,41 @@ class Certificate(models.Model):
     is_valid = models.BooleanField(default=True)
 
     def __str__(self):
-        return f"Certificate for {self.enrollment.student.username} - {self.enrollment.course.title}"
\ No newline at end of file
+        return f"Certificate for {self.enrollment.student.username} - {self.enrollment.course.title}"
+
+
+class SearchDocument(models.Model):
+    """A course as seen by the inverted index in courses.search"""
+    course = models.OneToOneField(
+        Course, on_delete=models.CASCADE, primary_key=True, related_name='search_document'
+    )
+    length = models.FloatField(default=0)
+    indexed_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Search document for {self.course_id}"
+
+
+class SearchPosting(models.Model):
+    term = models.CharField(max_length=64)
+    document = models.ForeignKey(SearchDocument, on_delete=models.CASCADE, related_name='postings')
+    frequency = models.FloatField()
+
+    class Meta:
+        unique_together = ['term', 'document']
+
+    def __str__(self):
+        return f"{self.term} -> {self.document_id}"
+
+
+class Tombstone(models.Model):
+    """A deleted category or course, kept so sync clients can drop it (see courses.sync)"""
+    model = models.CharField(max_length=20)
+    object_id = models.PositiveIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['deleted_at', 'id'])]
+
+    def __str__(self):
+        return f"{self.model} {self.object_id} deleted"
\ No newline at end of file
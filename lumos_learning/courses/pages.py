@@ -0,0 +1,45 @@
+"""
+Version keys behind the public course pages.
+
+Listings (home, course list) depend on the "catalog" key, which every
+course or category change bumps. A course's own page depends on
+"course:<id>", bumped by changes to that course, its materials, reviews,
+category or instructor, so editing one course leaves other course pages
+cached.
+"""
+from django.core.cache import cache
+
+from core import versions
+
+from . import catalog
+from .models import Material
+
+
+def course_key(course_id):
+    return f'course:{course_id}'
+
+
+def invalidate_courses(course_ids):
+    versions.bump(*(course_key(course_id) for course_id in course_ids))
+
+
+def listing_keys(request, *args, **kwargs):
+    return [catalog.VERSION_KEY]
+
+
+def detail_keys(request, slug, *args, **kwargs):
+    """Keys for a published course page; other pages are not cached"""
+    course_id = catalog.get_snapshot().slugs.get(slug)
+    if course_id is None:
+        return None
+    return [course_key(course_id)]
+
+
+def course_materials(course_id):
+    """A course's materials in order, cached until the course changes"""
+    key = f'course-materials:{course_id}:{versions.get_version(course_key(course_id))}'
+    materials = cache.get(key)
+    if materials is None:
+        materials = list(Material.objects.filter(course_id=course_id).order_by('order'))
+        cache.set(key, materials, None)
+    return materials
\ No newline at end of file
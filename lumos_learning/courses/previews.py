@@ -0,0 +1,116 @@
+"""
+PDF previews and page slices.
+
+Derivatives are stored under material_previews/<sha256 of the source>/,
+so they are reused for as long as the uploaded file's content is the same
+and a new upload simply lands in a new directory. The free preview (the
+first PDF_PREVIEW_PAGES pages) is built when a PDF is uploaded; page
+ranges are cut lazily the first time they are requested.
+"""
+import hashlib
+import io
+import logging
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from pypdf import PdfReader, PdfWriter
+from pypdf.errors import PdfReadError
+
+from .models import Material
+
+logger = logging.getLogger(__name__)
+
+PREFIX = 'material_previews'
+
+
+def content_hash(field_file):
+    digest = hashlib.sha256()
+    with field_file.open('rb') as source:
+        for chunk in source.chunks():
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def derivative_name(file_hash, start, end):
+    return f'{PREFIX}/{file_hash}/pages-{start}-{end}.pdf'
+
+
+def preview_name(material):
+    return derivative_name(material.file_hash, 1, min(settings.PDF_PREVIEW_PAGES, material.page_count or 1))
+
+
+def _extract(field_file, start, end):
+    """PDF bytes holding pages start..end (1-based, inclusive)"""
+    with field_file.open('rb') as source:
+        reader = PdfReader(source)
+        writer = PdfWriter()
+        for number in range(start - 1, min(end, len(reader.pages))):
+            writer.add_page(reader.pages[number])
+        output = io.BytesIO()
+        writer.write(output)
+    return output.getvalue()
+
+
+def _ensure(name, field_file, start, end):
+    if not default_storage.exists(name):
+        saved = default_storage.save(name, ContentFile(_extract(field_file, start, end)))
+        if saved != name:
+            # Another request cut the same pages first; drop our suffixed copy
+            default_storage.delete(saved)
+    return name
+
+
+def refresh(material_id):
+    """
+    Hash a PDF material's file and build its preview if the content is new.
+    Returns True if a preview was (re)generated.
+    """
+    material = Material.objects.filter(id=material_id, material_type='pdf').first()
+    if material is None or not material.file:
+        return False
+
+    try:
+        file_hash = content_hash(material.file)
+        if file_hash == material.file_hash and default_storage.exists(preview_name(material)):
+            return False
+        with material.file.open('rb') as source:
+            page_count = len(PdfReader(source).pages)
+    except (OSError, PdfReadError):
+        logger.warning('Cannot build a preview of material %s', material_id, exc_info=True)
+        return False
+    Material.objects.filter(id=material_id).update(file_hash=file_hash, page_count=page_count)
+    material.file_hash, material.page_count = file_hash, page_count
+
+    _ensure(preview_name(material), material.file, 1, min(settings.PDF_PREVIEW_PAGES, page_count))
+    return True
+
+
+def refresh_on_commit(material_id):
+    """Build the preview after the upload commits, on a worker if there is one"""
+    def run():
+        if getattr(settings, 'CELERY_BROKER_URL', ''):
+            from .tasks import build_pdf_preview
+            try:
+                build_pdf_preview.delay(material_id)
+                return
+            except Exception:
+                logger.warning('Could not queue build_pdf_preview, building synchronously', exc_info=True)
+        refresh(material_id)
+
+    transaction.on_commit(run)
+
+
+def page_range(material, start, end):
+    """
+    Storage name of a derivative holding pages start..end, cut on first use.
+    Returns None if the file cannot be read as a PDF.
+    """
+    if not material.file_hash:
+        refresh(material.id)
+        material.refresh_from_db(fields=['file_hash', 'page_count'])
+        if not material.file_hash:
+            return None
+    end = min(end, material.page_count or end)
+    return _ensure(derivative_name(material.file_hash, start, end), material.file, start, end)
\ No newline at end of file
@@ -0,0 +1,141 @@
+"""
+Denormalized rating aggregates on Course.
+
+Only approved reviews count. Every change is applied as a delta with F()
+expressions so concurrent approvals never overwrite each other, and the
+stored average is recomputed in the same UPDATE statement.
+"""
+from collections import Counter, defaultdict
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import transaction
+from django.db.models import Case, Count, DecimalField, F, Q, Sum, Value, When
+from django.db.models.functions import Cast, Now
+
+from . import catalog, pages
+from .models import Course, Review
+
+STARS = (1, 2, 3, 4, 5)
+AGGREGATE_FIELDS = ['rating_sum', 'rating_count', 'rating_average'] + [
+    f'rating_{stars}_count' for stars in STARS
+]
+
+
+def _average_expression(sum_delta, count_delta):
+    return Case(
+        When(rating_count=-count_delta, then=Value(Decimal('0'))),
+        default=Cast(
+            (F('rating_sum') + sum_delta) * Value(1.0) / (F('rating_count') + count_delta),
+            DecimalField(max_digits=3, decimal_places=2),
+        ),
+        output_field=DecimalField(max_digits=3, decimal_places=2),
+    )
+
+
+def apply_deltas(course_id, star_deltas):
+    """Apply {stars: +/-n} changes in approved reviews to one course"""
+    star_deltas = {stars: n for stars, n in star_deltas.items() if n}
+    if not star_deltas:
+        return
+    count_delta = sum(star_deltas.values())
+    sum_delta = sum(stars * n for stars, n in star_deltas.items())
+
+    updates = {f'rating_{stars}_count': F(f'rating_{stars}_count') + n for stars, n in star_deltas.items()}
+    updates['rating_count'] = F('rating_count') + count_delta
+    updates['rating_sum'] = F('rating_sum') + sum_delta
+    updates['rating_average'] = _average_expression(sum_delta, count_delta)
+    updates['updated_at'] = Now()
+    Course.objects.filter(pk=course_id).update(**updates)
+    catalog.invalidate()
+    pages.invalidate_courses([course_id])
+
+
+def review_changed(course_id, old_rating=None, new_rating=None):
+    """
+    Record a single review change. Pass the rating the review counted with
+    before and after the change, or None where it was/is not approved.
+    """
+    deltas = Counter()
+    if old_rating is not None:
+        deltas[old_rating] -= 1
+    if new_rating is not None:
+        deltas[new_rating] += 1
+    apply_deltas(course_id, deltas)
+
+
+def set_approval(queryset, approved):
+    """Approve or disapprove reviews in bulk, keeping course aggregates in step"""
+    with transaction.atomic():
+        flipping = list(
+            queryset.select_for_update()
+            .filter(is_approved=not approved)
+            .values_list('id', 'course_id', 'rating')
+        )
+        if not flipping:
+            return 0
+
+        Review.objects.filter(id__in=[review_id for review_id, _, _ in flipping]).update(is_approved=approved)
+
+        sign = 1 if approved else -1
+        per_course = defaultdict(Counter)
+        for _, course_id, rating in flipping:
+            per_course[course_id][rating] += sign
+        for course_id, deltas in per_course.items():
+            apply_deltas(course_id, deltas)
+
+    return len(flipping)
+
+
+def compute_aggregates(course_ids=None):
+    """Recompute aggregates from the reviews table, keyed by course id"""
+    reviews = Review.objects.filter(is_approved=True)
+    if course_ids is not None:
+        reviews = reviews.filter(course_id__in=course_ids)
+    annotations = {f'rating_{stars}_count': Count('id', filter=Q(rating=stars)) for stars in STARS}
+    rows = reviews.values('course_id').annotate(
+        rating_sum=Sum('rating'), rating_count=Count('id'), **annotations
+    ).order_by()
+
+    aggregates = {}
+    for row in rows:
+        course_id = row.pop('course_id')
+        row['rating_average'] = (
+            Decimal(row['rating_sum']) / row['rating_count']
+        ).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+        aggregates[course_id] = row
+    return aggregates
+
+
+def rebuild(course_ids=None, batch_size=500, dry_run=False):
+    """
+    Compare stored aggregates with the reviews table and fix any drift.
+    Returns the ids of courses whose stored values were wrong.
+    """
+    empty = dict.fromkeys(AGGREGATE_FIELDS, 0)
+    empty['rating_average'] = Decimal('0.00')
+    expected = compute_aggregates(course_ids)
+
+    courses = Course.objects.only('id', *AGGREGATE_FIELDS).order_by('id')
+    if course_ids is not None:
+        courses = courses.filter(id__in=course_ids)
+
+    drifted = []
+    pending = []
+    for course in courses.iterator(chunk_size=batch_size):
+        values = expected.get(course.id, empty)
+        if all(getattr(course, field) == values[field] for field in AGGREGATE_FIELDS):
+            continue
+        drifted.append(course.id)
+        for field in AGGREGATE_FIELDS:
+            setattr(course, field, values[field])
+        pending.append(course)
+        if len(pending) >= batch_size and not dry_run:
+            Course.objects.bulk_update(pending, AGGREGATE_FIELDS)
+            pending = []
+
+    if pending and not dry_run:
+        Course.objects.bulk_update(pending, AGGREGATE_FIELDS)
+    if drifted and not dry_run:
+        catalog.invalidate()
+        pages.invalidate_courses(drifted)
+    return drifted
@@ -0,0 +1,42 @@
+"""
+Ranked full-text course search.
+
+The backend is chosen with the SEARCH_BACKEND setting; courses are
+reindexed from signals in courses.signals once their transaction commits.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+_backends = {}
+
+
+def get_backend():
+    path = settings.SEARCH_BACKEND
+    if path not in _backends:
+        _backends[path] = import_string(path)()
+    return _backends[path]
+
+
+def search(query, limit=200):
+    """Ranked [(course_id, score), ...] for query"""
+    if not query or not query.strip():
+        return []
+    return get_backend().search(query, limit=limit)
+
+
+def index_courses(course_ids):
+    """Reindex courses after the current transaction commits"""
+    course_ids = list(course_ids)
+    if course_ids:
+        transaction.on_commit(lambda: get_backend().index_courses(course_ids))
+
+
+def remove_courses(course_ids):
+    course_ids = list(course_ids)
+    if course_ids:
+        transaction.on_commit(lambda: get_backend().remove_courses(course_ids))
+
+
+def rebuild(batch_size=500):
+    return get_backend().rebuild(batch_size=batch_size)
\ No newline at end of file
@@ -0,0 +1,307 @@
+"""
+Search backends. SEARCH_BACKEND names the class to use:
+
+- InvertedIndexBackend keeps its own postings in SearchDocument and
+  SearchPosting, ranks with BM25 in Python and works on any database.
+- PostgresSearchBackend keeps a weighted tsvector on each course, GIN
+  indexed, ranks with tsquery against it and falls back to the pg_trgm
+  index on titles for misspelt queries.
+"""
+import bisect
+import math
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, Sum, Value
+
+from ..models import Course, SearchDocument, SearchPosting
+from .text import STOP_WORDS, analyze, edit_distance, stem, tokenize, typo_budget
+
+# Field weights: a title hit counts three times a description hit
+FIELD_WEIGHTS = (
+    ('title', 3.0),
+    ('category', 2.0),
+    ('instructor', 2.0),
+    ('description', 1.0),
+)
+
+
+def course_fields(course):
+    instructor = course.instructor
+    return {
+        'title': course.title,
+        'category': course.category.name,
+        'instructor': f"{instructor.get_full_name()} {instructor.username}",
+        'description': course.description,
+    }
+
+
+class BaseSearchBackend:
+    def search(self, query, limit=200):
+        """Ranked [(course_id, score), ...] for query, best first"""
+        raise NotImplementedError
+
+    def index_courses(self, course_ids):
+        pass
+
+    def remove_courses(self, course_ids):
+        pass
+
+    def rebuild(self, batch_size=500):
+        """Rebuild the whole index, returning the number of courses indexed"""
+        return 0
+
+
+class Vocabulary:
+    """Process-local list of index terms used for prefix and typo matching"""
+
+    def __init__(self, terms):
+        self.terms = sorted(terms)
+        self.by_initial = defaultdict(list)
+        for term in self.terms:
+            self.by_initial[term[0]].append(term)
+
+    def with_prefix(self, prefix, limit=20):
+        start = bisect.bisect_left(self.terms, prefix)
+        matches = []
+        for term in self.terms[start:start + limit]:
+            if not term.startswith(prefix):
+                break
+            matches.append(term)
+        return matches
+
+    def near(self, term):
+        """{index term: edits} for terms within the typo budget of term"""
+        budget = typo_budget(term)
+        if not budget:
+            return {}
+        matches = {}
+        for candidate in self.by_initial.get(term[0], ()):
+            distance = edit_distance(term, candidate, budget)
+            if distance <= budget:
+                matches[candidate] = distance
+        return matches
+
+
+class InvertedIndexBackend(BaseSearchBackend):
+    K1 = 1.2
+    B = 0.75
+    TYPO_PENALTY = 0.6
+    PREFIX_PENALTY = 0.8
+    VOCABULARY_TTL = 300
+
+    def __init__(self):
+        self._vocabulary = None
+        self._vocabulary_loaded_at = 0
+        self._lock = threading.Lock()
+
+    # Indexing
+
+    def _document_terms(self, course):
+        fields = course_fields(course)
+        frequencies = Counter()
+        for field, weight in FIELD_WEIGHTS:
+            for term in analyze(fields[field]):
+                frequencies[term[:64]] += weight
+        return frequencies
+
+    def _write(self, courses):
+        """Upsert documents and postings, returning {course id: its terms}"""
+        documents = []
+        postings = []
+        terms = {}
+        for course in courses:
+            frequencies = self._document_terms(course)
+            terms[course.id] = list(frequencies)
+            documents.append(SearchDocument(course_id=course.id, length=sum(frequencies.values())))
+            postings.extend(
+                SearchPosting(term=term, document_id=course.id, frequency=frequency)
+                for term, frequency in frequencies.items()
+            )
+        SearchDocument.objects.bulk_create(
+            documents, update_conflicts=True, unique_fields=['course'], update_fields=['length', 'indexed_at']
+        )
+        # Upserted, so a course reindexed twice at once doesn't collide
+        SearchPosting.objects.bulk_create(
+            postings, batch_size=1000,
+            update_conflicts=True, unique_fields=['term', 'document'], update_fields=['frequency'],
+        )
+        return terms
+
+    def index_courses(self, course_ids):
+        courses = Course.objects.filter(id__in=course_ids).select_related('category', 'instructor')
+        with transaction.atomic():
+            terms = self._write(courses)
+            for course_id in course_ids:
+                SearchPosting.objects.filter(document_id=course_id).exclude(
+                    term__in=terms.get(course_id, ())
+                ).delete()
+        self._vocabulary = None
+
+    def remove_courses(self, course_ids):
+        SearchDocument.objects.filter(course_id__in=course_ids).delete()
+        self._vocabulary = None
+
+    def rebuild(self, batch_size=500):
+        courses = Course.objects.select_related('category', 'instructor').order_by('id')
+        indexed = 0
+        with transaction.atomic():
+            SearchPosting.objects.all().delete()
+            SearchDocument.objects.all().delete()
+            batch = []
+            for course in courses.iterator(chunk_size=batch_size):
+                batch.append(course)
+                if len(batch) >= batch_size:
+                    self._write(batch)
+                    indexed += len(batch)
+                    batch = []
+            if batch:
+                self._write(batch)
+                indexed += len(batch)
+        self._vocabulary = None
+        return indexed
+
+    # Querying
+
+    def vocabulary(self):
+        with self._lock:
+            expired = time.monotonic() - self._vocabulary_loaded_at > self.VOCABULARY_TTL
+            if self._vocabulary is None or expired:
+                terms = SearchPosting.objects.values_list('term', flat=True).distinct()
+                self._vocabulary = Vocabulary(terms)
+                self._vocabulary_loaded_at = time.monotonic()
+            return self._vocabulary
+
+    def _expand(self, query):
+        """
+        For each query word, the index terms that may stand in for it with a
+        weight: 1 for an exact stem, less for typo and prefix matches.
+        """
+        words = tokenize(query)
+        words = [word for word in words if word not in STOP_WORDS] or words
+        vocabulary = self.vocabulary()
+        expansions = []
+        for position, word in enumerate(words):
+            term = stem(word)
+            candidates = {term: 1.0}
+            for match, distance in vocabulary.near(term).items():
+                candidates.setdefault(match, self.TYPO_PENALTY ** distance)
+            # The word being typed is matched as a prefix too
+            typing = position == len(words) - 1 and not query[-1:].isspace()
+            if typing and len(word) >= 2:
+                for match in vocabulary.with_prefix(word):
+                    candidates.setdefault(match, self.PREFIX_PENALTY)
+            expansions.append(candidates)
+        return expansions
+
+    def search(self, query, limit=200):
+        expansions = self._expand(query)
+        if not expansions:
+            return []
+
+        all_terms = set().union(*expansions)
+        stats = SearchDocument.objects.aggregate(documents=Count('pk'), total_length=Sum('length'))
+        documents = stats['documents']
+        if not documents:
+            return []
+        average_length = (stats['total_length'] or 0) / documents or 1.0
+
+        postings = defaultdict(dict)
+        lengths = {}
+        rows = SearchPosting.objects.filter(term__in=all_terms).values_list(
+            'term', 'document_id', 'frequency', 'document__length'
+        )
+        for term, document_id, frequency, length in rows:
+            postings[term][document_id] = frequency
+            lengths[document_id] = length
+
+        scores = defaultdict(float)
+        for candidates in expansions:
+            best = {}
+            for term, weight in candidates.items():
+                matches = postings.get(term)
+                if not matches:
+                    continue
+                idf = math.log(1 + (documents - len(matches) + 0.5) / (len(matches) + 0.5))
+                for document_id, frequency in matches.items():
+                    norm = self.K1 * (1 - self.B + self.B * lengths[document_id] / average_length)
+                    score = weight * idf * frequency * (self.K1 + 1) / (frequency + norm)
+                    if score > best.get(document_id, 0):
+                        best[document_id] = score
+            for document_id, score in best.items():
+                scores[document_id] += score
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return ranked[:limit] if limit else ranked
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """
+    Stores each course's weighted tsvector in Course.search_vector, so a
+    query is a GIN index lookup instead of building vectors row by row.
+    Misspelt queries fall back to the trigram index on titles. rebuild()
+    fills in every course's vector.
+    """
+    CONFIG = 'english'
+    # Same weights as FIELD_WEIGHTS: title A, category and instructor B
+    WEIGHTS = (('title', 'A'), ('category', 'B'), ('instructor', 'B'), ('description', 'C'))
+
+    def _vector(self, course):
+        from django.contrib.postgres.search import SearchVector
+
+        fields = course_fields(course)
+        vector = None
+        for field, weight in self.WEIGHTS:
+            part = SearchVector(Value(fields[field]), weight=weight, config=self.CONFIG)
+            vector = part if vector is None else vector + part
+        return vector
+
+    def _write(self, courses):
+        for course in courses:
+            Course.objects.filter(pk=course.pk).update(search_vector=self._vector(course))
+
+    def index_courses(self, course_ids):
+        courses = Course.objects.filter(id__in=course_ids).select_related('category', 'instructor')
+        with transaction.atomic():
+            self._write(courses)
+
+    def search(self, query, limit=200):
+        from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramSimilarity
+
+        search_query = SearchQuery(query, search_type='websearch', config=self.CONFIG)
+        ranked = list(
+            Course.objects.filter(search_vector=search_query)
+            .annotate(rank=SearchRank(F('search_vector'), search_query))
+            .order_by('-rank', 'id')
+            .values_list('id', 'rank')[:limit]
+        )
+        if ranked:
+            return ranked
+
+        # Nothing matched the stems; treat the query as possibly misspelt.
+        # trigram_similar (%) is what the title index answers
+        return list(
+            Course.objects.filter(title__trigram_similar=query)
+            .annotate(similarity=TrigramSimilarity('title', query))
+            .order_by(F('similarity').desc(), 'id')
+            .values_list('id', 'similarity')[:limit]
+        )
+
+    def rebuild(self, batch_size=500):
+        courses = Course.objects.select_related('category', 'instructor').order_by('id')
+        indexed = 0
+        batch = []
+        for course in courses.iterator(chunk_size=batch_size):
+            batch.append(course)
+            if len(batch) >= batch_size:
+                with transaction.atomic():
+                    self._write(batch)
+                indexed += len(batch)
+                batch = []
+        if batch:
+            with transaction.atomic():
+                self._write(batch)
+            indexed += len(batch)
+        return indexed
\ No newline at end of file
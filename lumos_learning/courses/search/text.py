@@ -0,0 +1,186 @@
+"""
+Text analysis for the course search index: tokenizing, stop words,
+Porter stemming and bounded edit distance for typo tolerance.
+"""
+import re
+import unicodedata
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+STOP_WORDS = frozenset("""
+a about an and are as at be but by for from has have how i in into is it its
+of on or our so than that the their them then there these this to was we what
+when where which who why will with you your
+""".split())
+
+
+def normalize(text):
+    """Lowercase and strip accents"""
+    text = unicodedata.normalize('NFKD', text or '')
+    return ''.join(char for char in text if not unicodedata.combining(char)).lower()
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(normalize(text))
+
+
+def analyze(text):
+    """Tokens of text as index terms: stop words dropped, words stemmed"""
+    return [stem(token) for token in tokenize(text) if token not in STOP_WORDS]
+
+
+# Porter stemmer (M.F. Porter, 1980)
+
+VOWELS = frozenset('aeiou')
+
+
+def _is_consonant(word, i):
+    if word[i] in VOWELS:
+        return False
+    if word[i] == 'y':
+        return i == 0 or not _is_consonant(word, i - 1)
+    return True
+
+
+def _measure(stem_part):
+    """Number of vowel-consonant sequences in stem_part"""
+    m = 0
+    previous_vowel = False
+    for i in range(len(stem_part)):
+        vowel = not _is_consonant(stem_part, i)
+        if previous_vowel and not vowel:
+            m += 1
+        previous_vowel = vowel
+    return m
+
+
+def _has_vowel(stem_part):
+    return any(not _is_consonant(stem_part, i) for i in range(len(stem_part)))
+
+
+def _ends_double_consonant(word):
+    return len(word) >= 2 and word[-1] == word[-2] and _is_consonant(word, len(word) - 1)
+
+
+def _ends_cvc(word):
+    if len(word) < 3:
+        return False
+    return (
+        _is_consonant(word, len(word) - 3)
+        and not _is_consonant(word, len(word) - 2)
+        and _is_consonant(word, len(word) - 1)
+        and word[-1] not in 'wxy'
+    )
+
+
+def _replace(word, suffixes, min_measure):
+    for suffix, replacement in suffixes:
+        if word.endswith(suffix):
+            base = word[:-len(suffix)]
+            if _measure(base) > min_measure:
+                return base + replacement
+            return word
+    return word
+
+
+STEP2 = (
+    ('ational', 'ate'), ('tional', 'tion'), ('enci', 'ence'), ('anci', 'ance'),
+    ('izer', 'ize'), ('abli', 'able'), ('alli', 'al'), ('entli', 'ent'), ('eli', 'e'),
+    ('ousli', 'ous'), ('ization', 'ize'), ('ation', 'ate'), ('ator', 'ate'),
+    ('alism', 'al'), ('iveness', 'ive'), ('fulness', 'ful'), ('ousness', 'ous'),
+    ('aliti', 'al'), ('iviti', 'ive'), ('biliti', 'ble'),
+)
+STEP3 = (
+    ('icate', 'ic'), ('ative', ''), ('alize', 'al'), ('iciti', 'ic'), ('ical', 'ic'),
+    ('ful', ''), ('ness', ''),
+)
+STEP4 = sorted((
+    'al', 'ance', 'ence', 'er', 'ic', 'able', 'ible', 'ant', 'ement', 'ment', 'ent',
+    'ion', 'ou', 'ism', 'ate', 'iti', 'ous', 'ive', 'ize',
+), key=len, reverse=True)
+
+
+def stem(word):
+    if len(word) <= 2 or not word.isalpha():
+        return word
+
+    # Step 1a
+    if word.endswith('sses'):
+        word = word[:-2]
+    elif word.endswith('ies'):
+        word = word[:-2]
+    elif word.endswith('s') and not word.endswith('ss'):
+        word = word[:-1]
+
+    # Step 1b
+    if word.endswith('eed'):
+        if _measure(word[:-3]) > 0:
+            word = word[:-1]
+    else:
+        for suffix in ('ed', 'ing'):
+            if word.endswith(suffix) and _has_vowel(word[:-len(suffix)]):
+                word = word[:-len(suffix)]
+                if word.endswith(('at', 'bl', 'iz')):
+                    word += 'e'
+                elif _ends_double_consonant(word) and word[-1] not in 'lsz':
+                    word = word[:-1]
+                elif _measure(word) == 1 and _ends_cvc(word):
+                    word += 'e'
+                break
+
+    # Step 1c
+    if word.endswith('y') and _has_vowel(word[:-1]):
+        word = word[:-1] + 'i'
+
+    word = _replace(word, STEP2, 0)
+    word = _replace(word, STEP3, 0)
+
+    # Step 4
+    for suffix in STEP4:
+        if word.endswith(suffix):
+            base = word[:-len(suffix)]
+            if _measure(base) > 1 and (suffix != 'ion' or base.endswith(('s', 't'))):
+                word = base
+            break
+
+    # Step 5
+    if word.endswith('e'):
+        base = word[:-1]
+        if _measure(base) > 1 or (_measure(base) == 1 and not _ends_cvc(base)):
+            word = base
+    if _measure(word) > 1 and _ends_double_consonant(word) and word.endswith('l'):
+        word = word[:-1]
+
+    return word
+
+
+def edit_distance(a, b, limit):
+    """
+    Edit distance between a and b counting adjacent transpositions as one
+    edit, or limit + 1 as soon as it is known to exceed limit.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    before_previous = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i]
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            distance = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                distance = min(distance, before_previous[j - 2] + 1)
+            current.append(distance)
+        if min(current) > limit:
+            return limit + 1
+        before_previous, previous = previous, current
+    return previous[-1]
+
+
+def typo_budget(term):
+    """How many edits a query term may be away from an index term"""
+    if len(term) < 4:
+        return 0
+    if len(term) < 8:
+        return 1
+    return 2
\ No newline at end of file
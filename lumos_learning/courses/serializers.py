@@ -0,0 +1,69 @@
+from rest_framework import serializers
+
+from .models import Category, Course, Enrollment, Material, Progress
+
+
+class CategorySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Category
+        fields = ('id', 'name', 'slug', 'description', 'updated_at')
+
+
+class MaterialOutlineSerializer(serializers.ModelSerializer):
+    """What a course lists about its materials; files are served by the viewers"""
+
+    class Meta:
+        model = Material
+        fields = ('id', 'title', 'material_type', 'order', 'is_free', 'price', 'duration_minutes', 'updated_at')
+
+
+class CourseSerializer(serializers.ModelSerializer):
+    """Needs courses.sync.courses(): instructor joined, outline prefetched"""
+    category = serializers.IntegerField(source='category_id')
+    instructor = serializers.SerializerMethodField()
+    thumbnail = serializers.SerializerMethodField()
+    materials = MaterialOutlineSerializer(many=True)
+
+    class Meta:
+        model = Course
+        fields = (
+            'id', 'slug', 'title', 'description', 'category', 'instructor', 'thumbnail', 'price',
+            'difficulty', 'duration_hours', 'is_featured', 'rating_average', 'rating_count',
+            'material_count', 'materials', 'created_at', 'updated_at',
+        )
+
+    def get_instructor(self, course):
+        instructor = course.instructor
+        return {
+            'username': instructor.username,
+            'name': f'{instructor.first_name} {instructor.last_name}'.strip() or instructor.username,
+        }
+
+    def get_thumbnail(self, course):
+        if not course.thumbnail:
+            return None
+        request = self.context.get('request')
+        url = course.thumbnail.url
+        return request.build_absolute_uri(url) if request else url
+
+
+class ProgressSerializer(serializers.ModelSerializer):
+    material = serializers.IntegerField(source='material_id')
+
+    class Meta:
+        model = Progress
+        fields = ('material', 'is_completed', 'completed_at', 'time_spent_seconds', 'last_position')
+
+
+class EnrollmentSerializer(serializers.ModelSerializer):
+    course = serializers.IntegerField(source='course_id')
+    course_slug = serializers.CharField(source='course.slug')
+    course_title = serializers.CharField(source='course.title')
+    progress = ProgressSerializer(many=True)
+
+    class Meta:
+        model = Enrollment
+        fields = (
+            'id', 'course', 'course_slug', 'course_title', 'enrolled_at', 'is_active',
+            'progress_percentage', 'completed_materials', 'completed_at', 'progress',
+        )
\ No newline at end of file
@@ -0,0 +1,134 @@
+from django.conf import settings
+from django.db import connections
+from django.db.models.signals import post_delete, post_save, pre_migrate, pre_save
+from django.dispatch import receiver
+
+from core import images, stats
+
+from . import catalog, completion, enrollment_counts, entitlements, pages, previews, search, sync
+from .models import Category, Course, Enrollment, Material, Review
+
+
+@receiver(pre_migrate)
+def install_extensions(sender, using='default', **kwargs):
+    # The trigram index on Course.title needs pg_trgm before it is created
+    connection = connections[using]
+    if sender.name == 'courses' and connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+
+
+@receiver(pre_save, sender=Course)
+def course_saving(sender, instance, raw=False, **kwargs):
+    if not raw:
+        instance._thumbnail_changed = images.field_changed(instance, 'thumbnail')
+        instance._published_before = None if instance._state.adding else (
+            Course.objects.filter(pk=instance.pk).values_list('is_published', 'instructor_id').first()
+        )
+
+
+@receiver(post_save, sender=Course)
+def course_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index_courses([instance.id])
+        catalog.invalidate()
+        pages.invalidate_courses([instance.id])
+        stats.course_changed(
+            getattr(instance, '_published_before', None),
+            (instance.is_published, instance.instructor_id),
+        )
+        if getattr(instance, '_thumbnail_changed', False):
+            images.schedule(instance.thumbnail.name)
+
+
+@receiver(post_delete, sender=Course)
+def course_deleted(sender, instance, **kwargs):
+    search.remove_courses([instance.id])
+    catalog.invalidate()
+    pages.invalidate_courses([instance.id])
+    stats.course_changed((instance.is_published, instance.instructor_id), None)
+    sync.record_deleted('courses', instance.id)
+
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if not created:
+        course_ids = list(instance.course_set.values_list('id', flat=True))
+        search.index_courses(course_ids)
+        pages.invalidate_courses(course_ids)
+    catalog.invalidate()
+
+
+@receiver(post_delete, sender=Category)
+def category_deleted(sender, instance, **kwargs):
+    catalog.invalidate()
+    sync.record_deleted('categories', instance.id)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def instructor_saved(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    # Logins save last_login only; names and pictures are what course
+    # pages and the index show
+    if created or raw:
+        return
+    if update_fields is not None and not {'first_name', 'last_name', 'username', 'profile_picture'} & set(update_fields):
+        return
+    course_ids = list(Course.objects.filter(instructor=instance).values_list('id', flat=True))
+    search.index_courses(course_ids)
+    pages.invalidate_courses(course_ids)
+    sync.touch_courses(course_ids)
+
+
+@receiver(post_save, sender=Enrollment)
+def enrollment_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    entitlements.invalidate(instance.student_id)
+    if created:
+        enrollment_counts.enrollment_created(instance)
+        stats.enrollment_created(instance)
+
+
+@receiver(post_delete, sender=Enrollment)
+def enrollment_deleted(sender, instance, **kwargs):
+    entitlements.invalidate(instance.student_id)
+    enrollment_counts.enrollment_deleted(instance)
+    stats.enrollment_deleted(instance)
+
+
+@receiver(pre_save, sender=Material)
+def material_saving(sender, instance, raw=False, **kwargs):
+    if raw or instance.material_type != 'pdf':
+        return
+    previous = None
+    if instance.pk:
+        previous = Material.objects.filter(pk=instance.pk).values_list('file', flat=True).first()
+    instance._file_changed = previous != instance.file.name
+
+
+@receiver(post_save, sender=Material)
+def material_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        completion.recount(instance.course_id)
+    pages.invalidate_courses([instance.course_id])
+    sync.touch_courses([instance.course_id])
+    if getattr(instance, '_file_changed', False):
+        previews.refresh_on_commit(instance.id)
+
+
+@receiver(post_delete, sender=Material)
+def material_deleted(sender, instance, **kwargs):
+    completion.recount(instance.course_id)
+    pages.invalidate_courses([instance.course_id])
+    sync.touch_courses([instance.course_id])
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def review_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        pages.invalidate_courses([instance.course_id])
\ No newline at end of file
@@ -0,0 +1,172 @@
+"""
+Delta sync feed for the mobile app.
+
+changes() returns categories and published courses, with their material
+outlines, that changed after a cursor, plus the ids clients should drop.
+Those are deleted categories and courses, recorded as Tombstones, and
+courses that have been unpublished.
+
+Each source is read by keyset on (updated_at, id), at most
+CATALOG_CHANGES_LIMIT rows per call, and the cursor holds one position
+per source. Rows changed in the last CATALOG_SYNC_LAG seconds are left
+for the next call, so rows whose transactions commit shortly after their
+timestamp are not skipped. Material changes touch their course's
+updated_at, so a course's outline is resent whenever it changes.
+Tombstones are pruned after CATALOG_TOMBSTONE_DAYS; older cursors have
+to sync from scratch.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Prefetch, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from core.pagination import decode_cursor, encode_cursor
+
+from . import catalog
+from .models import Category, Course, Material, Tombstone
+
+SOURCES = ('categories', 'courses', 'tombstones')
+OUTLINE_FIELDS = (
+    'id', 'course_id', 'title', 'material_type', 'order', 'is_free', 'price', 'duration_minutes', 'updated_at',
+)
+COURSE_FIELDS = (
+    'id', 'slug', 'title', 'description', 'category_id', 'thumbnail', 'price', 'difficulty',
+    'duration_hours', 'is_published', 'is_featured', 'rating_average', 'rating_count', 'material_count',
+    'created_at', 'updated_at', 'instructor__username', 'instructor__first_name', 'instructor__last_name',
+)
+
+
+class CursorExpired(Exception):
+    pass
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def outline():
+    return Prefetch('materials', queryset=Material.objects.only(*OUTLINE_FIELDS).order_by('order', 'id'))
+
+
+def courses():
+    """Courses with what the API serializes, in a fixed number of queries"""
+    return Course.objects.select_related('instructor').only(*COURSE_FIELDS).prefetch_related(outline())
+
+
+def touch_courses(course_ids):
+    """Mark courses changed, e.g. when their materials or instructor change"""
+    if course_ids:
+        Course.objects.filter(id__in=course_ids).update(updated_at=timezone.now())
+        # The API's ETags for the catalog cover the outlines
+        catalog.invalidate()
+
+
+def record_deleted(model, object_id):
+    Tombstone.objects.create(model=model, object_id=object_id)
+
+
+def prune(now=None):
+    """Forget tombstones older than CATALOG_TOMBSTONE_DAYS"""
+    cutoff = (now or timezone.now()) - timedelta(days=settings.CATALOG_TOMBSTONE_DAYS)
+    return Tombstone.objects.filter(deleted_at__lt=cutoff).delete()[0]
+
+
+def _after(queryset, field, position, until, limit):
+    """Up to limit + 1 rows after position (timestamp, id), up to until"""
+    queryset = queryset.filter(**{f'{field}__lte': until})
+    if position:
+        moment, pk = position
+        queryset = queryset.filter(Q(**{f'{field}__gt': moment}) | Q(**{field: moment, 'id__gt': pk}))
+    return list(queryset.order_by(field, 'id')[:limit + 1])
+
+
+def _decode(cursor):
+    """
+    ({source: (timestamp, id)}, time the cursor was issued up to, whether
+    it is partway through a first sync). Raises InvalidCursor for anything
+    changes() did not issue.
+    """
+    if not cursor:
+        return {}, None, True
+    values, _ = decode_cursor(cursor)
+    if not isinstance(values, dict):
+        raise InvalidCursor('Unreadable cursor')
+    positions = {}
+    try:
+        for source in SOURCES:
+            # Sources with no rows yet have no position
+            if source in values:
+                moment, pk = values[source]
+                positions[source] = (_parse_moment(moment), int(pk))
+        until = _parse_moment(values['until'])
+    except (KeyError, TypeError, ValueError):
+        raise InvalidCursor('Unreadable cursor')
+    return positions, until, bool(values.get('full'))
+
+
+def _parse_moment(value):
+    moment = parse_datetime(value)
+    if moment is None:
+        raise ValueError(value)
+    return moment
+
+
+def changes(cursor=None, limit=None, now=None):
+    """
+    {'categories': [...], 'courses': [...], 'deleted': {'categories': [ids],
+    'courses': [ids]}, 'cursor': ..., 'has_more': bool} with model
+    instances. Raises InvalidCursor for a cursor it did not issue and
+    CursorExpired when tombstones the client needs were pruned.
+    """
+    limit = limit or settings.CATALOG_CHANGES_LIMIT
+    now = now or timezone.now()
+    until = now - timedelta(seconds=settings.CATALOG_SYNC_LAG)
+    positions, synced, full = _decode(cursor)
+    if synced and synced < now - timedelta(days=settings.CATALOG_TOMBSTONE_DAYS):
+        raise CursorExpired('Cursor is older than the deletion history; sync from scratch')
+
+    course_rows = courses()
+    tombstone_rows = Tombstone.objects.all()
+    if full:
+        # A client syncing from scratch has nothing to drop
+        course_rows = course_rows.filter(is_published=True)
+        if 'tombstones' not in positions:
+            last = tombstone_rows.filter(deleted_at__lte=until).order_by('-deleted_at', '-id').first()
+            if last:
+                positions['tombstones'] = (last.deleted_at, last.id)
+    rows = {
+        'categories': _after(Category.objects.all(), 'updated_at', positions.get('categories'), until, limit),
+        'courses': _after(course_rows, 'updated_at', positions.get('courses'), until, limit),
+        'tombstones': _after(tombstone_rows, 'deleted_at', positions.get('tombstones'), until, limit),
+    }
+    has_more = any(len(found) > limit for found in rows.values())
+    for source, found in rows.items():
+        del found[limit:]
+        if found:
+            last = found[-1]
+            moment = last.deleted_at if source == 'tombstones' else last.updated_at
+            positions[source] = (moment, last.id)
+
+    deleted = {'categories': [], 'courses': []}
+    for tombstone in rows['tombstones']:
+        deleted.setdefault(tombstone.model, []).append(tombstone.object_id)
+    published = []
+    for course in rows['courses']:
+        if course.is_published:
+            published.append(course)
+        else:
+            deleted['courses'].append(course.id)
+
+    return {
+        'categories': rows['categories'],
+        'courses': published,
+        'deleted': deleted,
+        'cursor': encode_cursor({
+            'until': until.isoformat(),
+            'full': full and has_more,
+            **{source: [moment.isoformat(), pk] for source, (moment, pk) in positions.items()},
+        }),
+        'has_more': has_more,
+    }
\ No newline at end of file
@@ -0,0 +1,21 @@
+from celery import shared_task
+
+from . import ingest, previews, sync
+
+
+@shared_task(ignore_result=True)
+def flush_progress():
+    """Write buffered player heartbeats to Progress"""
+    return ingest.flush()
+
+
+@shared_task(ignore_result=True)
+def build_pdf_preview(material_id):
+    """Hash an uploaded PDF and build its free preview"""
+    return previews.refresh(material_id)
+
+
+@shared_task(ignore_result=True)
+def prune_tombstones():
+    """Forget deletions older than the sync feed keeps"""
+    return sync.prune()
\ No newline at end of file
@@ -0,0 +1,545 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib import admin
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import DatabaseError, IntegrityError, connection
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from pypdf import PdfReader, PdfWriter
+
+from core.models import User
+from payments.models import Payment
+
+from . import catalog, completion, enrollment_counts, entitlements, ingest, previews, ratings, search
+from .admin import ReviewAdmin
+from .models import Category, Course, Enrollment, Material, Progress, Review, SearchPosting
+from .search.backends import PostgresSearchBackend
+
+
+class CourseTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = User.objects.create_user('teacher', role='teacher')
+        cls.student = User.objects.create_user('student', password='secret', role='student')
+        cls.category = Category.objects.create(name='Programming', slug='programming')
+
+    def setUp(self):
+        cache.clear()
+
+    def create_course(self, title, **kwargs):
+        kwargs.setdefault('is_published', True)
+        kwargs.setdefault('category', self.category)
+        kwargs.setdefault('difficulty', 'beginner')
+        return Course.objects.create(
+            title=title, slug=title.lower().replace(' ', '-'), description=kwargs.pop('description', title),
+            instructor=self.teacher, **kwargs
+        )
+
+
+class EnrollTests(CourseTestCase):
+    def test_enrollments_are_counted(self):
+        python = self.create_course('Python')
+        django = self.create_course('Django')
+        self.client.force_login(self.student)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/courses/{python.slug}/enroll/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/courses/{django.slug}/enroll/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/courses/{django.slug}/enroll/')
+
+        self.assertEqual(Enrollment.objects.filter(student=self.student).count(), 2)
+        self.assertEqual(
+            enrollment_counts.active_enrollments([python.id, django.id], use_cache=False),
+            {python.id: 1, django.id: 1},
+        )
+        self.assertEqual(enrollment_counts.distinct_students(use_cache=False), 1)
+        self.assertEqual(enrollment_counts.reconcile(dry_run=True), {})
+
+
+class SearchTests(CourseTestCase):
+    def setUp(self):
+        super().setUp()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.title_match = self.create_course('Machine Learning', description='Models and data')
+            self.text_match = self.create_course('Statistics', description='Some machine learning along the way')
+            self.other = self.create_course('Watercolour Painting', description='Brushes and paper')
+
+    def ranked(self, query):
+        return [course_id for course_id, _ in search.search(query)]
+
+    def test_title_matches_rank_first(self):
+        self.assertEqual(self.ranked('machine learning'), [self.title_match.id, self.text_match.id])
+
+    def test_typos_and_prefixes_match(self):
+        self.assertEqual(self.ranked('machne')[:1], [self.title_match.id])
+        self.assertEqual(self.ranked('waterc'), [self.other.id])
+        self.assertEqual(self.ranked('the'), [])
+
+    def test_reindexing_replaces_terms(self):
+        self.other.title = 'Oil Painting'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.other.save()
+        # A second run for the same course upserts instead of colliding
+        search.get_backend().index_courses([self.other.id])
+
+        self.assertEqual(self.ranked('oil'), [self.other.id])
+        self.assertEqual(self.ranked('watercolour'), [])
+        self.assertEqual(
+            SearchPosting.objects.filter(document_id=self.other.id).count(),
+            SearchPosting.objects.filter(document_id=self.other.id).values('term').distinct().count(),
+        )
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'Needs PostgreSQL')
+class PostgresSearchTests(CourseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.backend = PostgresSearchBackend()
+        self.title_match = self.create_course('Machine Learning', description='Models and data')
+        self.text_match = self.create_course('Statistics', description='Some machine learning along the way')
+        self.backend.rebuild()
+
+    def test_stored_vectors_rank_title_matches_first(self):
+        self.assertEqual([course_id for course_id, _ in self.backend.search('machine learning')],
+                         [self.title_match.id, self.text_match.id])
+        self.assertEqual([course_id for course_id, _ in self.backend.search('machne lerning')][:1],
+                         [self.title_match.id])
+
+
+class CompletionTests(CourseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.course = self.create_course('Python')
+        self.materials = [
+            Material.objects.create(course=self.course, title=f'Part {i}', material_type='video', file=f'part{i}.mp4')
+            for i in range(4)
+        ]
+        self.enrollment = Enrollment.objects.create(student=self.student, course=self.course)
+
+    def test_completion_counts_once(self):
+        self.assertEqual(completion.mark_completed(self.enrollment.id, self.materials[0].id, 4), 25)
+        self.assertIsNone(completion.mark_completed(self.enrollment.id, self.materials[0].id, 4))
+        for material in self.materials[1:]:
+            completion.mark_completed(self.enrollment.id, material.id, 4)
+
+        self.enrollment.refresh_from_db()
+        self.assertEqual((self.enrollment.completed_materials, self.enrollment.progress_percentage), (4, 100))
+        self.assertIsNotNone(self.enrollment.completed_at)
+        self.assertTrue(hasattr(self.enrollment, 'certificate'))
+
+    def test_counts_from_before_material_count_are_backfilled(self):
+        Progress.objects.create(
+            enrollment=self.enrollment, material=self.materials[0], is_completed=True, completed_at=timezone.now()
+        )
+        Course.objects.filter(pk=self.course.pk).update(material_count=0)
+        Enrollment.objects.filter(pk=self.enrollment.pk).update(completed_materials=0, progress_percentage=0)
+
+        self.assertEqual(completion.mark_completed(self.enrollment.id, self.materials[1].id, 0), 50)
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.material_count, 4)
+
+
+@override_settings(PROGRESS_BUFFER_MAX=1)
+class HeartbeatTests(CourseTestCase):
+    def setUp(self):
+        super().setUp()
+        ingest.get_buffer().drain()
+        self.course = self.create_course('Python')
+        self.material = Material.objects.create(course=self.course, title='Intro', material_type='video', file='intro.mp4')
+        self.enrollment = Enrollment.objects.create(student=self.student, course=self.course)
+        self.client.force_login(self.student)
+
+    def send(self, *events):
+        return self.client.post('/courses/progress/events/', json.dumps({'events': events}), content_type='application/json')
+
+    def test_heartbeats_are_coalesced(self):
+        with mock.patch.object(ingest, 'schedule_flush'):
+            self.send({'material': self.material.id, 'seconds': 30, 'position': 30})
+            self.send({'material': self.material.id, 'seconds': 30, 'position': 60, 'completed': True})
+        self.assertEqual(ingest.flush(), 1)
+
+        progress = Progress.objects.get(enrollment=self.enrollment, material=self.material)
+        self.assertEqual((progress.time_spent_seconds, progress.last_position, progress.is_completed), (60, 60, True))
+
+    def test_failed_flush_keeps_the_events(self):
+        with mock.patch.object(ingest, 'write', side_effect=DatabaseError('database is down')), \
+                self.assertLogs('courses.ingest', 'ERROR'):
+            response = self.send({'material': self.material.id, 'seconds': 30, 'position': 30})
+        self.assertEqual(response.json(), {'success': True, 'accepted': 1})
+        self.assertFalse(Progress.objects.exists())
+
+        self.send({'material': self.material.id, 'seconds': 20, 'position': 50})
+        progress = Progress.objects.get(enrollment=self.enrollment, material=self.material)
+        self.assertEqual((progress.time_spent_seconds, progress.last_position), (50, 50))
+
+    def test_events_for_deleted_rows_are_dropped(self):
+        gone = Material.objects.create(course=self.course, title='Gone', material_type='video', file='gone.mp4')
+        with mock.patch.object(ingest, 'schedule_flush'):
+            ingest.record([((self.enrollment.id, gone.id), 30, 30, False)])
+            ingest.record([((self.enrollment.id, self.material.id), 30, 30, False)])
+        gone.delete()
+
+        self.assertEqual(ingest.flush(), 1)
+        self.assertEqual(ingest.get_buffer().drain(), {})
+
+    @override_settings(PROGRESS_FLUSH_CHUNK=10)
+    def test_refused_rows_do_not_hold_back_the_rest(self):
+        other = Material.objects.create(course=self.course, title='Other', material_type='video', file='other.mp4')
+        poisoned = (self.enrollment.id, other.id)
+        write = ingest.write
+
+        def refuse(chunk):
+            if any(key == poisoned for key, _ in chunk):
+                raise IntegrityError('refused')
+            write(chunk)
+
+        with mock.patch.object(ingest, 'schedule_flush'):
+            ingest.record([(poisoned, 30, 30, False), ((self.enrollment.id, self.material.id), 30, 30, False)])
+        with mock.patch.object(ingest, 'write', side_effect=refuse), self.assertLogs('courses.ingest', 'WARNING'):
+            self.assertEqual(ingest.flush(), 1)
+        self.assertEqual(ingest.get_buffer().drain(), {})
+        self.assertEqual(list(Progress.objects.values_list('material_id', flat=True)), [self.material.id])
+
+
+@override_settings(CATALOG_SYNC_LAG=0)
+class ChangesFeedTests(CourseTestCase):
+    url = '/api/courses/changes/'
+
+    def sync(self, since=None):
+        response = self.client.get(self.url, {'since': since} if since else {})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_first_sync_then_deltas(self):
+        python = self.create_course('Python')
+        self.create_course('Draft', is_published=False)
+
+        first = self.sync()
+        self.assertEqual([course['title'] for course in first['courses']], ['Python'])
+        self.assertEqual([category['name'] for category in first['categories']], ['Programming'])
+        self.assertFalse(first['has_more'])
+        self.assertEqual(self.sync(first['cursor'])['courses'], [])
+
+        django = self.create_course('Django')
+        python.is_published = False
+        python.save()
+        delta = self.sync(first['cursor'])
+        self.assertEqual([course['title'] for course in delta['courses']], ['Django'])
+        # Unpublished courses are sent as deletions
+        self.assertIn(python.id, delta['deleted']['courses'])
+
+        course_id = django.id
+        django.delete()
+        self.assertEqual(self.sync(delta['cursor'])['deleted']['courses'], [course_id])
+
+    @override_settings(CATALOG_CHANGES_LIMIT=2)
+    def test_pages_until_has_more_is_false(self):
+        titles = [f'Course {i}' for i in range(5)]
+        for title in titles:
+            self.create_course(title)
+
+        seen, cursor = [], None
+        while True:
+            page = self.sync(cursor)
+            seen += [course['title'] for course in page['courses']]
+            cursor = page['cursor']
+            if not page['has_more']:
+                break
+        self.assertEqual(sorted(seen), titles)
+
+    def test_unreadable_cursor_is_refused(self):
+        for since in ('garbage', 'e30', 'eyJ2IjogMSwgImQiOiAibiJ9'):
+            response = self.client.get(self.url, {'since': since})
+            self.assertEqual(response.status_code, 400, since)
+
+
+class RatingTests(CourseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.course = self.create_course('Python')
+        self.students = [User.objects.create_user(f'reviewer{i}', role='student') for i in range(3)]
+        for student, rating in zip(self.students, (5, 4, 4)):
+            Review.objects.create(course=self.course, student=student, rating=rating, comment='Good')
+
+    def assertAggregates(self, count, average, histogram):
+        self.course.refresh_from_db()
+        self.assertEqual((self.course.rating_count, self.course.rating_average), (count, Decimal(average)))
+        self.assertEqual(self.course.rating_histogram, histogram)
+
+    def test_only_approved_reviews_count(self):
+        self.assertAggregates(0, '0.00', [(5, 0), (4, 0), (3, 0), (2, 0), (1, 0)])
+        self.assertEqual(ratings.set_approval(Review.objects.all(), approved=True), 3)
+        self.assertEqual(ratings.set_approval(Review.objects.all(), approved=True), 0)
+        self.assertAggregates(3, '4.33', [(5, 1), (4, 2), (3, 0), (2, 0), (1, 0)])
+
+        ratings.set_approval(Review.objects.filter(rating=5), approved=False)
+        self.assertAggregates(2, '4.00', [(5, 0), (4, 2), (3, 0), (2, 0), (1, 0)])
+        ratings.set_approval(Review.objects.all(), approved=False)
+        self.assertAggregates(0, '0.00', [(5, 0), (4, 0), (3, 0), (2, 0), (1, 0)])
+
+    def test_edited_review_leaves_the_aggregates(self):
+        ratings.set_approval(Review.objects.all(), approved=True)
+        Enrollment.objects.create(student=self.students[0], course=self.course)
+        self.client.force_login(self.students[0])
+        self.client.post(f'/courses/{self.course.slug}/review/', {'rating': 1, 'comment': 'Changed my mind'})
+
+        self.assertFalse(Review.objects.get(student=self.students[0]).is_approved)
+        self.assertAggregates(2, '4.00', [(5, 0), (4, 2), (3, 0), (2, 0), (1, 0)])
+
+    def test_review_moved_in_the_admin_changes_both_courses(self):
+        ratings.set_approval(Review.objects.all(), approved=True)
+        other = self.create_course('Django')
+        review = Review.objects.get(student=self.students[0])
+        review.course = other
+        ReviewAdmin(Review, admin.site).save_model(None, review, None, change=True)
+
+        self.assertAggregates(2, '4.00', [(5, 0), (4, 2), (3, 0), (2, 0), (1, 0)])
+        other.refresh_from_db()
+        self.assertEqual((other.rating_count, other.rating_average), (1, Decimal('5.00')))
+
+    def test_rebuild_fixes_drift(self):
+        Review.objects.update(is_approved=True)
+        self.assertEqual(ratings.rebuild(dry_run=True), [self.course.id])
+        self.assertAggregates(0, '0.00', [(5, 0), (4, 0), (3, 0), (2, 0), (1, 0)])
+
+        self.assertEqual(ratings.rebuild(), [self.course.id])
+        self.assertAggregates(3, '4.33', [(5, 1), (4, 2), (3, 0), (2, 0), (1, 0)])
+        self.assertEqual(ratings.rebuild(), [])
+
+
+class CatalogTests(CourseTestCase):
+    def setUp(self):
+        super().setUp()
+        catalog._snapshot = None
+        self.design = Category.objects.create(name='Design', slug='design')
+        self.free = self.create_course('Python Basics', price=0)
+        self.cheap = self.create_course('Django', price=15)
+        self.pricey = self.create_course('Figma', price=80, category=self.design, difficulty='advanced')
+        self.draft = self.create_course('Draft', is_published=False)
+
+    def ids(self, result):
+        return [entry.id for entry in result]
+
+    def test_filters_and_facets(self):
+        snapshot = catalog.get_snapshot()
+        self.assertEqual(self.ids(snapshot.query()), [self.pricey.id, self.cheap.id, self.free.id])
+        self.assertEqual(self.ids(snapshot.query(category='programming', price='under-20')), [self.cheap.id])
+        self.assertEqual(self.ids(snapshot.query(category='missing')), [])
+        self.assertEqual(self.ids(snapshot.query(sort='price-high')), [self.pricey.id, self.cheap.id, self.free.id])
+
+        result = snapshot.query(difficulty='beginner')
+        facets = snapshot.facets(result)
+        self.assertEqual(facets['category'], {self.category.id: 2, self.design.id: 0})
+        # Each facet ignores its own filter
+        self.assertEqual(facets['difficulty'], {'beginner': 2, 'advanced': 1})
+
+    def test_search_results_keep_their_order(self):
+        result = catalog.get_snapshot().query(ranked_ids=[self.free.id, self.draft.id, self.pricey.id])
+        self.assertEqual(self.ids(result), [self.free.id, self.pricey.id])
+        self.assertEqual(len(result), 2)
+
+    def test_keyset_pages_cover_the_catalog(self):
+        for i in range(10):
+            self.create_course(f'Course {i}', price=i)
+        result = catalog.get_snapshot().query(sort='price-low')
+
+        seen, cursor = [], None
+        while True:
+            page = result.keyset_page(cursor, 4)
+            seen += [entry.id for entry in page.object_list]
+            cursor = page.next_cursor
+            if cursor is None:
+                break
+        self.assertEqual(seen, self.ids(result))
+        self.assertEqual(len(seen), 13)
+
+    def test_changes_are_picked_up(self):
+        catalog.get_snapshot()
+        with self.captureOnCommitCallbacks(execute=True):
+            added = self.create_course('Flask')
+            self.cheap.is_published = False
+            self.cheap.save()
+        self.assertEqual(self.ids(catalog.get_snapshot().query()), [added.id, self.pricey.id, self.free.id])
+
+
+class EntitlementTests(CourseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.course = self.create_course('Python', price=50)
+        self.first, self.second, self.free, self.paid = [
+            Material.objects.create(course=self.course, title=title, material_type='video', file=f'{title}.mp4', **kwargs)
+            for title, kwargs in (
+                ('first', {'order': 1}), ('second', {'order': 2}),
+                ('free', {'order': 3, 'is_free': True}), ('paid', {'order': 4, 'price': 5}),
+            )
+        ]
+
+    def fresh(self):
+        # for_user() memoizes on the user object, as for one request
+        return entitlements.for_user(User.objects.get(pk=self.student.pk))
+
+    def buy(self, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            Payment.objects.create(
+                user=self.student, amount='5.00', payment_method='paypal', status='completed', **kwargs
+            )
+
+    def test_free_and_first_episodes_need_only_enrollment(self):
+        self.assertEqual(self.fresh().accessible(self.course.materials.all()), set())
+        with self.captureOnCommitCallbacks(execute=True):
+            Enrollment.objects.create(student=self.student, course=self.course)
+        self.assertEqual(self.fresh().accessible(self.course.materials.all()), {self.first.id, self.free.id})
+
+    def test_purchases_unlock_materials(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Enrollment.objects.create(student=self.student, course=self.course)
+        self.buy(material=self.paid)
+        self.assertEqual(self.fresh().accessible(self.course.materials.all()), {self.first.id, self.free.id, self.paid.id})
+        self.buy(course=self.course)
+        self.assertEqual(len(self.fresh().accessible(self.course.materials.all())), 4)
+
+    def test_entitlements_are_cached(self):
+        self.fresh()
+        # Only the user row; the entitlements come from the cache
+        with self.assertNumQueries(1):
+            self.assertFalse(self.fresh().is_enrolled(self.course.id))
+        self.assertIs(entitlements.for_user(AnonymousUser()), entitlements.ANONYMOUS)
+
+
+def pdf(pages):
+    writer = PdfWriter()
+    for _ in range(pages):
+        writer.add_blank_page(width=200, height=200)
+    output = io.BytesIO()
+    writer.write(output)
+    return output.getvalue()
+
+
+@override_settings(PDF_PREVIEW_PAGES=2, MEDIA_ACCEL_REDIRECT='')
+class PreviewTests(CourseTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        media_root = override_settings(MEDIA_ROOT=directory.name)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+        self.course = self.create_course('Python')
+        self.material = self.upload(pdf(5))
+
+    def upload(self, content, title='Notes'):
+        material = Material(course=self.course, title=title, material_type='pdf')
+        material.file.save('notes.pdf', ContentFile(content), save=False)
+        with self.captureOnCommitCallbacks(execute=True):
+            material.save()
+        material.refresh_from_db()
+        return material
+
+    def pages(self, name):
+        with default_storage.open(name) as file:
+            return len(PdfReader(file).pages)
+
+    def test_upload_builds_the_preview(self):
+        self.assertEqual(self.material.page_count, 5)
+        self.assertEqual(self.pages(previews.preview_name(self.material)), 2)
+        # The same content uploaded again shares its derivatives
+        copy = self.upload(pdf(5), title='Copy')
+        self.assertEqual(copy.file_hash, self.material.file_hash)
+        self.assertFalse(previews.refresh(copy.id))
+
+    def test_page_ranges_are_cut_once(self):
+        name = previews.page_range(self.material, 2, 9)
+        self.assertEqual(name, previews.derivative_name(self.material.file_hash, 2, 5))
+        self.assertEqual(self.pages(name), 4)
+        with mock.patch.object(previews, '_extract') as extract:
+            self.assertEqual(previews.page_range(self.material, 2, 9), name)
+        extract.assert_not_called()
+
+    def test_concurrent_cuts_leave_one_file(self):
+        name = previews.page_range(self.material, 2, 3)
+        # Another request saved the pages between our check and our save
+        exists, checks = default_storage.exists, [False]
+        with mock.patch.object(default_storage, 'exists', lambda path: checks.pop() if checks else exists(path)):
+            self.assertEqual(previews.page_range(self.material, 2, 3), name)
+        _, files = default_storage.listdir(os.path.dirname(name))
+        self.assertEqual(sorted(files), ['pages-1-2.pdf', 'pages-2-3.pdf'])
+
+    def test_unreadable_pdf_is_skipped(self):
+        with self.assertLogs('courses.previews', 'WARNING'):
+            broken = self.upload(b'not a pdf')
+        self.assertEqual((broken.file_hash, broken.page_count), ('', None))
+        with self.assertLogs('courses.previews', 'WARNING'):
+            self.assertIsNone(previews.page_range(broken, 1, 2))
+
+        Enrollment.objects.create(student=self.student, course=self.course)
+        self.client.force_login(self.student)
+        url = f'/courses/material/{broken.id}/pages/'
+        with self.assertLogs('courses.previews', 'WARNING'):
+            self.assertEqual(self.client.get(url, {'start': 1, 'end': 2}).status_code, 404)
+        broken.is_free = True
+        broken.save()
+        with self.assertLogs('courses.previews', 'WARNING'):
+            response = self.client.get(url, {'start': 1, 'end': 2})
+        self.assertEqual(b''.join(response.streaming_content), b'not a pdf')
+
+    def test_only_preview_pages_are_free(self):
+        Enrollment.objects.create(student=self.student, course=self.course)
+        self.client.force_login(self.student)
+        url = f'/courses/material/{self.material.id}/pages/'
+
+        response = self.client.get(url, {'start': 1, 'end': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(PdfReader(io.BytesIO(b''.join(response.streaming_content))).pages), 2)
+        self.assertEqual(self.client.get(url, {'start': 2, 'end': 3}).status_code, 403)
+        self.assertEqual(self.client.get(url, {'start': 3, 'end': 1}).status_code, 400)
+
+
+# The pages use static files the manifest only lists after collectstatic
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class PageCacheTests(CourseTestCase):
+    def setUp(self):
+        super().setUp()
+        catalog._snapshot = None
+        with self.captureOnCommitCallbacks(execute=True):
+            self.python = self.create_course('Python')
+            self.django = self.create_course('Django')
+
+    def get(self, course):
+        response = self.client.get(f'/courses/{course.slug}/')
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_anonymous_pages_are_served_from_the_cache(self):
+        self.get(self.python)
+        with self.assertNumQueries(0):
+            self.get(self.python)
+
+    def test_changes_invalidate_only_their_course(self):
+        self.get(self.python)
+        self.get(self.django)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.python.title = 'Python 3'
+            self.python.save()
+
+        self.assertContains(self.get(self.python), 'Python 3')
+        with self.assertNumQueries(0):
+            self.get(self.django)
+
+    def test_signed_in_pages_are_not_cached(self):
+        self.get(self.python)
+        # A bulk update bumps no versions, so only an uncached page shows it
+        Course.objects.filter(pk=self.python.pk).update(title='Renamed')
+        self.assertNotContains(self.get(self.python), 'Renamed')
+        self.client.force_login(self.student)
+        self.assertContains(self.get(self.python), 'Renamed')
\ No newline at end of file
@@ -8,5 +8,8 @@ urlpatterns = [
     path('<slug:slug>/review/', views.submit_review, name='submit_review'),
     path('material/<int:material_id>/pdf/', views.pdf_viewer, name='pdf_viewer'),
     path('material/<int:material_id>/video/', views.video_player, name='video_player'),
+    path('material/<int:material_id>/pages/', views.pdf_pages, name='pdf_pages'),
+    path('material/<int:material_id>/file/', views.material_file, name='material_file'),
     path('material/<int:material_id>/progress/', views.mark_progress, name='mark_progress'),
+    path('progress/events/', views.progress_events, name='progress_events'),
 ]
\ No newline at end of file
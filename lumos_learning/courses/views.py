@@ -1,65 +1,123 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
-from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views.generic import ListView, DetailView
 from django.contrib import messages
-from django.http import JsonResponse, HttpResponse
-from django.core.paginator import Paginator
-from .models import Course, Category, Material, Enrollment, Progress, Review
-from payments.models import Payment
+from django.core.exceptions import PermissionDenied
+from django.http import Http404, HttpResponseBadRequest, JsonResponse, HttpResponse
+from django.core.files.storage import default_storage
+from django.conf import settings
+from django.db import transaction
+from django.urls import reverse
+from django.utils.decorators import method_decorator
+import json
+from .models import Course, Material, Enrollment, Review
+from core.models import User
+from core import versions
+from core.media import serve_file, serve_stored
+from core.conditional import conditional_page
+from core.page_cache import cache_anonymous_page
+from core.pagination import cursor_query
+from . import catalog, completion, entitlements, ingest, pages, previews, ratings
+from . import search as course_search
 
+# Heartbeats accepted per progress_events request
+MAX_PROGRESS_EVENTS = 500
 
+
+@method_decorator(conditional_page(pages.listing_keys), name='dispatch')
+@method_decorator(cache_anonymous_page(pages.listing_keys), name='dispatch')
 class CourseListView(ListView):
     model = Course
     template_name = 'courses/course_list.html'
     context_object_name = 'courses'
-    paginate_by = 12
+    paginate_by = None
+    page_size = 12
     
     def get_queryset(self):
-        queryset = Course.objects.filter(is_published=True)
-        category = self.request.GET.get('category')
-        difficulty = self.request.GET.get('difficulty')
-        search = self.request.GET.get('search')
+        # Answered from the in-memory catalog snapshot, see courses.catalog
+        self.snapshot = catalog.get_snapshot()
+        params = self.request.GET
+        search = params.get('search', '').strip()
         
-        if category:
-            queryset = queryset.filter(category__slug=category)
-        if difficulty:
-            queryset = queryset.filter(difficulty=difficulty)
+        ranked_ids = None
         if search:
-            queryset = queryset.filter(title__icontains=search)
+            ranked_ids = [course_id for course_id, _ in course_search.search(search)]
             
-        return queryset.order_by('-created_at')
+        self.result = self.snapshot.query(
+            category=params.get('category'),
+            difficulty=params.get('difficulty'),
+            price=params.get('price'),
+            featured=True if params.get('featured') else None,
+            ranked_ids=ranked_ids,
+            sort=params.get('sort', 'newest'),
+        )
+        return self.result
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['categories'] = Category.objects.all()
+        facets = self.snapshot.facets(self.result)
+        context['categories'] = self.snapshot.categories
+        context['category_facets'] = [
+            (category, facets['category'].get(category.id, 0)) for category in self.snapshot.categories
+        ]
+        context['difficulty_facets'] = [
+            (value, label, facets['difficulty'].get(value, 0)) for value, label in Course.DIFFICULTY_CHOICES
+        ]
+        context['price_facets'] = [
+            (value, label, facets['price'].get(value, 0)) for value, label in catalog.PRICE_BANDS
+        ]
+        context['sort_options'] = catalog.SORTS
         context['selected_category'] = self.request.GET.get('category', '')
         context['selected_difficulty'] = self.request.GET.get('difficulty', '')
+        context['selected_price'] = self.request.GET.get('price', '')
+        context['selected_sort'] = self.request.GET.get('sort', 'newest')
         context['search_query'] = self.request.GET.get('search', '')
+        
+        # Cursor pagination: the page after/before a given course, no OFFSET
+        page = self.result.keyset_page(self.request.GET.get('cursor'), self.page_size)
+        context['courses'] = context['page_obj'] = page
+        context['is_paginated'] = page.has_other_pages
+        context['total_courses'] = page.total
+        if page.has_next:
+            context['next_query'] = cursor_query(self.request.GET, page.next_cursor)
+        if page.has_previous:
+            context['previous_query'] = cursor_query(self.request.GET, page.previous_cursor)
+        context['first_query'] = cursor_query(self.request.GET, None)
+        
+        # Course cards are cached as a fragment for signed-in users
+        context['catalog_version'] = self.snapshot.version
+        context['fragment_ttl'] = settings.PAGE_CACHE_TTL
+        context['fragment_key'] = self.request.get_full_path()
         return context
 
 
+@method_decorator(conditional_page(pages.detail_keys), name='dispatch')
+@method_decorator(cache_anonymous_page(pages.detail_keys), name='dispatch')
 class CourseDetailView(DetailView):
     model = Course
+    queryset = Course.objects.select_related('category', 'instructor')
     template_name = 'courses/course_detail.html'
     context_object_name = 'course'
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        course = self.get_object()
+        course = self.object
         
-        context['materials'] = course.materials.all().order_by('order')
-        context['reviews'] = course.reviews.filter(is_approved=True).order_by('-created_at')[:5]
+        materials = pages.course_materials(course.id)
+        context['materials'] = materials
+        context['course_version'] = versions.get_version(pages.course_key(course.id))
+        context['fragment_ttl'] = settings.PAGE_CACHE_TTL
+        context['reviews'] = course.reviews.filter(is_approved=True).select_related('student').order_by('-created_at')[:5]
         context['is_enrolled'] = False
         context['enrollment'] = None
         
-        if self.request.user.is_authenticated:
-            try:
-                enrollment = Enrollment.objects.get(student=self.request.user, course=course)
-                context['is_enrolled'] = True
-                context['enrollment'] = enrollment
-            except Enrollment.DoesNotExist:
-                pass
+        access = entitlements.for_user(self.request.user)
+        enrollment_id = access.enrollment_id(course.id)
+        if enrollment_id:
+            context['is_enrolled'] = True
+            context['enrollment'] = Enrollment.objects.filter(pk=enrollment_id).first()
+        context['accessible_materials'] = accessible = access.accessible(materials)
+        context['accessible_key'] = ','.join(map(str, sorted(accessible)))
                 
         return context
 
@@ -68,11 +126,16 @@ class CourseDetailView(DetailView):
 def enroll_course(request, slug):
     course = get_object_or_404(Course, slug=slug, is_published=True)
     
-    enrollment, created = Enrollment.objects.get_or_create(
-        student=request.user,
-        course=course,
-        defaults={'is_active': True}
-    )
+    with transaction.atomic():
+        # Enrollments of one student go one at a time, so exactly one of
+        # two simultaneous first enrollments counts the student (see
+        # core.stats, called from the Enrollment signals)
+        list(User.objects.select_for_update().filter(pk=request.user.pk).values_list('pk'))
+        enrollment, created = Enrollment.objects.get_or_create(
+            student=request.user,
+            course=course,
+            defaults={'is_active': True}
+        )
     
     if created:
         messages.success(request, f'Successfully enrolled in {course.title}!')
@@ -84,92 +147,156 @@ def enroll_course(request, slug):
 
 @login_required
 def pdf_viewer(request, material_id):
-    material = get_object_or_404(Material, id=material_id, material_type='pdf')
+    material = get_object_or_404(Material.objects.select_related('course'), id=material_id, material_type='pdf')
     
     # Check if user has access
-    enrollment = get_object_or_404(Enrollment, student=request.user, course=material.course)
+    access = entitlements.for_user(request.user)
+    if not access.is_enrolled(material.course_id):
+        raise Http404('Not enrolled in this course')
     
     # Check if material is free or user has paid
-    has_access = material.is_free
-    if not has_access:
-        payment = Payment.objects.filter(
-            user=request.user,
-            material=material,
-            status='completed'
-        ).exists()
-        has_access = payment
+    has_access = access.can_access(material)
+    
+    # Pages are fetched lazily from pdf_pages; without access only the
+    # preview pages are served at all
+    free_pages = None if has_access else settings.PDF_PREVIEW_PAGES
+    pages_url = reverse('pdf_pages', args=[material.id])
     
     context = {
         'material': material,
         'has_access': has_access,
-        'free_pages': 10 if not has_access else None
+        'free_pages': free_pages,
+        'page_count': material.page_count,
+        'pages_url': pages_url,
+        'preview_url': f'{pages_url}?start=1&end={settings.PDF_PREVIEW_PAGES}',
+        'file_url': reverse('material_file', args=[material.id]) if has_access else None,
     }
     
     return render(request, 'courses/pdf_viewer.html', context)
 
 
+@login_required
+def pdf_pages(request, material_id):
+    """A PDF holding pages ?start=..&end=.. (1-based, inclusive) of a PDF material"""
+    material = get_object_or_404(Material.objects.select_related('course'), id=material_id, material_type='pdf')
+    
+    access = entitlements.for_user(request.user)
+    if not access.is_enrolled(material.course_id):
+        raise Http404('Not enrolled in this course')
+    
+    try:
+        start = int(request.GET.get('start', 1))
+        end = int(request.GET.get('end', start))
+    except ValueError:
+        return HttpResponseBadRequest('Invalid page range')
+    if start < 1 or end < start or end - start + 1 > settings.PDF_PAGE_RANGE_MAX:
+        return HttpResponseBadRequest('Invalid page range')
+    if material.page_count and start > material.page_count:
+        raise Http404('No such page')
+    if not access.can_access(material) and end > settings.PDF_PREVIEW_PAGES:
+        raise PermissionDenied('Only the preview pages are free')
+    
+    name = previews.page_range(material, start, end)
+    if name is None:
+        # Not a readable PDF, so there are no pages to cut
+        if not access.can_access(material):
+            raise Http404('No preview of this file')
+        return serve_file(request, material.file)
+    return serve_stored(request, default_storage, name, filename=f'{material.id}-pages-{start}-{end}.pdf')
+
+
 @login_required
 def video_player(request, material_id):
-    material = get_object_or_404(Material, id=material_id, material_type='video')
+    material = get_object_or_404(Material.objects.select_related('course'), id=material_id, material_type='video')
     
     # Check if user has access
-    enrollment = get_object_or_404(Enrollment, student=request.user, course=material.course)
+    access = entitlements.for_user(request.user)
+    if not access.is_enrolled(material.course_id):
+        raise Http404('Not enrolled in this course')
     
-    # Check if material is free or user has paid
-    has_access = material.is_free
-    if not has_access:
-        payment = Payment.objects.filter(
-            user=request.user,
-            material=material,
-            status='completed'
-        ).exists()
-        has_access = payment
-    
-    # For videos, first episode is always free
-    is_first_episode = material.order == 1
-    if is_first_episode:
-        has_access = True
+    # Free, paid for, or the first episode (always free for videos)
+    has_access = access.can_access(material)
+    is_first_episode = access.is_first_episode(material)
     
     context = {
         'material': material,
         'has_access': has_access,
-        'is_first_episode': is_first_episode
+        'is_first_episode': is_first_episode,
+        'file_url': reverse('material_file', args=[material.id]) if has_access else None,
     }
     
     return render(request, 'courses/video_player.html', context)
 
 
+@login_required
+def material_file(request, material_id):
+    """Deliver a material's file to enrolled students who have access"""
+    material = get_object_or_404(Material.objects.select_related('course'), id=material_id)
+    
+    access = entitlements.for_user(request.user)
+    if not access.is_enrolled(material.course_id):
+        raise Http404('Not enrolled in this course')
+    if not access.can_access(material):
+        raise PermissionDenied('This material has not been purchased')
+    
+    return serve_file(request, material.file)
+
+
 @login_required
 def mark_progress(request, material_id):
     if request.method == 'POST':
-        material = get_object_or_404(Material, id=material_id)
-        enrollment = get_object_or_404(Enrollment, student=request.user, course=material.course)
-        
-        progress, created = Progress.objects.get_or_create(
-            enrollment=enrollment,
-            material=material,
-            defaults={'is_completed': True}
-        )
-        
-        if not created:
-            progress.is_completed = True
-            progress.save()
+        material = get_object_or_404(Material.objects.select_related('course'), id=material_id)
+        enrollment_id = entitlements.for_user(request.user).enrollment_id(material.course_id)
+        if enrollment_id is None:
+            raise Http404('Not enrolled in this course')
         
-        # Update enrollment progress
-        total_materials = material.course.materials.count()
-        completed_materials = Progress.objects.filter(
-            enrollment=enrollment,
-            is_completed=True
-        ).count()
+        progress = completion.mark_completed(enrollment_id, material.id, material.course.material_count)
+        if progress is None:
+            # Already completed, nothing changed
+            progress = Enrollment.objects.values_list('progress_percentage', flat=True).get(pk=enrollment_id)
         
-        enrollment.progress_percentage = int((completed_materials / total_materials) * 100)
-        enrollment.save()
-        
-        return JsonResponse({'success': True, 'progress': enrollment.progress_percentage})
+        return JsonResponse({'success': True, 'progress': progress})
     
     return JsonResponse({'success': False})
 
 
+@login_required
+def progress_events(request):
+    """
+    Accept a batch of player heartbeats:
+    {"events": [{"material": 1, "seconds": 5, "position": 120, "completed": false}, ...]}
+    """
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Invalid request method'})
+    
+    try:
+        events = json.loads(request.body).get('events', [])
+        events = [
+            (int(event['material']), event.get('seconds', 0), event.get('position'), event.get('completed', False))
+            for event in events[:MAX_PROGRESS_EVENTS]
+        ]
+    except (ValueError, TypeError, KeyError, AttributeError):
+        return JsonResponse({'success': False, 'error': 'Invalid events'}, status=400)
+    
+    # Only materials of courses the user is enrolled in
+    access = entitlements.for_user(request.user)
+    courses = dict(
+        Material.objects.filter(id__in={material_id for material_id, _, _, _ in events})
+        .values_list('id', 'course_id')
+    )
+    accepted = []
+    for material_id, seconds, position, completed in events:
+        enrollment_id = access.enrollment_id(courses.get(material_id))
+        if enrollment_id:
+            accepted.append(((enrollment_id, material_id), seconds, position, completed))
+    
+    try:
+        count = ingest.record(accepted)
+    except (ValueError, TypeError):
+        return JsonResponse({'success': False, 'error': 'Invalid events'}, status=400)
+    return JsonResponse({'success': True, 'accepted': count})
+
+
 @login_required
 def submit_review(request, slug):
     if request.method == 'POST':
@@ -182,23 +309,30 @@ def submit_review(request, slug):
         comment = request.POST.get('comment', '')
         
         if 1 <= rating <= 5:
-            review, created = Review.objects.get_or_create(
-                course=course,
-                student=request.user,
-                defaults={
-                    'rating': rating,
-                    'comment': comment,
-                    'is_approved': False
-                }
-            )
+            with transaction.atomic():
+                review, created = Review.objects.select_for_update().get_or_create(
+                    course=course,
+                    student=request.user,
+                    defaults={
+                        'rating': rating,
+                        'comment': comment,
+                        'is_approved': False
+                    }
+                )
+                
+                if not created:
+                    # Edited reviews go back to moderation, so drop the old
+                    # rating from the course aggregates if it was counted
+                    if review.is_approved:
+                        ratings.review_changed(course.id, old_rating=review.rating)
+                    review.rating = rating
+                    review.comment = comment
+                    review.is_approved = False
+                    review.save()
             
             if created:
                 messages.success(request, 'Review submitted successfully! It will be visible after approval.')
             else:
-                review.rating = rating
-                review.comment = comment
-                review.is_approved = False
-                review.save()
                 messages.success(request, 'Review updated successfully!')
         else:
             messages.error(request, 'Invalid rating. Please select 1-5 stars.')
@@ -24,6 +24,8 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'django.contrib.sites',
+    # Trigram lookups for courses.search.backends.PostgresSearchBackend
+    'django.contrib.postgres',
     
     # Third party apps
     'rest_framework',
@@ -36,6 +38,7 @@ INSTALLED_APPS = [
     'core',
     'courses',
     'payments',
+    'analytics',
 ]
 
 MIDDLEWARE = [
@@ -45,8 +48,9 @@ MIDDLEWARE = [
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.middleware.CachedAuthenticationMiddleware',
     'allauth.account.middleware.AccountMiddleware',
+    'core.middleware.RateLimitMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -107,6 +111,18 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Internal nginx location that serves protected media (see nginx.conf);
+# leave empty to stream files from Django with Range support
+MEDIA_ACCEL_REDIRECT = config('MEDIA_ACCEL_REDIRECT', default='')
+
+# PDF previews (courses.previews): free pages for students who have not
+# bought a PDF, and the most pages served per page-range request
+PDF_PREVIEW_PAGES = config('PDF_PREVIEW_PAGES', default=10, cast=int)
+PDF_PAGE_RANGE_MAX = config('PDF_PAGE_RANGE_MAX', default=20, cast=int)
+
+# Responsive image variants (core.images)
+IMAGE_VARIANT_WIDTHS = [160, 320, 640, 960, 1280]
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Django Allauth
@@ -129,15 +145,161 @@ EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD', default='')
 PAYPAL_MODE = config('PAYPAL_MODE', default='sandbox')
 PAYPAL_CLIENT_ID = config('PAYPAL_CLIENT_ID', default='')
 PAYPAL_CLIENT_SECRET = config('PAYPAL_CLIENT_SECRET', default='')
+# Overrides the sandbox/live API host, e.g. http://127.0.0.1:8001 for
+# manage.py paypal_stub
+PAYPAL_API_BASE = config('PAYPAL_API_BASE', default='')
+# Seconds; a checkout fails rather than wait longer on PayPal
+PAYPAL_TIMEOUT = config('PAYPAL_TIMEOUT', default=10, cast=float)
+PAYPAL_CONNECT_TIMEOUT = config('PAYPAL_CONNECT_TIMEOUT', default=3, cast=float)
+# Keep-alive connections to PayPal per worker
+PAYPAL_POOL_SIZE = config('PAYPAL_POOL_SIZE', default=20, cast=int)
+# Webhook events are only applied once PayPal confirms their signature for
+# this webhook; without it they stay pending and reconcile_payments settles
+PAYPAL_WEBHOOK_ID = config('PAYPAL_WEBHOOK_ID', default='')
+# Events applied per transaction by payments.webhooks.drain
+WEBHOOK_DRAIN_BATCH = config('WEBHOOK_DRAIN_BATCH', default=500, cast=int)
+# Reconciling payments with PayPal (payments.reconcile): concurrent
+# lookups, lookups started per second, how far back completed payments are
+# rechecked and how old a pending one must be (minutes)
+RECONCILE_WORKERS = config('RECONCILE_WORKERS', default=10, cast=int)
+RECONCILE_RATE = config('RECONCILE_RATE', default=20, cast=float)
+RECONCILE_LOOKBACK_DAYS = config('RECONCILE_LOOKBACK_DAYS', default=2, cast=int)
+RECONCILE_PENDING_AGE = config('RECONCILE_PENDING_AGE', default=15, cast=int)
 
 # InterSend settings
 INTERSEND_API_KEY = config('INTERSEND_API_KEY', default='')
 INTERSEND_SECRET = config('INTERSEND_SECRET', default='')
 
-# Redis and Celery (disabled for free tier)
-# REDIS_URL = config('REDIS_URL', default='redis://localhost:6379/0')
-# CELERY_BROKER_URL = REDIS_URL
-# CELERY_RESULT_BACKEND = REDIS_URL
+# Redis and Celery (disabled for free tier; set REDIS_URL to enable)
+REDIS_URL = config('REDIS_URL', default='')
+if REDIS_URL:
+    CELERY_BROKER_URL = REDIS_URL
+    CELERY_RESULT_BACKEND = REDIS_URL
+
+# Two-tier cache (core.tiered_cache): a per-process LRU in front of Redis,
+# kept coherent across workers over pub/sub; just the LRU without REDIS_URL.
+# LOCAL_TIMEOUT bounds how long a worker keeps a Redis value itself
+CACHES = {
+    'default': {
+        'BACKEND': 'core.tiered_cache.TieredCache',
+        'LOCATION': REDIS_URL,
+        'OPTIONS': {
+            'LOCAL_MAX_ENTRIES': config('CACHE_LOCAL_MAX_ENTRIES', default=10000, cast=int),
+            'LOCAL_MAX_BYTES': config('CACHE_LOCAL_MAX_BYTES', default=64 * 2 ** 20, cast=int),
+            'LOCAL_TIMEOUT': config('CACHE_LOCAL_TIMEOUT', default=30, cast=int),
+        },
+    }
+}
+# Longest fetch() waits for another worker computing the same value, and how
+# often workers add their hit and miss counts to the shared totals
+CACHE_FETCH_LOCK_TIMEOUT = config('CACHE_FETCH_LOCK_TIMEOUT', default=10, cast=int)
+CACHE_METRICS_FLUSH_INTERVAL = config('CACHE_METRICS_FLUSH_INTERVAL', default=10, cast=int)
+
+# Sessions are read from the cache once it is shared between workers, and
+# only written when they change. Signed-in users are cached (core.auth) only
+# with a shared cache: a per-process one can't see other workers'
+# invalidations, so 0 (no user caching) is the default without REDIS_URL
+SESSION_ENGINE = config(
+    'SESSION_ENGINE',
+    default='django.contrib.sessions.backends.cached_db' if REDIS_URL else 'django.contrib.sessions.backends.db',
+)
+SESSION_SAVE_EVERY_REQUEST = False
+USER_CACHE_TTL = config('USER_CACHE_TTL', default=300 if REDIS_URL else 0, cast=int)
+
+# Buffered player heartbeats (courses.ingest)
+PROGRESS_FLUSH_INTERVAL = config('PROGRESS_FLUSH_INTERVAL', default=10, cast=int)
+PROGRESS_BUFFER_MAX = config('PROGRESS_BUFFER_MAX', default=1000, cast=int)
+PROGRESS_FLUSH_CHUNK = config('PROGRESS_FLUSH_CHUNK', default=500, cast=int)
+
+# Analytics rollups (analytics.rollups); sources are read up to this many
+# seconds ago so late-committing rows are not skipped
+ANALYTICS_ROLLUP_LAG = config('ANALYTICS_ROLLUP_LAG', default=120, cast=int)
+CELERY_BEAT_SCHEDULE = {
+    'rollup-analytics': {
+        'task': 'analytics.tasks.rollup_analytics',
+        'schedule': config('ANALYTICS_ROLLUP_INTERVAL', default=300, cast=int),
+    },
+    # Flushes the shared heartbeat buffer even when no new heartbeat
+    # arrives to schedule it (courses.ingest)
+    'flush-progress': {
+        'task': 'courses.tasks.flush_progress',
+        'schedule': PROGRESS_FLUSH_INTERVAL,
+    },
+    # Picks up webhook events left pending after a failed drain
+    'drain-webhooks': {
+        'task': 'payments.tasks.drain_webhooks',
+        'schedule': 60,
+    },
+    'reconcile-payments': {
+        'task': 'payments.tasks.reconcile_payments',
+        'schedule': 3600,
+    },
+    'prune-tombstones': {
+        'task': 'courses.tasks.prune_tombstones',
+        'schedule': 86400,
+    },
+}
+
+# Mobile delta sync feed (courses.sync): rows per source per call, seconds
+# left for late-committing transactions, and how long deletions are kept
+CATALOG_CHANGES_LIMIT = config('CATALOG_CHANGES_LIMIT', default=200, cast=int)
+CATALOG_SYNC_LAG = config('CATALOG_SYNC_LAG', default=5, cast=int)
+CATALOG_TOMBSTONE_DAYS = config('CATALOG_TOMBSTONE_DAYS', default=30, cast=int)
+
+# Streaming exports (analytics.exports): rows fetched per server-side cursor
+# round trip, and bytes gathered before each chunk is sent
+EXPORT_CHUNK_SIZE = config('EXPORT_CHUNK_SIZE', default=2000, cast=int)
+EXPORT_BUFFER_BYTES = config('EXPORT_BUFFER_BYTES', default=65536, cast=int)
+
+# Rate limits (core.ratelimit): token buckets refilled at "<requests>/<period>"
+# (s, m, h, d, optionally with a multiple such as 5m), holding up to burst
+# requests (default: the rate's count). key is ip, user (the IP for anonymous
+# visitors) or route; urls are URL names, paths are prefixes. Every matching
+# policy applies. Set RATE_LIMIT_PROXY_COUNT to the number of proxies in
+# front of the app that append to X-Forwarded-For (1 behind nginx or
+# Render); otherwise every visitor shares the proxy's address.
+RATE_LIMITS = [
+    {'name': 'login', 'urls': ['account_login', 'account_signup', 'account_reset_password'],
+     'methods': ['POST'], 'rate': '10/m', 'key': 'ip'},
+    {'name': 'payments', 'urls': ['create_payment'], 'methods': ['POST'], 'rate': '10/m', 'key': 'user'},
+    {'name': 'progress', 'urls': ['mark_progress', 'progress_events'], 'rate': '120/m', 'burst': 30, 'key': 'user'},
+    # Per sender, so nobody else can use up PayPal's allowance
+    {'name': 'webhooks', 'urls': ['paypal_webhook'], 'rate': '50/s', 'burst': 200, 'key': 'ip'},
+    {'name': 'api', 'paths': ['/api/'], 'rate': '300/m', 'key': 'user'},
+]
+RATE_LIMIT_PROXY_COUNT = config('RATE_LIMIT_PROXY_COUNT', default=0, cast=int)
+# Buckets kept per process without Redis, and how long to wait on Redis
+# before letting the request through
+RATE_LIMIT_LOCAL_KEYS = config('RATE_LIMIT_LOCAL_KEYS', default=100000, cast=int)
+RATE_LIMIT_REDIS_TIMEOUT = config('RATE_LIMIT_REDIS_TIMEOUT', default=0.05, cast=float)
+
+# Course search (courses.search); use courses.search.backends.PostgresSearchBackend
+# on PostgreSQL to rank with tsvector and pg_trgm instead of the built-in index,
+# and run manage.py rebuild_search_index after switching to fill its vectors in
+SEARCH_BACKEND = config('SEARCH_BACKEND', default='courses.search.backends.InvertedIndexBackend')
+
+# Sharded counters (core.counters)
+COUNTER_SHARDS = config('COUNTER_SHARDS', default=8, cast=int)
+COUNTER_CACHE_TTL = config('COUNTER_CACHE_TTL', default=30, cast=int)
+
+# Content version stamps (core.versions); bounds how long another worker
+# may serve content older than a change made elsewhere
+CONTENT_VERSION_CACHE_TTL = config('CONTENT_VERSION_CACHE_TTL', default=5, cast=int)
+
+# Anonymous full pages and signed-in fragments (core.page_cache); keys are
+# versioned, so this only bounds how long unused entries linger
+PAGE_CACHE_TTL = config('PAGE_CACHE_TTL', default=600, cast=int)
+
+# Per-user entitlements (courses.entitlements); entries are versioned, so
+# this only bounds how long unused ones linger
+ENTITLEMENT_CACHE_TTL = config('ENTITLEMENT_CACHE_TTL', default=3600, cast=int)
+
+# Admin changelists on large tables (core.pagination.EstimatedCountPaginator)
+# show the planner's row estimate above this many rows instead of counting
+ADMIN_COUNT_ESTIMATE_THRESHOLD = config('ADMIN_COUNT_ESTIMATE_THRESHOLD', default=10000, cast=int)
+# Admin bulk actions on more rows than this run in the background (core.bulk_actions)
+ADMIN_BACKGROUND_THRESHOLD = config('ADMIN_BACKGROUND_THRESHOLD', default=1000, cast=int)
+ADMIN_BACKGROUND_CHUNK = config('ADMIN_BACKGROUND_CHUNK', default=1000, cast=int)
 
 # Security settings
 if not DEBUG:
@@ -165,7 +327,7 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'core.pagination.KeysetPagination',
     'PAGE_SIZE': 20
 }
 
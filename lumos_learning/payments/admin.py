@@ -1,5 +1,9 @@
 from django.contrib import admin
-from .models import Payment, PaymentHistory, Refund
+from django.db.models.functions import Coalesce, Now
+from core import bulk_actions
+from core.pagination import EstimatedCountPaginator
+from . import webhooks
+from .models import Payment, PaymentHistory, Refund, WebhookEvent
 
 
 class PaymentHistoryInline(admin.TabularInline):
@@ -11,26 +15,40 @@ class PaymentHistoryInline(admin.TabularInline):
 @admin.register(Payment)
 class PaymentAdmin(admin.ModelAdmin):
     list_display = ('id', 'user', 'item_name', 'amount', 'payment_method', 'status', 'created_at')
-    list_filter = ('status', 'payment_method', 'currency', 'created_at')
+    list_filter = ('status', 'payment_method', 'created_at')
+    list_select_related = ('user', 'course', 'material__course')
     search_fields = ('user__username', 'user__email', 'course__title', 'material__title')
-    readonly_fields = ('id', 'created_at', 'updated_at')
+    raw_id_fields = ('user', 'course', 'material')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    # Status changes go through the actions so they follow payments.transitions
+    readonly_fields = ('id', 'status', 'created_at', 'updated_at', 'completed_at')
     inlines = [PaymentHistoryInline]
     
     actions = ['mark_completed', 'mark_failed', 'mark_refunded']
     
+    def _transition(self, request, queryset, status):
+        selected, moved = bulk_actions.run_or_queue(
+            queryset, 'payments.transitions.bulk_transition', status, f'Marked {status} by {request.user}'
+        )
+        if moved is None:
+            self.message_user(request, f"Marking {selected} payments as {status} in the background.")
+            return
+        message = f"Marked {len(moved)} payments as {status}."
+        if selected > len(moved):
+            message += f" Skipped {selected - len(moved)} that cannot move to {status}."
+        self.message_user(request, message)
+    
     def mark_completed(self, request, queryset):
-        queryset.update(status='completed')
-        self.message_user(request, f"Marked {queryset.count()} payments as completed.")
+        self._transition(request, queryset, 'completed')
     mark_completed.short_description = "Mark selected payments as completed"
     
     def mark_failed(self, request, queryset):
-        queryset.update(status='failed')
-        self.message_user(request, f"Marked {queryset.count()} payments as failed.")
+        self._transition(request, queryset, 'failed')
     mark_failed.short_description = "Mark selected payments as failed"
     
     def mark_refunded(self, request, queryset):
-        queryset.update(status='refunded')
-        self.message_user(request, f"Marked {queryset.count()} payments as refunded.")
+        self._transition(request, queryset, 'refunded')
     mark_refunded.short_description = "Mark selected payments as refunded"
 
 
@@ -38,14 +56,20 @@ class PaymentAdmin(admin.ModelAdmin):
 class PaymentHistoryAdmin(admin.ModelAdmin):
     list_display = ('payment', 'status', 'created_at')
     list_filter = ('status', 'created_at')
+    list_select_related = ('payment__user', 'payment__course', 'payment__material')
     search_fields = ('payment__user__username',)
     readonly_fields = ('created_at',)
+    raw_id_fields = ('payment',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 @admin.register(Refund)
 class RefundAdmin(admin.ModelAdmin):
     list_display = ('payment', 'status', 'refund_amount', 'created_at', 'processed_by')
     list_filter = ('status', 'created_at')
+    list_select_related = ('payment__user', 'payment__course', 'payment__material', 'processed_by')
+    raw_id_fields = ('payment', 'processed_by')
     search_fields = ('payment__user__username', 'reason')
     readonly_fields = ('created_at',)
     
@@ -62,6 +86,22 @@ class RefundAdmin(admin.ModelAdmin):
     reject_refunds.short_description = "Reject selected refunds"
     
     def mark_processed(self, request, queryset):
-        queryset.update(status='processed', processed_by=request.user)
+        queryset.update(status='processed', processed_by=request.user, processed_at=Coalesce('processed_at', Now()))
         self.message_user(request, f"Marked {queryset.count()} refunds as processed.")
-    mark_processed.short_description = "Mark selected refunds as processed"
\ No newline at end of file
+    mark_processed.short_description = "Mark selected refunds as processed"
+
+
+@admin.register(WebhookEvent)
+class WebhookEventAdmin(admin.ModelAdmin):
+    list_display = ('event_id', 'event_type', 'status', 'received_at', 'processed_at')
+    list_filter = ('status', 'event_type')
+    search_fields = ('event_id', 'payload')
+    readonly_fields = ('event_id', 'event_type', 'payload', 'headers', 'received_at', 'processed_at')
+    
+    actions = ['requeue_events']
+    
+    def requeue_events(self, request, queryset):
+        count = queryset.exclude(status='pending').update(status='pending', error='', processed_at=None)
+        webhooks.schedule_drain()
+        self.message_user(request, f"Requeued {count} webhook events.")
+    requeue_events.short_description = "Process selected events again"
\ No newline at end of file
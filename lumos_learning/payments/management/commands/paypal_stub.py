@@ -0,0 +1,147 @@
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlencode
+
+from django.core.management.base import BaseCommand
+
+
+class StubPayPal:
+    """
+    In-memory stand-in for the parts of the PayPal REST API that
+    payments.paypal_integration uses. Payments are approved as soon as
+    they are created: the approval URL leads straight back to return_url.
+    """
+
+    def __init__(self, delay=0, token_lifetime=32400, payments=None):
+        self.delay = delay
+        self.token_lifetime = token_lifetime
+        self.tokens = set()
+        self.payments = dict(payments or {})
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def handle(self, method, path, headers, body):
+        """(status, JSON body) for one request"""
+        if self.delay:
+            time.sleep(self.delay)
+
+        if method == 'POST' and path == '/v1/oauth2/token':
+            if not headers.get('Authorization', '').startswith('Basic '):
+                return 401, {'error': 'invalid_client'}
+            token = f'stub-token-{next(self.ids)}'
+            with self.lock:
+                self.tokens.add(token)
+            return 200, {'access_token': token, 'token_type': 'Bearer', 'expires_in': self.token_lifetime}
+
+        auth = headers.get('Authorization', '')
+        if not auth.startswith('Bearer ') or auth[7:] not in self.tokens:
+            return 401, {'name': 'AUTHENTICATION_FAILURE'}
+
+        parts = path.strip('/').split('/')
+        if method == 'POST' and parts == ['v1', 'notifications', 'verify-webhook-signature']:
+            signed = body.get('transmission_sig') and body.get('webhook_id')
+            return 200, {'verification_status': 'SUCCESS' if signed else 'FAILURE'}
+
+        if method == 'POST' and parts == ['v1', 'payments', 'payment']:
+            payment_id = f'PAYID-STUB{next(self.ids)}'
+            return_url = body['redirect_urls']['return_url']
+            query = urlencode({'paymentId': payment_id, 'token': f'EC-{payment_id}', 'PayerID': 'STUBPAYER'})
+            payment = {
+                'id': payment_id,
+                'state': 'created',
+                'payer': {'payment_method': 'paypal', 'payer_info': {'payer_id': 'STUBPAYER'}},
+                'transactions': body.get('transactions', []),
+                'links': [{
+                    'rel': 'approval_url',
+                    'href': return_url + ('&' if '?' in return_url else '?') + query,
+                    'method': 'REDIRECT',
+                }],
+            }
+            with self.lock:
+                self.payments[payment_id] = payment
+            return 201, payment
+
+        if len(parts) >= 4 and parts[:3] == ['v1', 'payments', 'payment']:
+            payment = self.payments.get(parts[3])
+            if payment is None:
+                return 404, {'name': 'INVALID_RESOURCE_ID'}
+            if method == 'GET' and len(parts) == 4:
+                return 200, payment
+            if method == 'POST' and parts[4:] == ['execute']:
+                if payment['state'] != 'created':
+                    return 400, {'name': 'PAYMENT_STATE_INVALID'}
+                payment['state'] = 'approved'
+                for transaction in payment.setdefault('transactions', [{}]):
+                    transaction['related_resources'] = [{'sale': {
+                        'id': f"SALE-{payment['id']}",
+                        'state': 'completed',
+                        'amount': transaction.get('amount', {}),
+                        'parent_payment': payment['id'],
+                    }}]
+                return 200, payment
+
+        return 404, {'name': 'NOT_FOUND'}
+
+
+def make_handler(stub, verbosity):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def _respond(self, method):
+            length = int(self.headers.get('Content-Length') or 0)
+            raw = self.rfile.read(length) if length else b''
+            if self.headers.get('Content-Type', '').startswith('application/json') and raw:
+                body = json.loads(raw)
+            else:
+                body = raw.decode()
+            status, data = stub.handle(method, self.path.split('?')[0], self.headers, body)
+            payload = json.dumps(data).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            self._respond('GET')
+
+        def do_POST(self):
+            self._respond('POST')
+
+        def log_message(self, format, *args):
+            if verbosity > 1:
+                super().log_message(format, *args)
+
+    return Handler
+
+
+class Command(BaseCommand):
+    help = 'Run a local stub of the PayPal REST API (set PAYPAL_API_BASE to its URL)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8001)
+        parser.add_argument('--delay', type=float, default=0,
+                            help='Seconds to wait before answering, to simulate a slow PayPal')
+        parser.add_argument('--payments', metavar='PATH',
+                            help='JSON file of payment resources to serve, e.g. for reconcile_payments')
+
+    def handle(self, *args, **options):
+        payments = {}
+        if options['payments']:
+            with open(options['payments'], encoding='utf-8') as file:
+                payments = {payment['id']: payment for payment in json.load(file)}
+        stub = StubPayPal(delay=options['delay'], payments=payments)
+        server = ThreadingHTTPServer((options['host'], options['port']), make_handler(stub, options['verbosity']))
+        self.stdout.write(self.style.SUCCESS(
+            f"PayPal stub listening on http://{options['host']}:{options['port']}"
+        ))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
\ No newline at end of file
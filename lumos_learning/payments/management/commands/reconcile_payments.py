@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from payments import reconcile
+
+
+class Command(BaseCommand):
+    help = 'Recheck pending and recently completed PayPal payments against the gateway'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Lookups in flight at once (default: RECONCILE_WORKERS)')
+        parser.add_argument('--rate', type=float, default=None,
+                            help='Lookups started per second, 0 for no limit (default: RECONCILE_RATE)')
+        parser.add_argument('--chunk-size', type=int, default=500)
+        parser.add_argument('--lookback-days', type=int, default=None,
+                            help='Recheck payments completed this many days back')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report discrepancies, do not change payments')
+
+    def report(self, discrepancy):
+        self.stdout.write(
+            f'{discrepancy.payment_id}: ours {discrepancy.ours}, PayPal {discrepancy.gateway} -> {discrepancy.action}'
+        )
+
+    def handle(self, *args, **options):
+        totals = reconcile.run(
+            workers=options['workers'],
+            rate=options['rate'],
+            chunk_size=options['chunk_size'],
+            lookback_days=options['lookback_days'],
+            dry_run=options['dry_run'],
+            report=self.report,
+        )
+        summary = ', '.join(f'{count} {action}' for action, count in sorted(totals.items()) if action != 'checked')
+        self.stdout.write(self.style.SUCCESS(
+            f"Checked {totals['checked']} payments" + (f': {summary}' if summary else ', all in agreement')
+        ))
\ No newline at end of file
@@ -0,0 +1,45 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from payments import webhooks
+
+
+class Command(BaseCommand):
+    help = 'Load captured PayPal webhook events into the inbox and apply them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='JSON Lines file: one event per line, or {"headers": ..., "body": event}')
+        parser.add_argument('--no-drain', action='store_true',
+                            help='Only store the events; workers apply them')
+        parser.add_argument('--batch-size', type=int, default=None)
+
+    def read(self, path):
+        with open(path, encoding='utf-8') as file:
+            for number, line in enumerate(file, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError as e:
+                    raise CommandError(f'{path}:{number}: {e}')
+                if isinstance(record, dict) and 'body' in record and 'event_type' not in record:
+                    body = record['body']
+                    yield (body if isinstance(body, str) else json.dumps(body)), record.get('headers') or {}
+                else:
+                    yield line, {}
+
+    def handle(self, *args, **options):
+        stored, invalid = webhooks.store(self.read(options['path']))
+        self.stdout.write(f'Read {stored} events ({invalid} invalid); already known ones were skipped')
+
+        if not options['no_drain']:
+            processed = webhooks.drain(options['batch_size'])
+            self.stdout.write(f'Processed {processed} events')
+
+        lag = webhooks.lag_stats()
+        self.stdout.write(
+            f"{lag['pending']} pending (oldest {lag['oldest_pending_seconds']:.0f}s), "
+            f"average lag {lag['average_lag_ms']} ms over {lag['processed']} events"
+        )
+        self.stdout.write(self.style.SUCCESS('Replay finished'))
\ No newline at end of file
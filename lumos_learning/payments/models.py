@@ -36,6 +36,11 @@ class Payment(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        # Admin changelist filters and ordering
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+            models.Index(fields=['created_at']),
+        ]
 
     def __str__(self):
         item = self.course.title if self.course else self.material.title
@@ -59,9 +64,10 @@ class PaymentHistory(models.Model):
     class Meta:
         ordering = ['-created_at']
         verbose_name_plural = "Payment Histories"
+        indexes = [models.Index(fields=['created_at'])]
 
     def __str__(self):
-        return f"{self.payment.id} - {self.status}"
+        return f"{self.payment_id} - {self.status}"
 
 
 class Refund(models.Model):
@@ -87,4 +93,31 @@ class Refund(models.Model):
     processed_at = models.DateTimeField(blank=True, null=True)
 
     def __str__(self):
-        return f"Refund for {self.payment.id} - {self.status}"
\ No newline at end of file
+        return f"Refund for {self.payment.id} - {self.status}"
+
+class WebhookEvent(models.Model):
+    """A PayPal webhook delivery, stored before it is processed (see payments.webhooks)"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processed', 'Processed'),
+        ('ignored', 'Ignored'),
+        ('rejected', 'Rejected'),
+        ('failed', 'Failed'),
+    ]
+
+    # PayPal's event id; redeliveries and replays share it
+    event_id = models.CharField(max_length=100, unique=True)
+    event_type = models.CharField(max_length=100)
+    payload = models.TextField()
+    # Transmission headers needed to verify the signature
+    headers = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    error = models.TextField(blank=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'id'])]
+
+    def __str__(self):
+        return f"{self.event_type} {self.event_id} ({self.status})"
\ No newline at end of file
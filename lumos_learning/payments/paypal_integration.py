@@ -1,91 +1,212 @@
-import paypalrestsdk
+"""
+Async PayPal REST client.
+
+Calls go through one httpx.AsyncClient per event loop, so under ASGI
+(lumos/asgi.py) every checkout in a worker shares the same keep-alive
+connections to PayPal. OAuth access tokens are cached in Django's cache
+until shortly before they expire. Every request has a hard timeout
+(PAYPAL_TIMEOUT), so a slow PayPal fails the checkout instead of holding
+the worker. Set PAYPAL_API_BASE to point the client at another server,
+e.g. the one started by manage.py paypal_stub.
+"""
+import asyncio
+import hashlib
+import logging
+import time
+import weakref
+
+import httpx
 from django.conf import settings
+from django.core.cache import cache
 from django.urls import reverse
-import logging
 
 logger = logging.getLogger(__name__)
 
-# Configure PayPal SDK
-paypalrestsdk.configure({
-    "mode": settings.PAYPAL_MODE,
-    "client_id": settings.PAYPAL_CLIENT_ID,
-    "client_secret": settings.PAYPAL_CLIENT_SECRET
-})
+API_BASES = {
+    'sandbox': 'https://api-m.sandbox.paypal.com',
+    'live': 'https://api-m.paypal.com',
+}
+# Refresh tokens this many seconds before PayPal says they expire
+TOKEN_MARGIN = 60
 
 
-def create_paypal_payment(payment_obj, request):
-    """Create a PayPal payment"""
-    try:
-        payment = paypalrestsdk.Payment({
-            "intent": "sale",
-            "payer": {
-                "payment_method": "paypal"
+class PayPalError(Exception):
+    pass
+
+
+def api_base():
+    return settings.PAYPAL_API_BASE or API_BASES.get(settings.PAYPAL_MODE, API_BASES['sandbox'])
+
+
+def _token_cache_key():
+    digest = hashlib.sha1(f'{api_base()}|{settings.PAYPAL_CLIENT_ID}'.encode()).hexdigest()
+    return f'paypal:token:{digest}'
+
+
+# Shared by every event loop in the process; the Django cache shares it
+# between processes. expires is a Unix timestamp.
+_token = {'value': None, 'expires': 0}
+
+
+class PayPalClient:
+    def __init__(self):
+        self.http = httpx.AsyncClient(
+            base_url=api_base(),
+            timeout=httpx.Timeout(settings.PAYPAL_TIMEOUT, connect=settings.PAYPAL_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=settings.PAYPAL_POOL_SIZE,
+                max_keepalive_connections=settings.PAYPAL_POOL_SIZE,
+            ),
+        )
+        self._token_lock = asyncio.Lock()
+
+    async def _fetch_token(self):
+        response = await self.http.post(
+            '/v1/oauth2/token',
+            data={'grant_type': 'client_credentials'},
+            auth=(settings.PAYPAL_CLIENT_ID, settings.PAYPAL_CLIENT_SECRET),
+        )
+        if response.status_code != 200:
+            raise PayPalError(f'OAuth token request failed: {response.status_code} {response.text[:200]}')
+        data = response.json()
+        return data['access_token'], max(int(data.get('expires_in', 0)) - TOKEN_MARGIN, 0)
+
+    async def access_token(self, force=False):
+        if not force and _token['value'] and _token['expires'] > time.time():
+            return _token['value']
+
+        async with self._token_lock:
+            if not force and _token['value'] and _token['expires'] > time.time():
+                return _token['value']
+            key = _token_cache_key()
+            cached = None if force else await cache.aget(key)
+            if cached is None:
+                token, lifetime = await self._fetch_token()
+                cached = (token, time.time() + lifetime)
+                await cache.aset(key, cached, lifetime)
+            _token.update(value=cached[0], expires=cached[1])
+            return cached[0]
+
+    async def request(self, method, path, **kwargs):
+        """JSON response of an authenticated API call, retried once if the token was revoked"""
+        for attempt in range(2):
+            token = await self.access_token(force=attempt > 0)
+            response = await self.http.request(
+                method, path, headers={'Authorization': f'Bearer {token}'}, **kwargs
+            )
+            if response.status_code != 401:
+                break
+        if response.status_code >= 400:
+            raise PayPalError(f'{method} {path} failed: {response.status_code} {response.text[:200]}')
+        return response.json()
+
+    async def aclose(self):
+        await self.http.aclose()
+
+
+_clients = weakref.WeakKeyDictionary()
+
+
+def get_client():
+    """The client for the running event loop"""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = _clients[loop] = PayPalClient()
+    return client
+
+
+def _payment_body(payment_obj, return_url, cancel_url):
+    return {
+        "intent": "sale",
+        "payer": {
+            "payment_method": "paypal"
+        },
+        "redirect_urls": {
+            "return_url": return_url,
+            "cancel_url": cancel_url
+        },
+        "transactions": [{
+            "item_list": {
+                "items": [{
+                    "name": payment_obj.item_name,
+                    "sku": str(payment_obj.id),
+                    "price": str(payment_obj.amount),
+                    "currency": payment_obj.currency,
+                    "quantity": 1
+                }]
             },
-            "redirect_urls": {
-                "return_url": request.build_absolute_uri(
-                    reverse('payment_success', kwargs={'payment_id': payment_obj.id})
-                ),
-                "cancel_url": request.build_absolute_uri(
-                    reverse('payment_cancel', kwargs={'payment_id': payment_obj.id})
-                )
+            "amount": {
+                "total": str(payment_obj.amount),
+                "currency": payment_obj.currency
             },
-            "transactions": [{
-                "item_list": {
-                    "items": [{
-                        "name": payment_obj.item_name,
-                        "sku": str(payment_obj.id),
-                        "price": str(payment_obj.amount),
-                        "currency": payment_obj.currency,
-                        "quantity": 1
-                    }]
-                },
-                "amount": {
-                    "total": str(payment_obj.amount),
-                    "currency": payment_obj.currency
-                },
-                "description": f"Payment for {payment_obj.item_name}"
-            }]
-        })
-
-        if payment.create():
-            # Store PayPal payment ID
-            payment_obj.paypal_payment_id = payment.id
-            payment_obj.save()
-            
-            # Get approval URL
-            for link in payment.links:
-                if link.rel == "approval_url":
-                    return link.href
-        else:
-            logger.error(f"PayPal payment creation failed: {payment.error}")
-            return None
-            
-    except Exception as e:
-        logger.error(f"PayPal payment creation error: {str(e)}")
+            "description": f"Payment for {payment_obj.item_name}"
+        }]
+    }
+
+
+async def create_paypal_payment(payment_obj, request):
+    """
+    Create a PayPal payment and return its approval URL, or None on
+    failure. Sets payment_obj.paypal_payment_id; the caller saves it.
+    """
+    body = _payment_body(
+        payment_obj,
+        request.build_absolute_uri(reverse('payment_success', kwargs={'payment_id': payment_obj.id})),
+        request.build_absolute_uri(reverse('payment_cancel', kwargs={'payment_id': payment_obj.id})),
+    )
+    try:
+        payment = await get_client().request('POST', '/v1/payments/payment', json=body)
+    except (PayPalError, httpx.HTTPError) as e:
+        logger.error(f"PayPal payment creation error: {e!r}")
         return None
 
+    payment_obj.paypal_payment_id = payment['id']
+    for link in payment.get('links', []):
+        if link.get('rel') == 'approval_url':
+            return link['href']
+    logger.error(f"PayPal payment {payment['id']} has no approval URL")
+    return None
+
 
-def execute_paypal_payment(payment_id, payer_id):
+async def execute_paypal_payment(payment_id, payer_id):
     """Execute a PayPal payment after user approval"""
     try:
-        payment = paypalrestsdk.Payment.find(payment_id)
-        
-        if payment.execute({"payer_id": payer_id}):
-            return True
-        else:
-            logger.error(f"PayPal payment execution failed: {payment.error}")
-            return False
-            
-    except Exception as e:
-        logger.error(f"PayPal payment execution error: {str(e)}")
+        payment = await get_client().request(
+            'POST', f'/v1/payments/payment/{payment_id}/execute', json={'payer_id': payer_id}
+        )
+    except (PayPalError, httpx.HTTPError) as e:
+        logger.error(f"PayPal payment execution error: {e!r}")
         return False
+    return payment.get('state') == 'approved'
 
 
-def get_paypal_payment_details(payment_id):
+async def get_paypal_payment_details(payment_id):
     """Get PayPal payment details"""
     try:
-        payment = paypalrestsdk.Payment.find(payment_id)
-        return payment
-    except Exception as e:
-        logger.error(f"Error fetching PayPal payment details: {str(e)}")
-        return None
\ No newline at end of file
+        return await get_client().request('GET', f'/v1/payments/payment/{payment_id}')
+    except (PayPalError, httpx.HTTPError) as e:
+        logger.error(f"Error fetching PayPal payment details: {e!r}")
+        return None
+
+# Webhook transmission headers, lower-cased, and their field names in
+# PayPal's verification request
+SIGNATURE_HEADERS = {
+    'paypal-auth-algo': 'auth_algo',
+    'paypal-cert-url': 'cert_url',
+    'paypal-transmission-id': 'transmission_id',
+    'paypal-transmission-sig': 'transmission_sig',
+    'paypal-transmission-time': 'transmission_time',
+}
+
+
+async def verify_webhook_signature(headers, event):
+    """Whether PayPal confirms a webhook event was sent by it to PAYPAL_WEBHOOK_ID"""
+    body = {field: headers.get(header, '') for header, field in SIGNATURE_HEADERS.items()}
+    body.update(webhook_id=settings.PAYPAL_WEBHOOK_ID, webhook_event=event)
+    try:
+        result = await get_client().request('POST', '/v1/notifications/verify-webhook-signature', json=body)
+    except (PayPalError, httpx.HTTPError) as e:
+        logger.error(f"PayPal webhook verification error: {e!r}")
+        return None
+    return result.get('verification_status') == 'SUCCESS'
\ No newline at end of file
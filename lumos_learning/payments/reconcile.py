@@ -0,0 +1,191 @@
+"""
+Reconciling payments with PayPal.
+
+run() walks PayPal payments that are still pending (older than
+RECONCILE_PENDING_AGE) or completed within the lookback window, in
+primary-key chunks. It looks each one up through the shared async client
+(paypal_integration) with at most `workers` requests in flight and at
+most `rate` started per second, then applies the status changes of a
+chunk in bulk.
+
+- Approved payments whose return redirect never arrived are executed.
+- Approvals abandoned for longer than PayPal keeps them open are failed.
+- Anything else that disagrees but is not a safe transition is only
+  reported.
+"""
+import asyncio
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import transitions
+from .models import Payment
+from .paypal_integration import execute_paypal_payment, get_paypal_payment_details
+
+# PayPal expires unapproved v1 payments after three hours
+ABANDON_AFTER = timedelta(hours=3)
+
+
+@dataclass
+class Discrepancy:
+    payment_id: str
+    ours: str
+    gateway: str
+    action: str
+
+
+class RateLimiter:
+    """Spaces request starts at least 1/rate seconds apart"""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self.next_start = 0
+        self.lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        async with self.lock:
+            now = time.monotonic()
+            delay = self.next_start - now
+            self.next_start = max(now, self.next_start) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def gateway_state(resource):
+    """'payment state/sale state' as PayPal reports it"""
+    sales = [
+        related['sale']
+        for transaction_ in resource.get('transactions', [])
+        for related in transaction_.get('related_resources', [])
+        if 'sale' in related
+    ]
+    return resource.get('state', ''), (sales[-1].get('state', '') if sales else '')
+
+
+def gateway_status(resource, created_at, now):
+    """The status PayPal's view of a payment maps to, or None if it's still open"""
+    state, sale_state = gateway_state(resource)
+    if sale_state in ('refunded', 'reversed'):
+        return 'refunded'
+    if sale_state == 'denied' or state in ('failed', 'expired', 'canceled'):
+        return 'failed'
+    if sale_state == 'completed':
+        return 'completed'
+    if state == 'created' and not _payer_id(resource) and now - created_at > ABANDON_AFTER:
+        return 'failed'
+    return None
+
+
+def _payer_id(resource):
+    return ((resource.get('payer') or {}).get('payer_info') or {}).get('payer_id')
+
+
+def candidates(lookback, pending_age, now=None):
+    now = now or timezone.now()
+    return Payment.objects.filter(
+        Q(status='pending', created_at__lte=now - pending_age)
+        | Q(status='completed', completed_at__gte=now - lookback),
+        payment_method='paypal',
+    ).exclude(paypal_payment_id='')
+
+
+def _chunks(queryset, chunk_size):
+    last = None
+    while True:
+        chunk = queryset.order_by('pk')
+        if last is not None:
+            chunk = chunk.filter(pk__gt=last)
+        chunk = list(chunk.values('pk', 'paypal_payment_id', 'status', 'created_at')[:chunk_size])
+        if not chunk:
+            return
+        yield chunk
+        last = chunk[-1]['pk']
+
+
+async def _check(payment, limiter, slots, now, dry_run):
+    """(new status or None, gateway state, action) for one payment"""
+    async with slots:
+        await limiter.wait()
+        resource = await get_paypal_payment_details(payment['paypal_payment_id'])
+        if resource is None:
+            return None, 'unknown', 'reported'
+
+        state = '/'.join(filter(None, gateway_state(resource)))
+        if payment['status'] == 'pending' and resource.get('state') == 'created' and _payer_id(resource):
+            # The buyer approved but never came back to payment_success
+            if dry_run:
+                return None, state, 'execute'
+            await limiter.wait()
+            if await execute_paypal_payment(payment['paypal_payment_id'], _payer_id(resource)):
+                return 'completed', state, 'executed'
+            return None, state, 'reported'
+
+        status = gateway_status(resource, payment['created_at'], now)
+        if status is None or status == payment['status']:
+            return None, state, None
+        if transitions.can_transition(payment['status'], status):
+            return status, state, status
+        return None, state, 'reported'
+
+
+def _apply(changes, dry_run):
+    """changes: [(payment row, new status, gateway state)]"""
+    if dry_run or not changes:
+        return
+    by_transition = defaultdict(dict)
+    for payment, status, state in changes:
+        by_transition[payment['status'], status][payment['pk']] = f'Reconciled with PayPal ({state})'
+    with transaction.atomic():
+        for (old, status), notes in by_transition.items():
+            # Skip rows that changed while PayPal was being asked
+            transitions.bulk_transition(list(notes), status, notes, from_statuses=[old])
+
+
+async def _run(queryset, workers, rate, chunk_size, dry_run, report):
+    limiter = RateLimiter(rate)
+    slots = asyncio.Semaphore(workers)
+    totals = Counter()
+    chunks = _chunks(queryset, chunk_size)
+    next_chunk = sync_to_async(lambda: next(chunks, None))
+    while (chunk := await next_chunk()) is not None:
+        now = timezone.now()
+        results = await asyncio.gather(*(_check(payment, limiter, slots, now, dry_run) for payment in chunk))
+        changes = []
+        for payment, (status, state, action) in zip(chunk, results):
+            totals['checked'] += 1
+            if action is None:
+                continue
+            totals[action] += 1
+            report(Discrepancy(str(payment['pk']), payment['status'], state, action))
+            if status:
+                changes.append((payment, status, state))
+        await sync_to_async(_apply)(changes, dry_run)
+    return totals
+
+
+def run(workers=None, rate=None, chunk_size=500, lookback_days=None, dry_run=False, report=None):
+    """
+    Reconcile candidate payments. report(Discrepancy) is called for each
+    payment that disagrees with PayPal. Returns counts per action.
+    """
+    queryset = candidates(
+        timedelta(days=lookback_days if lookback_days is not None else settings.RECONCILE_LOOKBACK_DAYS),
+        timedelta(minutes=settings.RECONCILE_PENDING_AGE),
+    )
+    return asyncio.run(_run(
+        queryset,
+        workers or settings.RECONCILE_WORKERS,
+        settings.RECONCILE_RATE if rate is None else rate,
+        chunk_size,
+        dry_run,
+        report or (lambda discrepancy: None),
+    ))
\ No newline at end of file
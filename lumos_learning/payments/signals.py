@@ -0,0 +1,49 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from core import stats
+from courses import entitlements
+
+from .models import Payment, Refund
+
+
+def _revenue_state(payment):
+    """(status, amount, instructor_id) as core.stats expects it"""
+    instructor_id = None
+    if payment.status == 'completed' and payment.course_id:
+        instructor_id = payment.course.instructor_id
+    return (payment.status, payment.amount, instructor_id)
+
+
+@receiver(pre_save, sender=Payment)
+def payment_saving(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    if instance.status == 'completed' and not instance.completed_at:
+        instance.completed_at = timezone.now()
+    instance._revenue_before = None if instance._state.adding else (
+        Payment.objects.filter(pk=instance.pk)
+        .values_list('status', 'amount', 'course__instructor_id')
+        .first()
+    )
+
+
+@receiver(post_save, sender=Payment)
+def payment_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    entitlements.invalidate(instance.user_id)
+    stats.payment_changed(getattr(instance, '_revenue_before', None), _revenue_state(instance))
+
+
+@receiver(post_delete, sender=Payment)
+def payment_deleted(sender, instance, **kwargs):
+    entitlements.invalidate(instance.user_id)
+    stats.payment_changed(_revenue_state(instance), None)
+
+
+@receiver(pre_save, sender=Refund)
+def refund_saving(sender, instance, raw=False, **kwargs):
+    if not raw and instance.status == 'processed' and not instance.processed_at:
+        instance.processed_at = timezone.now()
\ No newline at end of file
@@ -0,0 +1,14 @@
+from celery import shared_task
+
+from . import reconcile, webhooks
+
+
+@shared_task(ignore_result=True)
+def drain_webhooks():
+    """Apply pending PayPal webhook events"""
+    return webhooks.drain()
+
+@shared_task(ignore_result=True)
+def reconcile_payments():
+    """Recheck pending and recently completed payments with PayPal"""
+    return dict(reconcile.run())
\ No newline at end of file
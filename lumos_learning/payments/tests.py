@@ -0,0 +1,293 @@
+import json
+from datetime import timedelta
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from core import bulk_actions
+from core.models import User
+from courses.models import Category, Course
+
+from . import reconcile, transitions, webhooks
+from .models import Payment, PaymentHistory, WebhookEvent
+
+
+def sale_event(event_id, paypal_id, total='10.00', event_type='PAYMENT.SALE.COMPLETED'):
+    return json.dumps({
+        'id': event_id,
+        'event_type': event_type,
+        'resource': {'parent_payment': paypal_id, 'amount': {'total': total, 'currency': 'USD'}},
+    })
+
+
+class PaymentTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = User.objects.create_user('teacher', role='teacher')
+        cls.student = User.objects.create_user('student', role='student')
+        category = Category.objects.create(name='Programming', slug='programming')
+        cls.course = Course.objects.create(
+            title='Python', slug='python', description='Python', category=category,
+            instructor=cls.teacher, is_published=True, price=10,
+        )
+
+    def create_payment(self, paypal_id='PAY-1', **kwargs):
+        return Payment.objects.create(
+            user=self.student, course=self.course, amount='10.00',
+            payment_method='paypal', paypal_payment_id=paypal_id, **kwargs
+        )
+
+
+class WebhookTests(PaymentTestCase):
+    def post(self, body):
+        return self.client.post('/payments/webhook/paypal/', body, content_type='application/json')
+
+    def test_redelivery_is_stored_once(self):
+        self.assertEqual(self.post(sale_event('WH-1', 'PAY-1')).status_code, 200)
+        self.assertEqual(self.post(sale_event('WH-1', 'PAY-1')).status_code, 200)
+        self.assertEqual(WebhookEvent.objects.count(), 1)
+
+    def test_invalid_body_is_refused(self):
+        self.assertEqual(self.post('not json').status_code, 400)
+        self.assertFalse(WebhookEvent.objects.exists())
+
+    @override_settings(PAYPAL_WEBHOOK_ID='')
+    def test_unsigned_event_is_not_applied_without_webhook_id(self):
+        payment = self.create_payment()
+        self.post(sale_event('WH-1', 'PAY-1'))
+
+        self.assertEqual(webhooks.drain(), 0)
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, 'pending')
+        self.assertEqual(WebhookEvent.objects.get().status, 'pending')
+
+    @override_settings(PAYPAL_WEBHOOK_ID='WH-ID')
+    def test_forged_event_is_rejected(self):
+        payment = self.create_payment()
+        self.post(sale_event('WH-1', 'PAY-1'))
+
+        with mock.patch.object(webhooks, 'verify_webhook_signature', mock.AsyncMock(return_value=False)):
+            webhooks.drain()
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, 'pending')
+        self.assertEqual(WebhookEvent.objects.get().status, 'rejected')
+
+    @override_settings(PAYPAL_WEBHOOK_ID='WH-ID')
+    def test_unanswered_verification_stays_pending(self):
+        self.create_payment()
+        self.post(sale_event('WH-1', 'PAY-1'))
+
+        with mock.patch.object(webhooks, 'verify_webhook_signature', mock.AsyncMock(return_value=None)):
+            self.assertEqual(webhooks.drain(), 0)
+        self.assertEqual(WebhookEvent.objects.get().status, 'pending')
+
+    @override_settings(PAYPAL_WEBHOOK_ID='WH-ID')
+    def test_verified_events_apply_in_order(self):
+        paid = self.create_payment('PAY-1')
+        refunded = self.create_payment('PAY-2')
+        short = self.create_payment('PAY-3')
+        self.post(sale_event('WH-1', 'PAY-1'))
+        self.post(sale_event('WH-2', 'PAY-2'))
+        self.post(sale_event('WH-3', 'PAY-2', event_type='PAYMENT.SALE.REFUNDED'))
+        self.post(sale_event('WH-4', 'PAY-3', total='1.00'))
+        self.post(json.dumps({'id': 'WH-5', 'event_type': 'BILLING.PLAN.CREATED'}))
+
+        with mock.patch.object(webhooks, 'verify_webhook_signature', mock.AsyncMock(return_value=True)):
+            self.assertEqual(webhooks.drain(), 5)
+        for payment in (paid, refunded, short):
+            payment.refresh_from_db()
+        self.assertEqual(paid.status, 'completed')
+        self.assertIsNotNone(paid.completed_at)
+        self.assertEqual(refunded.status, 'refunded')
+        self.assertEqual(list(refunded.history.order_by('id').values_list('status', flat=True)), ['completed', 'refunded'])
+        self.assertEqual(short.status, 'pending')
+        self.assertEqual(
+            dict(WebhookEvent.objects.values_list('event_id', 'status')),
+            {'WH-1': 'processed', 'WH-2': 'processed', 'WH-3': 'processed', 'WH-4': 'rejected', 'WH-5': 'ignored'},
+        )
+
+
+# The pages use static files the manifest only lists after collectstatic
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class PaymentHistoryTests(PaymentTestCase):
+    def test_cursor_links_walk_every_payment(self):
+        created = {str(self.create_payment(f'PAY-{i}').pk) for i in range(45)}
+        self.client.force_login(self.student)
+
+        seen, pages, query = [], 0, ''
+        while query is not None:
+            response = self.client.get(f'/payments/history/?{query}')
+            self.assertEqual(response.status_code, 200)
+            seen += [str(payment.pk) for payment in response.context['payments']]
+            pages += 1
+            query = response.context.get('next_query')
+        self.assertEqual(pages, 3)
+        self.assertEqual(len(seen), 45)
+        self.assertEqual(set(seen), created)
+        self.assertContains(response, 'Previous')
+
+        previous = self.client.get(f'/payments/history/?{response.context["previous_query"]}')
+        self.assertEqual([str(payment.pk) for payment in previous.context['payments']], seen[20:40])
+
+
+class TransitionTests(PaymentTestCase):
+    def test_allowed_moves(self):
+        self.assertTrue(transitions.can_transition('pending', 'completed'))
+        self.assertTrue(transitions.can_transition('failed', 'completed'))
+        self.assertTrue(transitions.can_transition('completed', 'refunded'))
+        self.assertFalse(transitions.can_transition('completed', 'pending'))
+        self.assertFalse(transitions.can_transition('refunded', 'completed'))
+        self.assertEqual(sorted(transitions.sources('completed')), ['failed', 'pending'])
+
+    def test_transition_records_history(self):
+        payment = self.create_payment()
+        transitions.transition(payment, 'completed', 'Paid')
+
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, 'completed')
+        self.assertIsNotNone(payment.completed_at)
+        self.assertEqual(list(payment.history.values_list('status', 'notes')), [('completed', 'Paid')])
+
+    def test_illegal_transition_is_refused(self):
+        payment = self.create_payment(status='refunded')
+        with self.assertRaises(transitions.InvalidTransition):
+            transitions.transition(payment, 'completed')
+        self.assertEqual(payment.status, 'refunded')
+        self.assertFalse(PaymentHistory.objects.exists())
+
+    def test_bulk_transition_moves_only_legal_rows(self):
+        pending = self.create_payment('PAY-1')
+        refunded = self.create_payment('PAY-2', status='refunded')
+        moved = transitions.bulk_transition(Payment.objects.all(), 'completed', {pending.pk: 'Webhook'})
+
+        self.assertEqual(moved, [pending.pk])
+        refunded.refresh_from_db()
+        self.assertEqual(refunded.status, 'refunded')
+        self.assertEqual(PaymentHistory.objects.get().notes, 'Webhook')
+
+
+def gateway_payment(state, sale_state=None, payer_id=None):
+    resource = {'state': state, 'transactions': []}
+    if sale_state:
+        resource['transactions'].append({'related_resources': [{'sale': {'state': sale_state}}]})
+    if payer_id:
+        resource['payer'] = {'payer_info': {'payer_id': payer_id}}
+    return resource
+
+
+# run() does its database work in asgiref's thread, outside a test transaction
+class ReconcileTests(TransactionTestCase):
+    create_payment = PaymentTestCase.create_payment
+
+    def setUp(self):
+        self.student = User.objects.create_user('student', role='student')
+        teacher = User.objects.create_user('teacher', role='teacher')
+        category = Category.objects.create(name='Programming', slug='programming')
+        self.course = Course.objects.create(
+            title='Python', slug='python', description='Python', category=category,
+            instructor=teacher, is_published=True, price=10,
+        )
+        hours_ago = timezone.now() - timedelta(hours=4)
+        self.approved = self.create_payment('PAY-1')
+        self.abandoned = self.create_payment('PAY-2')
+        self.refunded = self.create_payment('PAY-3', status='completed', completed_at=timezone.now())
+        self.disputed = self.create_payment('PAY-4', status='completed', completed_at=timezone.now())
+        self.recent = self.create_payment('PAY-5')
+        Payment.objects.exclude(pk=self.recent.pk).update(created_at=hours_ago)
+        self.gateway = {
+            'PAY-1': gateway_payment('created', payer_id='BUYER'),
+            'PAY-2': gateway_payment('created'),
+            'PAY-3': gateway_payment('approved', 'refunded'),
+            'PAY-4': gateway_payment('failed'),
+        }
+
+    def run_reconcile(self, **kwargs):
+        found = []
+
+        async def details(paypal_id):
+            return self.gateway.get(paypal_id)
+
+        with mock.patch.object(reconcile, 'get_paypal_payment_details', details), \
+                mock.patch.object(reconcile, 'execute_paypal_payment', mock.AsyncMock(return_value=True)) as execute:
+            totals = reconcile.run(workers=2, rate=0, chunk_size=2, report=found.append, **kwargs)
+        return totals, {discrepancy.payment_id: discrepancy.action for discrepancy in found}, execute
+
+    def statuses(self):
+        return dict(Payment.objects.values_list('paypal_payment_id', 'status'))
+
+    def test_safe_changes_are_applied(self):
+        totals, found, execute = self.run_reconcile()
+
+        execute.assert_awaited_once_with('PAY-1', 'BUYER')
+        self.assertEqual(totals['checked'], 4)
+        self.assertEqual(found, {
+            str(self.approved.pk): 'executed', str(self.abandoned.pk): 'failed',
+            str(self.refunded.pk): 'refunded', str(self.disputed.pk): 'reported',
+        })
+        self.assertEqual(self.statuses(), {
+            'PAY-1': 'completed', 'PAY-2': 'failed', 'PAY-3': 'refunded', 'PAY-4': 'completed', 'PAY-5': 'pending',
+        })
+        self.assertEqual(PaymentHistory.objects.filter(payment=self.refunded).get().notes, 'Reconciled with PayPal (approved/refunded)')
+
+    def test_dry_run_changes_nothing(self):
+        before = self.statuses()
+        totals, found, execute = self.run_reconcile(dry_run=True)
+
+        execute.assert_not_awaited()
+        self.assertEqual(found[str(self.approved.pk)], 'execute')
+        self.assertEqual(self.statuses(), before)
+        self.assertFalse(PaymentHistory.objects.exists())
+
+
+# The pages use static files the manifest only lists after collectstatic
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+class PaymentAdminTests(PaymentTestCase):
+    url = '/admin/payments/payment/'
+
+    def setUp(self):
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'secret')
+        self.client.force_login(admin)
+
+    def changelist_queries(self):
+        with CaptureQueriesContext(connection) as captured:
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+        return len(captured)
+
+    def mark_completed(self, payments):
+        return self.client.post(self.url, {
+            'action': 'mark_completed', '_selected_action': [payment.pk for payment in payments],
+        })
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        self.create_payment('PAY-0')
+        few = self.changelist_queries()
+        for i in range(1, 20):
+            self.create_payment(f'PAY-{i}')
+        self.assertEqual(self.changelist_queries(), few)
+
+    def test_small_selection_runs_in_the_request(self):
+        pending = self.create_payment('PAY-1')
+        refunded = self.create_payment('PAY-2', status='refunded')
+        response = self.mark_completed([pending, refunded])
+        self.assertEqual(response.status_code, 302)
+
+        self.assertEqual(dict(Payment.objects.values_list('pk', 'status')), {pending.pk: 'completed', refunded.pk: 'refunded'})
+        self.assertTrue(PaymentHistory.objects.get().notes.startswith('Marked completed by admin'))
+
+    @override_settings(ADMIN_BACKGROUND_THRESHOLD=2, ADMIN_BACKGROUND_CHUNK=2)
+    def test_large_selection_is_queued_in_chunks(self):
+        payments = [self.create_payment(f'PAY-{i}') for i in range(3)]
+        with mock.patch.object(bulk_actions, '_executor') as executor:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.mark_completed(payments)
+        self.assertFalse(Payment.objects.filter(status='completed').exists())
+
+        run, job, chunks, args = executor.submit.call_args.args
+        pks = sorted(str(payment.pk) for payment in payments)
+        self.assertEqual(chunks, [pks[:2], pks[2:]])
+        with mock.patch.object(bulk_actions.connection, 'close'):
+            run(job, chunks, args)
+        self.assertEqual(Payment.objects.filter(status='completed').count(), 3)
\ No newline at end of file
@@ -0,0 +1,106 @@
+"""
+Payment state machine.
+
+Payment statuses only move along TRANSITIONS. bulk_transition() moves any
+number of payments in one transaction and a fixed number of queries:
+
+- It locks the rows that may still make the move.
+- It adjusts core.stats for them.
+- It updates them with one UPDATE.
+- It writes their PaymentHistory with one bulk insert.
+
+Entitlements of the affected users are invalidated on commit. The payment
+views, the webhook inbox, reconciliation and the admin actions all go
+through it, so every status change leaves a history row.
+"""
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.functions import Coalesce, Now
+from django.utils import timezone
+
+from core import stats
+from courses import entitlements
+
+from .models import Payment, PaymentHistory
+
+# status: statuses it may move to
+TRANSITIONS = {
+    'pending': ('completed', 'failed'),
+    'failed': ('completed',),
+    'completed': ('refunded',),
+    'refunded': (),
+}
+
+
+class InvalidTransition(Exception):
+    pass
+
+
+def can_transition(old, new):
+    return new in TRANSITIONS.get(old, ())
+
+
+def sources(status):
+    """Statuses a payment may move to status from"""
+    return [old for old, targets in TRANSITIONS.items() if status in targets]
+
+
+def bulk_transition(payments, status, notes='', from_statuses=None):
+    """
+    Move payments (a queryset or primary keys) that may legally go to
+    status, leaving the rest alone. notes is a string or {pk: notes}.
+    from_statuses narrows the statuses moved from, e.g. to skip rows that
+    changed since they were read. Returns the primary keys moved.
+    """
+    if status not in TRANSITIONS:
+        raise InvalidTransition(f'Unknown payment status {status!r}')
+    allowed = sources(status)
+    if from_statuses is not None:
+        allowed = [old for old in allowed if old in from_statuses]
+    if isinstance(payments, QuerySet):
+        # Admin querysets may be distinct or joined, which can't be locked
+        payments = Payment.objects.filter(pk__in=payments.values('pk'))
+    else:
+        payments = Payment.objects.filter(pk__in=list(payments))
+
+    with transaction.atomic():
+        rows = list(
+            payments.filter(status__in=allowed)
+            .select_for_update(of=('self',))
+            .order_by('pk')
+            .values_list('pk', 'user_id', 'status', 'amount', 'course__instructor_id')
+        )
+        if not rows:
+            return []
+        ids = [row[0] for row in rows]
+        stats.payments_moved([row[2:] for row in rows], status)
+
+        changes = {'status': status, 'updated_at': timezone.now()}
+        if status == 'completed':
+            changes['completed_at'] = Coalesce('completed_at', Now())
+        Payment.objects.filter(pk__in=ids).update(**changes)
+        PaymentHistory.objects.bulk_create([
+            PaymentHistory(
+                payment_id=pk,
+                status=status,
+                notes=notes.get(pk, '') if isinstance(notes, dict) else notes,
+            )
+            for pk in ids
+        ])
+        entitlements.invalidate(*{row[1] for row in rows})
+    return ids
+
+
+def transition(payment, status, notes=''):
+    """
+    Move one payment to status and update the instance. Raises
+    InvalidTransition, with payment.status set to the stored status, if
+    it may not make the move.
+    """
+    if not bulk_transition([payment.pk], status, notes):
+        payment.status = Payment.objects.filter(pk=payment.pk).values_list('status', flat=True).first()
+        raise InvalidTransition(f'Payment {payment.pk} cannot move from {payment.status} to {status}')
+    payment.status = status
+    if status == 'completed' and not payment.completed_at:
+        payment.completed_at = timezone.now()
+    return payment
\ No newline at end of file
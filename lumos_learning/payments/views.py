@@ -1,15 +1,19 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import JsonResponse
+from django.contrib.auth.views import redirect_to_login
+from django.http import Http404, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from django.views.generic import TemplateView
 from django.conf import settings
 from courses.models import Course, Material
+from core.pagination import KeysetPaginator, cursor_query
+from . import transitions, webhooks
 from .models import Payment, PaymentHistory
 from .paypal_integration import create_paypal_payment, execute_paypal_payment
-import json
+from asgiref.sync import sync_to_async
+from functools import wraps
 
 
 @login_required
@@ -39,9 +43,31 @@ def checkout(request, item_type, item_id):
     return render(request, 'payments/checkout.html', context)
 
 
-@login_required
-def create_payment(request):
-    """Create a payment record and initiate payment process"""
+def async_login_required(view):
+    """login_required for async views; resolves request.user off the event loop"""
+    @wraps(view)
+    async def wrapped(request, *args, **kwargs):
+        is_authenticated = await sync_to_async(lambda: request.user.is_authenticated)()
+        if not is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        return await view(request, *args, **kwargs)
+    return wrapped
+
+
+async def _transition(payment, status, notes):
+    """Apply a transition; payment keeps the status it already reached if it can't move"""
+    try:
+        await sync_to_async(transitions.transition)(payment, status, notes)
+    except transitions.InvalidTransition:
+        pass
+
+
+@async_login_required
+async def create_payment(request):
+    """
+    Create a payment record and initiate payment process. Async so the
+    PayPal round trip doesn't hold a worker (see paypal_integration).
+    """
     if request.method == 'POST':
         item_type = request.POST.get('item_type')
         item_id = request.POST.get('item_id')
@@ -49,18 +75,22 @@ def create_payment(request):
         
         # Get the item
         if item_type == 'course':
-            course = get_object_or_404(Course, id=item_id)
+            course = await Course.objects.filter(id=item_id).afirst()
+            if course is None:
+                raise Http404('No course matches the given query.')
             material = None
             amount = course.price
         elif item_type == 'material':
-            material = get_object_or_404(Material, id=item_id)
+            material = await Material.objects.select_related('course').filter(id=item_id).afirst()
+            if material is None:
+                raise Http404('No material matches the given query.')
             course = None
             amount = material.price
         else:
             return JsonResponse({'success': False, 'error': 'Invalid item type'})
         
         # Create payment record
-        payment = Payment.objects.create(
+        payment = await Payment.objects.acreate(
             user=request.user,
             course=course,
             material=material,
@@ -70,28 +100,23 @@ def create_payment(request):
         )
         
         # Create payment history entry
-        PaymentHistory.objects.create(
+        await PaymentHistory.objects.acreate(
             payment=payment,
             status='pending',
             notes='Payment initiated'
         )
         
         if payment_method == 'paypal':
-            approval_url = create_paypal_payment(payment, request)
+            approval_url = await create_paypal_payment(payment, request)
             if approval_url:
+                await payment.asave(update_fields=['paypal_payment_id', 'updated_at'])
                 return JsonResponse({
                     'success': True,
                     'approval_url': approval_url,
                     'payment_id': str(payment.id)
                 })
             else:
-                payment.status = 'failed'
-                payment.save()
-                PaymentHistory.objects.create(
-                    payment=payment,
-                    status='failed',
-                    notes='PayPal payment creation failed'
-                )
+                await _transition(payment, 'failed', 'PayPal payment creation failed')
                 return JsonResponse({'success': False, 'error': 'Payment creation failed'})
         
         elif payment_method == 'intersend':
@@ -104,23 +129,24 @@ def create_payment(request):
     return JsonResponse({'success': False, 'error': 'Invalid request method'})
 
 
-@login_required
-def payment_success(request, payment_id):
+@async_login_required
+async def payment_success(request, payment_id):
     """Handle successful payment return from PayPal"""
-    payment = get_object_or_404(Payment, id=payment_id, user=request.user)
+    payment = await Payment.objects.select_related('course', 'material__course').filter(
+        id=payment_id, user=request.user
+    ).afirst()
+    if payment is None:
+        raise Http404('No payment matches the given query.')
     
     payer_id = request.GET.get('PayerID')
     if payer_id and payment.paypal_payment_id:
-        if execute_paypal_payment(payment.paypal_payment_id, payer_id):
-            payment.status = 'completed'
-            payment.save()
-            
-            PaymentHistory.objects.create(
-                payment=payment,
-                status='completed',
-                notes='Payment completed successfully'
-            )
-            
+        if await execute_paypal_payment(payment.paypal_payment_id, payer_id):
+            await _transition(payment, 'completed', 'Payment completed successfully')
+        else:
+            await _transition(payment, 'failed', 'PayPal payment execution failed')
+        
+        # A webhook or reconciliation may have settled the payment first
+        if payment.status == 'completed':
             messages.success(request, 'Payment completed successfully!')
             
             # Redirect to appropriate content
@@ -132,18 +158,9 @@ def payment_success(request, payment_id):
                 elif payment.material.material_type == 'video':
                     return redirect('video_player', material_id=payment.material.id)
         else:
-            payment.status = 'failed'
-            payment.save()
-            
-            PaymentHistory.objects.create(
-                payment=payment,
-                status='failed',
-                notes='PayPal payment execution failed'
-            )
-            
             messages.error(request, 'Payment execution failed.')
     
-    return render(request, 'payments/payment_success.html', {'payment': payment})
+    return await sync_to_async(render)(request, 'payments/payment_success.html', {'payment': payment})
 
 
 @login_required
@@ -151,48 +168,43 @@ def payment_cancel(request, payment_id):
     """Handle cancelled payment"""
     payment = get_object_or_404(Payment, id=payment_id, user=request.user)
     
-    payment.status = 'failed'
-    payment.save()
-    
-    PaymentHistory.objects.create(
-        payment=payment,
-        status='failed',
-        notes='Payment cancelled by user'
-    )
+    try:
+        transitions.transition(payment, 'failed', 'Payment cancelled by user')
+        messages.warning(request, 'Payment was cancelled.')
+    except transitions.InvalidTransition:
+        messages.info(request, f'This payment is already {payment.get_status_display().lower()}.')
     
-    messages.warning(request, 'Payment was cancelled.')
     return render(request, 'payments/payment_cancel.html', {'payment': payment})
 
 
 @login_required
 def payment_history(request):
     """Display user's payment history"""
-    payments = Payment.objects.filter(user=request.user).order_by('-created_at')
+    payments = Payment.objects.filter(user=request.user).select_related('course', 'material__course')
+    page = KeysetPaginator(payments, per_page=20).page(request.GET.get('cursor'))
     
     context = {
-        'payments': payments
+        'payments': page,
+        'page_obj': page,
+        'first_query': cursor_query(request.GET, None),
     }
+    if page.has_next:
+        context['next_query'] = cursor_query(request.GET, page.next_cursor)
+    if page.has_previous:
+        context['previous_query'] = cursor_query(request.GET, page.previous_cursor)
     
     return render(request, 'payments/payment_history.html', context)
 
 
 @csrf_exempt
 def paypal_webhook(request):
-    """Handle PayPal webhook notifications"""
+    """
+    Store a PayPal webhook notification and acknowledge it; the inbox is
+    processed in the background (see payments.webhooks)
+    """
     if request.method == 'POST':
-        try:
-            data = json.loads(request.body)
-            event_type = data.get('event_type')
-            
-            if event_type == 'PAYMENT.SALE.COMPLETED':
-                # Handle completed payment
-                pass
-            elif event_type == 'PAYMENT.SALE.DENIED':
-                # Handle denied payment
-                pass
-            
+        if webhooks.receive(request.body, request.headers):
             return JsonResponse({'status': 'success'})
-        except Exception as e:
-            return JsonResponse({'status': 'error', 'message': str(e)})
+        return JsonResponse({'status': 'error', 'message': 'Invalid event'}, status=400)
     
     return JsonResponse({'status': 'error', 'message': 'Invalid request method'})
\ No newline at end of file
@@ -0,0 +1,289 @@
+"""
+PayPal webhook inbox.
+
+paypal_webhook stores each delivery as a WebhookEvent and answers at once.
+Event ids are unique, so PayPal's redeliveries and replayed captures are
+dropped on insert. drain() then processes pending events in batches:
+
+- It checks every signature with PayPal, outside the transaction that
+  locks the batch. Without PAYPAL_WEBHOOK_ID nothing can be checked, so
+  events stay pending and payments are settled by reconciliation instead.
+- It walks each payment's events in arrival order.
+- It applies the resulting status changes through
+  payments.transitions, one bulk transition per target status.
+
+Receipt-to-processing lag is added up in core.counters; see lag_stats().
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal, InvalidOperation
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Min
+from django.utils import timezone
+
+from core import counters
+
+from . import transitions
+from .models import Payment, WebhookEvent
+from .paypal_integration import SIGNATURE_HEADERS, verify_webhook_signature
+
+logger = logging.getLogger(__name__)
+
+# event type: new payment status
+EVENT_STATUS = {
+    'PAYMENT.SALE.COMPLETED': 'completed',
+    'PAYMENT.SALE.DENIED': 'failed',
+    'PAYMENT.SALE.REFUNDED': 'refunded',
+    'PAYMENT.SALE.REVERSED': 'refunded',
+}
+
+PROCESSED_COUNTER = 'webhooks:processed'
+LAG_COUNTER = 'webhooks:lag_ms'
+STORE_CHUNK = 1000
+
+
+def _event(body, headers):
+    """An unsaved WebhookEvent for a delivery, or None if it isn't a JSON event"""
+    if isinstance(body, bytes):
+        body = body.decode('utf-8', 'replace')
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    return WebhookEvent(
+        event_id=str(data.get('id') or hashlib.sha256(body.encode()).hexdigest())[:100],
+        event_type=str(data.get('event_type', ''))[:100],
+        payload=body,
+        headers={name: headers[name] for name in SIGNATURE_HEADERS if headers.get(name)},
+    )
+
+
+def receive(body, headers):
+    """Store one delivery and schedule a drain. False if the body is not an event."""
+    event = _event(body, headers)
+    if event is None:
+        return False
+    WebhookEvent.objects.bulk_create([event], ignore_conflicts=True)
+    schedule_drain()
+    return True
+
+
+def store(deliveries):
+    """Store [(body, headers)] in bulk, e.g. a replayed capture. Returns (stored, invalid)."""
+    events, invalid = [], 0
+    for body, headers in deliveries:
+        event = _event(body, {name.lower(): value for name, value in headers.items()})
+        if event is None:
+            invalid += 1
+        else:
+            events.append(event)
+    for start in range(0, len(events), STORE_CHUNK):
+        WebhookEvent.objects.bulk_create(events[start:start + STORE_CHUNK], ignore_conflicts=True)
+    return len(events), invalid
+
+
+async def _verify_all(events):
+    return await asyncio.gather(*(
+        verify_webhook_signature(event.headers, data) for event, data in events
+    ))
+
+
+def _parse(event):
+    """The event's JSON, or None if it is not a status event or unreadable"""
+    if event.event_type not in EVENT_STATUS:
+        return None
+    try:
+        data = json.loads(event.payload)
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def verify(events):
+    """{event pk: True, False or None if PayPal could not say} for status events"""
+    if not settings.PAYPAL_WEBHOOK_ID:
+        return {}
+    parsed = []
+    for event in events:
+        data = _parse(event)
+        if data is not None:
+            parsed.append((event, data))
+    if not parsed:
+        return {}
+    results = async_to_sync(_verify_all)(parsed)
+    return {event.pk: verified for (event, _), verified in zip(parsed, results)}
+
+
+def _mark(event, status, error=''):
+    event.status = status
+    event.error = error
+
+
+def process(events, verified=None):
+    """
+    Apply a batch of pending events; call inside a transaction. verified is
+    verify()'s result; events without a confirmed signature stay pending,
+    and those PayPal disowns are rejected. Returns how many stayed pending.
+    """
+    verified = verified or {}
+    parsed = []
+    for event in events:
+        if event.event_type not in EVENT_STATUS:
+            _mark(event, 'ignored')
+            continue
+        try:
+            data = json.loads(event.payload)
+            resource = data.get('resource') or {}
+        except (ValueError, AttributeError) as e:
+            _mark(event, 'failed', f'Unreadable payload: {e}')
+            continue
+        signed = verified.get(event.pk)
+        if signed:
+            parsed.append((event, data, resource))
+        elif signed is False:
+            _mark(event, 'rejected', 'Signature verification failed')
+
+    paypal_ids = {resource.get('parent_payment') for _, _, resource in parsed} - {None}
+    payments = {
+        payment.paypal_payment_id: payment
+        for payment in Payment.objects.select_for_update().filter(paypal_payment_id__in=paypal_ids).only(
+            'id', 'paypal_payment_id', 'status', 'amount', 'currency', 'user_id'
+        )
+    }
+
+    # pk: [(status, notes)] in event order
+    steps = defaultdict(list)
+    for event, data, resource in parsed:
+        target = EVENT_STATUS[event.event_type]
+        payment = payments.get(resource.get('parent_payment'))
+        if payment is None:
+            _mark(event, 'ignored', 'Unknown payment')
+        elif not transitions.can_transition(payment.status, target):
+            # Usually the browser got there first
+            _mark(event, 'ignored', f'Payment is {payment.status}')
+        elif target == 'completed' and not _amount_matches(payment, resource):
+            _mark(event, 'rejected', 'Amount does not match the payment')
+        else:
+            payment.status = target
+            steps[payment.pk].append((target, f'PayPal webhook {event.event_type} ({event.event_id})'))
+            _mark(event, 'processed')
+
+    # Usually one step per payment; a sale and its refund in the same batch
+    # take two
+    for step in range(max(map(len, steps.values()), default=0)):
+        by_status = defaultdict(dict)
+        for pk, moves in steps.items():
+            if step < len(moves):
+                status, notes = moves[step]
+                by_status[status][pk] = notes
+        for status, notes in by_status.items():
+            transitions.bulk_transition(list(notes), status, notes)
+
+    now = timezone.now()
+    done = [event for event in events if event.status != 'pending']
+    for event in done:
+        event.processed_at = now
+    WebhookEvent.objects.bulk_update(done, ['status', 'error', 'processed_at'])
+    if done:
+        lag_ms = sum(int((now - event.received_at).total_seconds() * 1000) for event in done)
+        counters.increment_on_commit(PROCESSED_COUNTER, len(done))
+        counters.increment_on_commit(LAG_COUNTER, lag_ms)
+        logger.info('Processed %d webhook events, average lag %d ms', len(done), lag_ms // len(done))
+    return len(events) - len(done)
+
+
+def _amount_matches(payment, resource):
+    amount = resource.get('amount') or {}
+    try:
+        total = Decimal(str(amount.get('total')))
+    except InvalidOperation:
+        return False
+    return total == payment.amount and amount.get('currency', payment.currency) == payment.currency
+
+
+def drain(batch_size=None):
+    """Process pending events batch by batch. Returns how many were processed."""
+    if not settings.PAYPAL_WEBHOOK_ID:
+        logger.warning('PAYPAL_WEBHOOK_ID is not set; webhook events are left unprocessed')
+        return 0
+    batch_size = batch_size or settings.WEBHOOK_DRAIN_BATCH
+    total = 0
+    while True:
+        events = list(WebhookEvent.objects.filter(status='pending').order_by('id')[:batch_size])
+        if not events:
+            break
+        # Ask PayPal before locking anything
+        verified = verify(events)
+        with transaction.atomic():
+            locked = list(
+                WebhookEvent.objects.select_for_update(skip_locked=True)
+                .filter(pk__in=[event.pk for event in events], status='pending').order_by('id')
+            )
+            if not locked:
+                # Another worker is processing this batch
+                break
+            left = process(locked, verified)
+        total += len(locked) - left
+        if left or len(events) < batch_size:
+            # Anything left waits for PayPal to answer verification again
+            break
+    return total
+
+
+_executor = None
+_drain_queued = threading.Event()
+
+
+def _drain_in_background():
+    _drain_queued.clear()
+    try:
+        drain()
+    except Exception:
+        logger.exception('Draining the webhook inbox failed')
+    finally:
+        connection.close()
+
+
+def schedule_drain():
+    """Drain once the delivery commits, on a worker when a broker is configured"""
+    def run():
+        global _executor
+        if getattr(settings, 'CELERY_BROKER_URL', ''):
+            from .tasks import drain_webhooks
+            try:
+                drain_webhooks.delay()
+                return
+            except Exception:
+                logger.warning('Could not queue drain_webhooks', exc_info=True)
+        if _drain_queued.is_set():
+            return
+        _drain_queued.set()
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='webhooks')
+        _executor.submit(_drain_in_background)
+
+    transaction.on_commit(run)
+
+
+def lag_stats():
+    """Backlog and lag figures for the inbox"""
+    pending = WebhookEvent.objects.filter(status='pending')
+    oldest = pending.aggregate(received=Min('received_at'))['received']
+    totals = counters.get_values([PROCESSED_COUNTER, LAG_COUNTER], use_cache=False)
+    processed = totals[PROCESSED_COUNTER]
+    return {
+        'pending': pending.count(),
+        'oldest_pending_seconds': (timezone.now() - oldest).total_seconds() if oldest else 0,
+        'processed': processed,
+        'average_lag_ms': totals[LAG_COUNTER] // processed if processed else 0,
+    }
\ No newline at end of file